@@ -1,7 +1,11 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+import threading
+import time
 from dotenv import load_dotenv   # <--- IMPORTANTE
 
 # ============================================================
@@ -20,12 +24,16 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 # ENGINE CONFIGURADO PARA RENDER FREE
 # ============================================================
 
+# Admisión reparte estos cupos entre las clases de rutas que usan este pool
+POOL_SIZE = 5
+POOL_MAX_OVERFLOW = 0
+
 engine = create_engine(
     DATABASE_URL,
     pool_pre_ping=True,
     pool_recycle=180,
-    pool_size=5,
-    max_overflow=0,
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_MAX_OVERFLOW,
 )
 
 # ============================================================
@@ -34,6 +42,108 @@ engine = create_engine(
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# ============================================================
+# RÉPLICA DE LECTURA (opcional)
+# Reportes y listados pesados leen de DATABASE_READ_URL con pool propio.
+# Si no está configurada, no responde o atrasa más de
+# READ_MAX_LAG_SEGUNDOS, se usa el primario.
+# ============================================================
+
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+READ_MAX_LAG_SEGUNDOS = float(os.getenv("READ_MAX_LAG_SEGUNDOS", "5"))
+READ_CHEQUEO_SEGUNDOS = float(os.getenv("READ_CHEQUEO_SEGUNDOS", "5"))
+
+read_engine = None
+ReadSessionLocal = None
+if DATABASE_READ_URL:
+    read_engine = create_engine(
+        DATABASE_READ_URL,
+        pool_pre_ping=True,
+        pool_recycle=180,
+        pool_size=int(os.getenv("READ_POOL_SIZE", "5")),
+        max_overflow=0,
+    )
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Atraso de replay en segundos; 0 si no es standby o ya aplicó todo lo recibido
+_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+_replica_lock = threading.Lock()
+_replica_estado = {"ok": False, "lag": None, "chequeado": float("-inf")}
+
+
+def replica_disponible() -> bool:
+    """Estado de la réplica, re-chequeado cada READ_CHEQUEO_SEGUNDOS."""
+    if read_engine is None:
+        return False
+    if time.monotonic() - _replica_estado["chequeado"] < READ_CHEQUEO_SEGUNDOS:
+        return _replica_estado["ok"]
+    # Un solo hilo chequea; el resto usa el último estado conocido
+    if not _replica_lock.acquire(blocking=False):
+        return _replica_estado["ok"]
+    try:
+        try:
+            with read_engine.connect() as conn:
+                lag = float(conn.execute(_LAG_SQL).scalar())
+            ok = lag <= READ_MAX_LAG_SEGUNDOS
+        except Exception as e:
+            lag, ok = None, False
+            print(f"Réplica de lectura no disponible: {e}")
+        _replica_estado.update(ok=ok, lag=lag, chequeado=time.monotonic())
+        return ok
+    finally:
+        _replica_lock.release()
+
+
+def sesion_lectura():
+    """Sesión para consultas de solo lectura: réplica si está sana, si no el primario."""
+    if replica_disponible():
+        return ReadSessionLocal()
+    return SessionLocal()
+
+# ============================================================
+# ENGINE ASYNC (asyncpg) PARA ENDPOINTS CALIENTES
+# Tickets y citas corren en el event loop sin ocupar el threadpool.
+# Pool propio, aparte de los 5 del engine sync.
+# ============================================================
+
+def _url_asyncpg(url: str):
+    """postgres[ql][+psycopg2]://... -> postgresql+asyncpg://... (+ ssl de sslmode)."""
+    u = make_url(url.replace("postgres://", "postgresql://", 1))
+    u = u.set(drivername="postgresql+asyncpg")
+    connect_args = {}
+    sslmode = u.query.get("sslmode")
+    if sslmode:
+        # asyncpg no entiende sslmode en la URL
+        u = u.difference_update_query(["sslmode"])
+        if sslmode != "disable":
+            connect_args["ssl"] = sslmode
+    return u, connect_args
+
+
+_async_url, _async_connect_args = _url_asyncpg(os.getenv("ASYNC_DATABASE_URL") or DATABASE_URL)
+
+# Sin pool_pre_ping: bajo carga el ping por checkout era ~18% del tiempo del
+# proceso. pool_recycle cubre el corte de conexiones ociosas de Render y una
+# conexión caída invalida el pool en el primer error.
+async_engine = create_async_engine(
+    _async_url,
+    connect_args=_async_connect_args,
+    pool_recycle=180,
+    pool_size=int(os.getenv("ASYNC_POOL_SIZE", "5")),
+    max_overflow=0,
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 # ============================================================
 # BASE (NO SE MUEVE, NO SE CAMBIA)
 # ============================================================
@@ -50,3 +160,16 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    db = sesion_lectura()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
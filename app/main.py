@@ -1,6 +1,7 @@
 import app.database
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from .routers import (
     reportes,
     empresas,
@@ -17,11 +18,17 @@ from .routers import (
     encuesta,
     auth,
     stats,
+    metricas,
+    admin,
 )
 from app.database import SessionLocal
+from app.services import instrumentacion_sql, password_service, stats_service
+from app.services import metricas as metricas_service
+from app.services import admision, perfilador, version_sede
 from sqlalchemy import text
 
 app = FastAPI(debug=True)
+app.router.route_class = perfilador.RutaPerfilada   # rutas definidas en este archivo
 
 # ============================================================
 # STARTUP
@@ -61,6 +68,9 @@ def on_startup():
                 activo       BOOLEAN DEFAULT true,
                 created_at   TIMESTAMP DEFAULT NOW()
             )""",
+            # Búsqueda del contrato activo por empresa
+            """CREATE INDEX IF NOT EXISTS ix_contratos_empresa_activo_fin
+               ON contratos(empresa_id, activo, fecha_fin DESC)""",
             # Tabla contadores de uso de apps por sede
             """CREATE TABLE IF NOT EXISTS app_stats (
                 sede_id    VARCHAR NOT NULL,
@@ -83,10 +93,76 @@ def on_startup():
                 comentario  VARCHAR,
                 created_at  TIMESTAMP DEFAULT NOW()
             )""",
+            # Índices para los agregados de reportes/citas-programadas
+            "CREATE INDEX IF NOT EXISTS ix_citas_sede_fecha ON citas(sede_id, fecha)",
+            """CREATE INDEX IF NOT EXISTS ix_cal_disp_cal_fecha
+               ON calendario_disponibilidades(calendario_id, fecha)""",
+            # Índice para reportes de tickets por rango (nivel de servicio, demanda)
+            "CREATE INDEX IF NOT EXISTS ix_tickets_sede_creacion ON tickets(sede_id, hora_creacion)",
+            # Paginación keyset del detalle de tickets por servicio
+            """CREATE INDEX IF NOT EXISTS ix_tickets_servicio_creacion_id
+               ON tickets(servicio_id, hora_creacion, id)""",
+            # Reportes basados en llamados (productividad por puesto, puestos abiertos)
+            "CREATE INDEX IF NOT EXISTS ix_tickets_sede_llamado ON tickets(sede_id, hora_llamado)",
+            # Gauge tickets_pendientes de /metrics (todas las sedes, solo pendientes)
+            """CREATE INDEX IF NOT EXISTS ix_tickets_pendientes_creacion
+               ON tickets(hora_creacion) INCLUDE (sede_id, servicio_id)
+               WHERE estado = 'pendiente'""",
+            # Agregados diarios de encuestas, mantenidos por crear_respuesta
+            """CREATE TABLE IF NOT EXISTS encuesta_agregados_dia (
+                sede_id     VARCHAR NOT NULL DEFAULT '',
+                servicio_id VARCHAR NOT NULL DEFAULT '',
+                tipo        VARCHAR NOT NULL DEFAULT '',
+                dia         DATE    NOT NULL,
+                total       INTEGER NOT NULL DEFAULT 0,
+                n_p1        INTEGER NOT NULL DEFAULT 0,
+                suma_p1     BIGINT  NOT NULL DEFAULT 0,
+                n_p2        INTEGER NOT NULL DEFAULT 0,
+                suma_p2     BIGINT  NOT NULL DEFAULT 0,
+                n_p3        INTEGER NOT NULL DEFAULT 0,
+                suma_p3     BIGINT  NOT NULL DEFAULT 0,
+                PRIMARY KEY (sede_id, servicio_id, tipo, dia)
+            )""",
+            # Backfill inicial (solo si la tabla de agregados está vacía)
+            """INSERT INTO encuesta_agregados_dia
+                   (sede_id, servicio_id, tipo, dia, total,
+                    n_p1, suma_p1, n_p2, suma_p2, n_p3, suma_p3)
+               SELECT COALESCE(sede_id, ''), COALESCE(servicio_id, ''), COALESCE(tipo, ''),
+                      COALESCE(created_at, NOW())::date, COUNT(*),
+                      COUNT(p1_atencion), COALESCE(SUM(p1_atencion), 0),
+                      COUNT(p2_video),    COALESCE(SUM(p2_video), 0),
+                      COUNT(p3_general),  COALESCE(SUM(p3_general), 0)
+               FROM encuesta_respuestas
+               WHERE NOT EXISTS (SELECT 1 FROM encuesta_agregados_dia)
+               GROUP BY 1, 2, 3, 4""",
+            """CREATE INDEX IF NOT EXISTS ix_encuesta_sede_created
+               ON encuesta_respuestas(sede_id, created_at DESC)""",
+            # Búsqueda de texto completo sobre comentarios de encuestas
+            """ALTER TABLE encuesta_respuestas ADD COLUMN IF NOT EXISTS comentario_tsv tsvector
+               GENERATED ALWAYS AS (to_tsvector('spanish', COALESCE(comentario, ''))) STORED""",
+            """CREATE INDEX IF NOT EXISTS ix_encuesta_comentario_tsv
+               ON encuesta_respuestas USING GIN (comentario_tsv)""",
+            # Serie temporal de uso de apps: buckets por hora, compactados a día
+            """CREATE TABLE IF NOT EXISTS app_stats_bucket (
+                sede_id      VARCHAR   NOT NULL,
+                granularidad VARCHAR   NOT NULL,
+                inicio       TIMESTAMP NOT NULL,
+                app_type     VARCHAR   NOT NULL,
+                contador     INTEGER   NOT NULL DEFAULT 0,
+                PRIMARY KEY (sede_id, granularidad, inicio, app_type)
+            )""",
+            # Versión por sede para ETags (tabla, función y triggers)
+            *version_sede.MIGRACIONES,
         ]
+        # Un worker a la vez: el resto espera y encuentra todo ya aplicado
+        # (sin esto dos workers ven vacía encuesta_agregados_dia y el backfill choca)
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext('migraciones'))"))
         for sql in migrations:
+            # SAVEPOINT por sentencia: una que falla no aborta la transacción
+            # ni deshace las demás al hacer commit
             try:
-                db.execute(text(sql))
+                with db.begin_nested():
+                    db.execute(text(sql))
             except Exception as e:
                 print(f"Migration skipped: {e}")
         db.commit()
@@ -176,6 +252,25 @@ def on_startup():
     finally:
         db.close()
 
+    stats_service.iniciar()
+
+    # Parsear la clave privada de JaaS una sola vez
+    if jaas.JAAS_PRIVATE_KEY:
+        try:
+            jaas.obtener_clave()
+        except Exception as e:
+            print(f"JaaS private key error: {e}")
+
+
+# ============================================================
+# SHUTDOWN
+# ============================================================
+@app.on_event("shutdown")
+def on_shutdown():
+    # Volcar los contadores de /stats que quedaron en memoria
+    stats_service.detener()
+    password_service.detener()
+
 # ============================================================
 # ADMIN — resincronizar disponibilidades manualmente
 # ============================================================
@@ -252,6 +347,13 @@ def debug_columns():
     finally:
         db.close()
 
+# ============================================================
+# CONTROL DE ADMISIÓN
+# Se registra antes que CORS para que los 503 también lleven sus headers.
+# ============================================================
+if admision.ACTIVA:
+    app.add_middleware(admision.AdmisionMiddleware)
+
 # ============================================================
 # CORS
 # ============================================================
@@ -263,6 +365,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ============================================================
+# COMPRESIÓN (listas de tickets, citas y disponibilidades)
+# ============================================================
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
+
+# ============================================================
+# INSTRUMENTACIÓN SQL (SQL_INSTRUMENTACION=1)
+# ============================================================
+if instrumentacion_sql.ACTIVO:
+    instrumentacion_sql.instalar(app)
+
+# ============================================================
+# MÉTRICAS (GET /metrics)
+# ============================================================
+metricas_service.instalar(app)
+
+# ============================================================
+# PERFILADOR (X-Profile: 1 de master_admin, o PROFILER_UMBRAL_MS)
+# ============================================================
+app.add_middleware(perfilador.PerfiladorMiddleware)
+
 # ============================================================
 # ROUTERS
 # ============================================================
@@ -281,6 +404,8 @@ app.include_router(jaas.router)
 app.include_router(encuesta.router)
 app.include_router(auth.router)
 app.include_router(stats.router)
+app.include_router(metricas.router)
+app.include_router(admin.router)
 
 # ============================================================
 # ROOT
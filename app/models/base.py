@@ -1,3 +1,3 @@
-from sqlalchemy.orm import declarative_base
-
-Base = declarative_base()
+# Todos los modelos comparten la Base (y la metadata) de app.database: con una
+# base propia las ForeignKey de EncuestaRespuesta no encontraban sus tablas
+from app.database import Base  # noqa: F401
@@ -0,0 +1,15 @@
+"""
+Respuesta JSON codificada con orjson.
+
+Los endpoints con response_model ya se serializan con pydantic-core. Los
+listados grandes (tickets y citas) arman dicts con las claves, el orden y los
+valores de su schema y devuelven esta respuesta directamente: se evita validar
+miles de filas que ya salen con la forma correcta de la consulta.
+"""
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class RespuestaORJSON(JSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
@@ -0,0 +1,32 @@
+"""
+Router: /admin
+Perfiles de requests capturados por el perfilador (app/services/perfilador.py).
+Solo master_admin.
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+
+from app.services import perfilador, sesion_service
+
+router = APIRouter(prefix="/admin", tags=["admin"], route_class=perfilador.RutaPerfilada)
+
+
+def requiere_master_admin(claims: dict = Depends(sesion_service.sesion_actual)) -> dict:
+    if claims["rol"] != "master_admin":
+        raise HTTPException(status_code=403, detail="Solo disponible para master_admin")
+    return claims
+
+
+@router.get("/profiles", dependencies=[Depends(requiere_master_admin)])
+def listar_perfiles():
+    """Perfiles guardados, del más nuevo al más viejo."""
+    return perfilador.listar()
+
+
+@router.get("/profiles/{perfil_id}", dependencies=[Depends(requiere_master_admin)])
+def descargar_perfil(perfil_id: str):
+    """Stacks en formato collapsed: `flamegraph.pl archivo.folded > perfil.svg`."""
+    ruta = perfilador.ruta_archivo(perfil_id)
+    if not ruta:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return FileResponse(ruta, media_type="text/plain", filename=f"{perfil_id}.folded")
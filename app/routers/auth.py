@@ -1,13 +1,14 @@
 import uuid
 from typing import Optional
+import time
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from pydantic import BaseModel
 from app.database import SessionLocal
-from passlib.hash import bcrypt as ph
+from app.services import contratos_service, password_service, perfilador, sesion_service
 
-router = APIRouter(prefix="/auth", tags=["auth"])
+router = APIRouter(prefix="/auth", tags=["auth"], route_class=perfilador.RutaPerfilada)
 
 
 def get_db():
@@ -38,6 +39,8 @@ class UsuarioLoginOut(BaseModel):
     empresa_id: Optional[str] = None
     sede_id: Optional[str] = None
     activo: bool
+    token: Optional[str] = None     # JWT de sesión (Authorization: Bearer ...)
+    expira: Optional[int] = None    # epoch del vencimiento del token
 
 
 # ── POST /auth/login ────────────────────────────────────────
@@ -51,33 +54,33 @@ def login(data: LoginRequest, db: Session = Depends(get_db)):
     if not row:
         raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
 
+    # Devolver la conexión al pool mientras corre bcrypt
+    db.rollback()
+
     # Verificar contraseña (bcrypt o plana para legacy)
-    try:
-        ok = ph.verify(data.password, row["password"])
-    except Exception:
-        ok = (data.password == row["password"])
+    ok = password_service.verify_password(data.password, row["password"], permitir_plano=True)
 
     if not ok:
         raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
 
     # Verificar contrato activo (solo para usuarios no master_admin)
     rol = row.get("rol") or row.get("perfil") or "operador"
+    contrato_fin = None
+    modulos = []
     if rol != "master_admin" and row.get("empresa_id"):
-        contrato = db.execute(text("""
-            SELECT fecha_fin, activo FROM contratos
-            WHERE empresa_id = :eid AND activo = true
-            ORDER BY fecha_fin DESC LIMIT 1
-        """), {"eid": row["empresa_id"]}).mappings().fetchone()
+        contrato = contratos_service.contrato_activo(db, row["empresa_id"])
+        modulos = contratos_service.modulos_habilitados(contrato)
 
         if contrato:
             from datetime import date
+            contrato_fin = contrato["fecha_fin"]
             if contrato["fecha_fin"] < date.today():
                 raise HTTPException(
                     status_code=403,
                     detail="Contrato vencido. Por favor contacte al administrador de NEXTO."
                 )
 
-    return UsuarioLoginOut(
+    usuario = UsuarioLoginOut(
         id=row["id"],
         nombre=row["nombre"],
         apellido=row.get("apellido"),
@@ -92,16 +95,50 @@ def login(data: LoginRequest, db: Session = Depends(get_db)):
         sede_id=row.get("sede_id"),
         activo=bool(row.get("activo", True)),
     )
+    usuario.token, usuario.expira = sesion_service.emitir_token(usuario.model_dump(), contrato_fin, modulos=modulos)
+    return usuario
+
+
+# ── POST /auth/refresh ──────────────────────────────────────
+@router.post("/refresh")
+def refrescar_sesion(claims: dict = Depends(sesion_service.usuario_actual), db: Session = Depends(get_db)):
+    """
+    Renueva un token vigente, hasta SESION_MAX_HORAS desde el login. El
+    vencimiento y los módulos se releen del contrato activo (cacheado).
+    """
+    if time.time() - claims["orig_iat"] > sesion_service.SESION_MAX_HORAS * 3600:
+        raise HTTPException(status_code=401, detail="Sesión expirada, inicie sesión nuevamente")
+    from datetime import date
+    usuario = {**claims, "id": claims["sub"]}
+    fin = date.fromisoformat(claims["contrato_fin"]) if claims.get("contrato_fin") else None
+    modulos = claims.get("modulos", [])
+    if claims["rol"] != "master_admin" and claims.get("empresa_id"):
+        contrato = contratos_service.contrato_activo(db, claims["empresa_id"])
+        fin = contrato["fecha_fin"] if contrato else None
+        modulos = contratos_service.modulos_habilitados(contrato)
+    token, expira = sesion_service.emitir_token(usuario, fin, orig_iat=claims["orig_iat"], modulos=modulos)
+    sesion_service.revocar(claims)
+    return {"token": token, "expira": expira}
+
+
+# ── POST /auth/logout ───────────────────────────────────────
+@router.post("/logout")
+def cerrar_sesion(claims: dict = Depends(sesion_service.sesion_actual)):
+    sesion_service.revocar(claims)
+    return {"status": "ok"}
+
+
+# ── GET /auth/sesion ────────────────────────────────────────
+@router.get("/sesion")
+def obtener_sesion(claims: dict = Depends(sesion_service.usuario_actual)):
+    """Datos de la sesión actual, leídos del token (sin consultar la base)."""
+    return claims
 
 
 # ── GET /auth/contrato/{empresa_id} ────────────────────────
 @router.get("/contrato/{empresa_id}")
 def get_contrato(empresa_id: str, db: Session = Depends(get_db)):
-    row = db.execute(text("""
-        SELECT * FROM contratos
-        WHERE empresa_id = :eid AND activo = true
-        ORDER BY fecha_fin DESC LIMIT 1
-    """), {"eid": empresa_id}).mappings().fetchone()
+    row = contratos_service.contrato_activo(db, empresa_id)
 
     if not row:
         return {"tiene_contrato": False}
@@ -146,6 +183,7 @@ def crear_contrato(data: ContratoIn, db: Session = Depends(get_db)):
             "mod": json.dumps(data.modulos),
         })
         db.commit()
+        contratos_service.invalidar(data.empresa_id)
         return {"status": "ok"}
     except Exception as e:
         db.rollback()
@@ -183,6 +221,8 @@ def actualizar_permisos(usuario_id: str, data: PermisosIn, db: Session = Depends
     try:
         db.execute(text(f"UPDATE usuarios SET {', '.join(sets)} WHERE id = :id"), params)
         db.commit()
+        # Los tokens emitidos llevan los permisos viejos
+        sesion_service.revocar_usuario(usuario_id)
         return {"status": "ok"}
     except Exception as e:
         db.rollback()
@@ -27,10 +27,12 @@ from app.services.calendarios_service import (
     obtener_disponibilidades_por_fecha,
     obtener_primer_disponible,
 )
+from app.services import perfilador
+from app.services.version_sede import etag_condicional
 
 from pydantic import BaseModel
 
-router = APIRouter(prefix="/calendarios", tags=["Calendarios"])
+router = APIRouter(prefix="/calendarios", tags=["Calendarios"], route_class=perfilador.RutaPerfilada)
 
 
 class CalendarioUpdate(BaseModel):
@@ -348,7 +350,11 @@ def guardar_dias_especiales(
 # OBTENER DISPONIBILIDADES POR FECHA
 # ============================================================
 
-@router.get("/{calendario_id}/disponibilidades", response_model=list[dict])
+@router.get(
+    "/{calendario_id}/disponibilidades",
+    response_model=list[dict],
+    dependencies=[Depends(etag_condicional(get_db, "calendario_id"))],
+)
 def obtener_disponibilidades_endpoint(
     calendario_id: str,
     fecha: date,
@@ -1,12 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, Body
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta, time as time_type
-from ..database import SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, datetime, timedelta, time as time_type
+from ..database import SessionLocal, get_async_db
 from .. import models, schemas
+from ..respuestas import RespuestaORJSON
+from ..services import perfilador
+from ..services.version_sede import etag_condicional
 import uuid
 import secrets
 
-router = APIRouter(prefix="/citas", tags=["Citas"])
+router = APIRouter(prefix="/citas", tags=["Citas"], route_class=perfilador.RutaPerfilada)
 
 # ============================================================
 # DB SESSION
@@ -77,45 +82,63 @@ def _marcar_slot_libre(db: Session, calendario_id: str, fecha: str, hora: str):
     if slot:
         slot.disponible = True
 
+
+async def _ocupar_slot_async(db: AsyncSession, calendario_id: str, fecha: str, hora_t: time_type) -> bool:
+    """
+    Versión async de _marcar_slot_ocupado. Bloquea el slot (SKIP LOCKED) para
+    que dos reservas simultáneas no tomen el mismo cupo.
+    """
+    try:
+        fecha_d = date.fromisoformat(fecha)
+    except ValueError:
+        return False
+    slot = (await db.execute(
+        select(models.CalendarioDisponibilidad)
+        .where(
+            models.CalendarioDisponibilidad.calendario_id == calendario_id,
+            models.CalendarioDisponibilidad.fecha == fecha_d,
+            models.CalendarioDisponibilidad.hora == hora_t,
+            models.CalendarioDisponibilidad.disponible == True,
+        )
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )).scalar_one_or_none()
+    if slot:
+        slot.disponible = False
+        return True
+    return False
+
 # ============================================================
 # AGENDAR CITA
 # ============================================================
 
 @router.post("/agendar", response_model=schemas.CitaOut)
-def agendar_cita(data: schemas.CitaCreate, db: Session = Depends(get_db)):
-    cliente = db.query(models.Cliente).filter(models.Cliente.id == data.cliente_id).first()
+async def agendar_cita(data: schemas.CitaCreate, db: AsyncSession = Depends(get_async_db)):
+    cliente = await db.get(models.Cliente, data.cliente_id)
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
-    servicio = db.query(models.Servicio).filter(models.Servicio.id == data.servicio_id).first()
+    servicio = await db.get(models.Servicio, data.servicio_id)
     if not servicio:
         raise HTTPException(status_code=404, detail="Servicio no encontrado")
 
     # Verificar conflicto de horario (mismo cliente, misma hora)
-    conflicto = db.query(models.Cita).filter(
-        models.Cita.cliente_id == data.cliente_id,
-        models.Cita.sede_id == data.sede_id,
-        models.Cita.fecha == data.fecha,
-        models.Cita.hora == data.hora,
-        models.Cita.estado.in_(["agendada", "check_in", "en_espera"])
-    ).first()
+    conflicto = (await db.execute(
+        select(models.Cita.id).where(
+            models.Cita.cliente_id == data.cliente_id,
+            models.Cita.sede_id == data.sede_id,
+            models.Cita.fecha == data.fecha,
+            models.Cita.hora == data.hora,
+            models.Cita.estado.in_(["agendada", "check_in", "en_espera"])
+        ).limit(1)
+    )).first()
     if conflicto:
         raise HTTPException(status_code=400, detail="Ya tienes una cita en ese horario")
 
-    # Verificar que el slot tenga cupo disponible
+    # Verificar y tomar UN slot con cupo en el mismo paso
     hora_t = _hora_a_time(data.hora)
     if hora_t is not None:
-        cupo = (
-            db.query(models.CalendarioDisponibilidad)
-            .filter(
-                models.CalendarioDisponibilidad.calendario_id == data.calendario_id,
-                models.CalendarioDisponibilidad.fecha == data.fecha,
-                models.CalendarioDisponibilidad.hora == hora_t,
-                models.CalendarioDisponibilidad.disponible == True,
-            )
-            .first()
-        )
-        if not cupo:
+        if not await _ocupar_slot_async(db, data.calendario_id, data.fecha, hora_t):
             raise HTTPException(status_code=400, detail="No hay cupo disponible para ese horario")
 
     qr_token = data.qr_token or secrets.token_urlsafe(16)
@@ -134,13 +157,8 @@ def agendar_cita(data: schemas.CitaCreate, db: Session = Depends(get_db)):
     )
 
     db.add(cita)
-    db.flush()  # obtener el id antes del commit
-
-    # Marcar UN slot como ocupado
-    _marcar_slot_ocupado(db, data.calendario_id, data.fecha, data.hora)
-
-    db.commit()
-    db.refresh(cita)
+    await db.commit()
+    await db.refresh(cita)
 
     result = cita.__dict__.copy()
     result["servicio_nombre"] = servicio.nombre
@@ -148,123 +166,152 @@ def agendar_cita(data: schemas.CitaCreate, db: Session = Depends(get_db)):
 
     return result
 
+# ============================================================
+# LISTADOS: proyección explícita de las columnas de CitaOut.
+# Filas planas en vez de instancias ORM y JSON con orjson sin
+# re-validar cada fila.
+# ============================================================
+
+_CITAS_LISTADO = (
+    select(
+        models.Cita.id,
+        models.Cita.cliente_id,
+        models.Cita.servicio_id,
+        models.Cita.sede_id,
+        models.Cita.calendario_id,
+        models.Cita.fecha,
+        models.Cita.hora,
+        models.Cita.estado,
+        models.Cita.ticket_id,
+        models.Cita.metodo_checkin,
+        models.Cita.hora_checkin,
+        models.Cita.cita_original_id,
+        models.Cita.notas,
+        models.Cita.qr_token,
+        models.Cita.created_at,
+        models.Servicio.nombre.label("servicio_nombre"),
+        models.Cliente.nombre.label("cliente_nombre"),
+    )
+    .join(models.Servicio, models.Cita.servicio_id == models.Servicio.id)
+    .join(models.Cliente, models.Cita.cliente_id == models.Cliente.id)
+)
+
+
+def _cita_fila(row) -> dict:
+    """Claves y orden de schemas.CitaOut."""
+    return {
+        "id": row.id,
+        "cliente_id": row.cliente_id,
+        "servicio_id": row.servicio_id,
+        "sede_id": row.sede_id,
+        "calendario_id": row.calendario_id,
+        "fecha": row.fecha,
+        "hora": row.hora,
+        "estado": row.estado,
+        "ticket_id": row.ticket_id,
+        "metodo_checkin": row.metodo_checkin,
+        "hora_checkin": row.hora_checkin,
+        "cita_original_id": row.cita_original_id,
+        "notas": row.notas,
+        "qr_token": row.qr_token,
+        "created_at": row.created_at,
+        "servicio_nombre": row.servicio_nombre,
+        "cliente_nombre": row.cliente_nombre,
+    }
+
 # ============================================================
 # OBTENER CITAS DE UN CLIENTE
 # ============================================================
 
 @router.get("/cliente/{cliente_id}", response_model=list[schemas.CitaOut])
 def get_citas_cliente(cliente_id: str, db: Session = Depends(get_db)):
-    rows = (
-        db.query(models.Cita, models.Servicio.nombre.label("servicio_nombre"), models.Cliente.nombre.label("cliente_nombre"))
-        .join(models.Servicio, models.Cita.servicio_id == models.Servicio.id)
-        .join(models.Cliente, models.Cita.cliente_id == models.Cliente.id)
-        .filter(models.Cita.cliente_id == cliente_id)
+    rows = db.execute(
+        _CITAS_LISTADO
+        .where(models.Cita.cliente_id == cliente_id)
         .order_by(models.Cita.fecha.asc(), models.Cita.hora.asc())
-        .all()
-    )
-
-    resultado = []
-    for cita, servicio_nombre, cliente_nombre in rows:
-        data = cita.__dict__.copy()
-        data["servicio_nombre"] = servicio_nombre
-        data["cliente_nombre"] = cliente_nombre
-        resultado.append(data)
-
-    return resultado
+    ).all()
+    return RespuestaORJSON([_cita_fila(row) for row in rows])
 
 # ============================================================
 # OBTENER CITAS DE HOY PARA UN CLIENTE EN UNA SEDE (KIOSCO)
 # ============================================================
 
 @router.get("/hoy/{cliente_id}/{sede_id}", response_model=list[schemas.CitaOut])
-def get_citas_hoy_kiosco(cliente_id: str, sede_id: str, db: Session = Depends(get_db)):
-    from datetime import date
+async def get_citas_hoy_kiosco(cliente_id: str, sede_id: str, db: AsyncSession = Depends(get_async_db)):
     hoy = date.today().isoformat()
-    rows = (
-        db.query(models.Cita, models.Servicio.nombre.label("servicio_nombre"), models.Cliente.nombre.label("cliente_nombre"))
-        .join(models.Servicio, models.Cita.servicio_id == models.Servicio.id)
-        .join(models.Cliente, models.Cita.cliente_id == models.Cliente.id)
-        .filter(
+    rows = (await db.execute(
+        _CITAS_LISTADO
+        .where(
             models.Cita.cliente_id == cliente_id,
             models.Cita.sede_id == sede_id,
             models.Cita.fecha == hoy,
             models.Cita.estado == "agendada"
         )
         .order_by(models.Cita.hora.asc())
-        .all()
-    )
-
-    resultado = []
-    for cita, servicio_nombre, cliente_nombre in rows:
-        data = cita.__dict__.copy()
-        data["servicio_nombre"] = servicio_nombre
-        data["cliente_nombre"] = cliente_nombre
-        resultado.append(data)
-
-    return resultado
+    )).all()
+    return RespuestaORJSON([_cita_fila(row) for row in rows])
 
 # ============================================================
 # OBTENER CITAS DE UNA SEDE POR FECHA
 # ============================================================
 
 @router.get("/sede/{sede_id}/fecha/{fecha}", response_model=list[schemas.CitaOut])
-def get_citas_sede_fecha(sede_id: str, fecha: str, db: Session = Depends(get_db)):
-    rows = (
-        db.query(models.Cita, models.Servicio.nombre.label("servicio_nombre"), models.Cliente.nombre.label("cliente_nombre"))
-        .join(models.Servicio, models.Cita.servicio_id == models.Servicio.id)
-        .join(models.Cliente, models.Cita.cliente_id == models.Cliente.id)
-        .filter(
+def get_citas_sede_fecha(
+    sede_id: str,
+    fecha: str,
+    db: Session = Depends(get_db),
+    cache: dict = Depends(etag_condicional(get_db)),
+):
+    rows = db.execute(
+        _CITAS_LISTADO
+        .where(
             models.Cita.sede_id == sede_id,
             models.Cita.fecha == fecha
         )
         .order_by(models.Cita.hora.asc())
-        .all()
-    )
-
-    resultado = []
-    for cita, servicio_nombre, cliente_nombre in rows:
-        data = cita.__dict__.copy()
-        data["servicio_nombre"] = servicio_nombre
-        data["cliente_nombre"] = cliente_nombre
-        resultado.append(data)
-
-    return resultado
+    ).all()
+    return RespuestaORJSON([_cita_fila(row) for row in rows], headers=cache)
 
 # ============================================================
 # CHECK-IN POR APP
 # ============================================================
 
 @router.put("/checkin/app/{cita_id}", response_model=schemas.CitaOut)
-def checkin_app(cita_id: str, db: Session = Depends(get_db)):
-    cita = db.query(models.Cita).filter(models.Cita.id == cita_id).first()
+async def checkin_app(cita_id: str, db: AsyncSession = Depends(get_async_db)):
+    cita = (await db.execute(
+        select(models.Cita).where(models.Cita.id == cita_id).with_for_update()
+    )).scalar_one_or_none()
     if not cita:
         raise HTTPException(status_code=404, detail="Cita no encontrada")
 
     if cita.estado != "agendada":
         raise HTTPException(status_code=400, detail=f"La cita está en estado '{cita.estado}', no se puede hacer check-in")
 
-    return _procesar_checkin(cita, metodo="app", db=db)
+    return await _procesar_checkin(cita, metodo="app", db=db)
 
 # ============================================================
 # CHECK-IN POR QR
 # ============================================================
 
 @router.put("/checkin/qr/{qr_token}", response_model=schemas.CitaOut)
-def checkin_qr(qr_token: str, db: Session = Depends(get_db)):
-    cita = db.query(models.Cita).filter(models.Cita.qr_token == qr_token).first()
+async def checkin_qr(qr_token: str, db: AsyncSession = Depends(get_async_db)):
+    # FOR UPDATE: un doble escaneo del QR no genera dos tickets
+    cita = (await db.execute(
+        select(models.Cita).where(models.Cita.qr_token == qr_token).with_for_update()
+    )).scalar_one_or_none()
     if not cita:
         raise HTTPException(status_code=404, detail="QR inválido o cita no encontrada")
 
     if cita.estado != "agendada":
         raise HTTPException(status_code=400, detail=f"La cita está en estado '{cita.estado}', no se puede hacer check-in")
 
-    return _procesar_checkin(cita, metodo="qr", db=db)
+    return await _procesar_checkin(cita, metodo="qr", db=db)
 
 # ============================================================
 # LÓGICA INTERNA DE CHECK-IN
 # ============================================================
 
-def _procesar_checkin(cita: models.Cita, metodo: str, db: Session):
+async def _procesar_checkin(cita: models.Cita, metodo: str, db: AsyncSession):
     ahora = datetime.utcnow()
     hora_cita = datetime.strptime(f"{cita.fecha} {cita.hora}", "%Y-%m-%d %H:%M") - timedelta(hours=1)
     ventana_inicio = hora_cita - timedelta(minutes=20)
@@ -276,8 +323,10 @@ def _procesar_checkin(cita: models.Cita, metodo: str, db: Session):
             detail=f"Check-in solo permitido entre {ventana_inicio.strftime('%H:%M')} y {ventana_fin.strftime('%H:%M')}"
         )
 
-    servicio = db.query(models.Servicio).filter(models.Servicio.id == cita.servicio_id).first()
-    cliente = db.query(models.Cliente).filter(models.Cliente.id == cita.cliente_id).first()
+    servicio = (await db.execute(
+        select(models.Servicio).where(models.Servicio.id == cita.servicio_id).with_for_update()
+    )).scalar_one()
+    cliente = await db.get(models.Cliente, cita.cliente_id)
 
     hoy = ahora.date()
     ultima_fecha = None
@@ -307,15 +356,15 @@ def _procesar_checkin(cita: models.Cita, metodo: str, db: Session):
         servicio.contador_actual = servicio.rango_inicio
 
     db.add(ticket)
-    db.flush()
+    await db.flush()
 
     cita.estado = "check_in"
     cita.metodo_checkin = metodo
     cita.hora_checkin = ahora
     cita.ticket_id = ticket.id
 
-    db.commit()
-    db.refresh(cita)
+    await db.commit()
+    await db.refresh(cita)
 
     result = cita.__dict__.copy()
     result["servicio_nombre"] = servicio.nombre
@@ -3,27 +3,19 @@ from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional
-import bcrypt
 import uuid
 
 from ..database import get_db
 from .. import models
+from ..services.password_service import hash_password, verify_password
+from ..services import perfilador
 
-router = APIRouter(tags=["Clientes"])
+router = APIRouter(tags=["Clientes"], route_class=perfilador.RutaPerfilada)
 
 CORS_HEADERS = {
     "Access-Control-Allow-Origin": "*",
 }
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-
-def verify_password(plain: str, hashed: str) -> bool:
-    try:
-        return bcrypt.checkpw(plain.encode("utf-8"), hashed.encode("utf-8"))
-    except Exception:
-        return False
-
 class ClienteCreate(BaseModel):
     nombre: str
     apellido: Optional[str] = None
@@ -62,13 +54,16 @@ def registrar_cliente(data: ClienteCreate, db: Session = Depends(get_db)):
     if data.numero_identificacion:
         if db.query(models.Cliente).filter_by(numero_identificacion=data.numero_identificacion).first():
             raise HTTPException(status_code=400, detail="Ya existe un cliente con ese número de identificación")
+    # Devolver la conexión al pool mientras corre bcrypt
+    db.rollback()
+    hashed = hash_password(data.password)
     nuevo = models.Cliente(
         id=str(uuid.uuid4()),
         nombre=data.nombre,
         apellido=data.apellido,
         email=data.email,
         numero_identificacion=data.numero_identificacion,
-        hashed_password=hash_password(data.password),
+        hashed_password=hashed,
     )
     db.add(nuevo); db.commit(); db.refresh(nuevo)
     return JSONResponse(content=cliente_json(nuevo), headers=CORS_HEADERS)
@@ -82,9 +77,14 @@ def login_cliente(data: ClienteLogin, db: Session = Depends(get_db)):
         cliente = db.query(models.Cliente).filter_by(numero_identificacion=data.numero_identificacion).first()
     else:
         raise HTTPException(status_code=400, detail="Proporciona email o número de identificación")
-    if not cliente or not verify_password(data.password, cliente.hashed_password):
+    if not cliente:
+        raise HTTPException(status_code=401, detail="Credenciales inválidas")
+    contenido, hashed = cliente_json(cliente), cliente.hashed_password
+    # Devolver la conexión al pool mientras corre bcrypt
+    db.rollback()
+    if not verify_password(data.password, hashed):
         raise HTTPException(status_code=401, detail="Credenciales inválidas")
-    return JSONResponse(content=cliente_json(cliente), headers=CORS_HEADERS)
+    return JSONResponse(content=contenido, headers=CORS_HEADERS)
 
 @router.get("/clientes/buscar/{numero_identificacion}", response_model=ClienteOut)
 def buscar_cliente(numero_identificacion: str, db: Session = Depends(get_db)):
@@ -2,8 +2,9 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from ..database import SessionLocal
 from .. import models, schemas
+from ..services import perfilador
 
-router = APIRouter(prefix="/empresas", tags=["Empresas"])
+router = APIRouter(prefix="/empresas", tags=["Empresas"], route_class=perfilador.RutaPerfilada)
 
 def get_db():
     db = SessionLocal()
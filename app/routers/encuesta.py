@@ -1,13 +1,16 @@
+import json
 import uuid
-from typing import Optional
-from fastapi import APIRouter, Depends, Query
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from pydantic import BaseModel
-from app.database import SessionLocal
+from app.database import SessionLocal, get_read_db
 from app.models.encuesta import EncuestaRespuesta
+from app.services import perfilador
 
-router = APIRouter(prefix="/encuesta", tags=["encuesta"])
+router = APIRouter(prefix="/encuesta", tags=["encuesta"], route_class=perfilador.RutaPerfilada)
 
 
 def get_db():
@@ -31,6 +34,40 @@ class RespuestaIn(BaseModel):
     comentario:  Optional[str] = None
 
 
+# ── Agregados diarios ──────────────────────────────────────────
+# encuesta_agregados_dia guarda conteos y sumas por (sede, servicio,
+# tipo, día) para que /reporte no recorra encuesta_respuestas.
+_UPSERT_AGREGADO = text("""
+    INSERT INTO encuesta_agregados_dia
+        (sede_id, servicio_id, tipo, dia, total,
+         n_p1, suma_p1, n_p2, suma_p2, n_p3, suma_p3)
+    VALUES
+        (COALESCE(:sede_id, ''), COALESCE(:servicio_id, ''), COALESCE(:tipo, ''), CURRENT_DATE, 1,
+         CASE WHEN :p1 IS NULL THEN 0 ELSE 1 END, COALESCE(:p1, 0),
+         CASE WHEN :p2 IS NULL THEN 0 ELSE 1 END, COALESCE(:p2, 0),
+         CASE WHEN :p3 IS NULL THEN 0 ELSE 1 END, COALESCE(:p3, 0))
+    ON CONFLICT (sede_id, servicio_id, tipo, dia) DO UPDATE SET
+        total   = encuesta_agregados_dia.total   + EXCLUDED.total,
+        n_p1    = encuesta_agregados_dia.n_p1    + EXCLUDED.n_p1,
+        suma_p1 = encuesta_agregados_dia.suma_p1 + EXCLUDED.suma_p1,
+        n_p2    = encuesta_agregados_dia.n_p2    + EXCLUDED.n_p2,
+        suma_p2 = encuesta_agregados_dia.suma_p2 + EXCLUDED.suma_p2,
+        n_p3    = encuesta_agregados_dia.n_p3    + EXCLUDED.n_p3,
+        suma_p3 = encuesta_agregados_dia.suma_p3 + EXCLUDED.suma_p3
+""")
+
+
+def _acumular_agregado(db: Session, data: "RespuestaIn"):
+    db.execute(_UPSERT_AGREGADO, {
+        "sede_id": data.sede_id,
+        "servicio_id": data.servicio_id,
+        "tipo": data.tipo,
+        "p1": data.p1_atencion,
+        "p2": data.p2_video,
+        "p3": data.p3_general,
+    })
+
+
 # ── POST: guardar respuesta ────────────────────────────────────
 @router.post("/respuesta", status_code=201)
 def crear_respuesta(data: RespuestaIn, db: Session = Depends(get_db)):
@@ -47,8 +84,8 @@ def crear_respuesta(data: RespuestaIn, db: Session = Depends(get_db)):
         comentario  = data.comentario,
     )
     db.add(resp)
+    _acumular_agregado(db, data)   # misma transacción que el INSERT
     db.commit()
-    db.refresh(resp)
     return {"id": resp.id, "status": "ok"}
 
 
@@ -58,7 +95,7 @@ def reporte(
     sede_id:     Optional[str] = Query(None),
     servicio_id: Optional[str] = Query(None),
     tipo:        Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     filters = []
     params: dict = {}
@@ -72,17 +109,18 @@ def reporte(
         filters.append("tipo = :tipo")
         params["tipo"] = tipo
 
-    where = ("WHERE " + " AND ".join(filters)) if filters else ""
+    where_agg = ("WHERE " + " AND ".join(f"a.{f}" for f in filters)) if filters else ""
+    where = ("WHERE " + " AND ".join(f"er.{f}" for f in filters)) if filters else ""
 
-    # Promedios globales
+    # Promedios globales (desde los agregados diarios)
     agg = db.execute(text(f"""
         SELECT
-            COUNT(*)                       AS total,
-            ROUND(AVG(p1_atencion), 2)     AS avg_atencion,
-            ROUND(AVG(p2_video),    2)     AS avg_video,
-            ROUND(AVG(p3_general),  2)     AS avg_general
-        FROM encuesta_respuestas
-        {where}
+            COALESCE(SUM(a.total), 0)                                      AS total,
+            ROUND(SUM(a.suma_p1)::numeric / NULLIF(SUM(a.n_p1), 0), 2)     AS avg_atencion,
+            ROUND(SUM(a.suma_p2)::numeric / NULLIF(SUM(a.n_p2), 0), 2)     AS avg_video,
+            ROUND(SUM(a.suma_p3)::numeric / NULLIF(SUM(a.n_p3), 0), 2)     AS avg_general
+        FROM encuesta_agregados_dia a
+        {where_agg}
     """), params).mappings().fetchone()
 
     # Últimos comentarios (máx 50)
@@ -101,17 +139,17 @@ def reporte(
         LIMIT 50
     """), params).mappings().fetchall()
 
-    # Promedios por servicio
+    # Promedios por servicio (desde los agregados diarios)
     por_servicio = db.execute(text(f"""
         SELECT
-            s.nombre                       AS servicio,
-            COUNT(er.id)                   AS total,
-            ROUND(AVG(er.p1_atencion), 2)  AS avg_atencion,
-            ROUND(AVG(er.p2_video),    2)  AS avg_video,
-            ROUND(AVG(er.p3_general),  2)  AS avg_general
-        FROM encuesta_respuestas er
-        LEFT JOIN servicios s ON s.id = er.servicio_id
-        {where}
+            s.nombre                                                       AS servicio,
+            SUM(a.total)                                                   AS total,
+            ROUND(SUM(a.suma_p1)::numeric / NULLIF(SUM(a.n_p1), 0), 2)     AS avg_atencion,
+            ROUND(SUM(a.suma_p2)::numeric / NULLIF(SUM(a.n_p2), 0), 2)     AS avg_video,
+            ROUND(SUM(a.suma_p3)::numeric / NULLIF(SUM(a.n_p3), 0), 2)     AS avg_general
+        FROM encuesta_agregados_dia a
+        LEFT JOIN servicios s ON s.id = NULLIF(a.servicio_id, '')
+        {where_agg}
         GROUP BY s.nombre
         ORDER BY total DESC
     """), params).mappings().fetchall()
@@ -121,3 +159,181 @@ def reporte(
         "comentarios": [dict(r) for r in comentarios],
         "por_servicio": [dict(r) for r in por_servicio],
     }
+
+
+# ── POST: lote de respuestas (kioscos con buffer offline) ─────
+# El kiosco genera el id de cada respuesta; reenviar un lote es
+# idempotente porque los ids ya guardados se reportan como duplicados.
+LOTE_MAX = 1000
+
+
+class RespuestaLoteItem(RespuestaIn):
+    id:         str                        # generado por el kiosco (uuid)
+    created_at: Optional[datetime] = None  # momento real de la respuesta
+
+
+class LoteIn(BaseModel):
+    respuestas: List[RespuestaLoteItem]
+
+
+_INSERT_LOTE = text("""
+    WITH lote AS (
+        SELECT *
+        FROM jsonb_to_recordset(CAST(:lote AS JSONB)) AS r(
+            id VARCHAR, ticket_id VARCHAR, servicio_id VARCHAR, sede_id VARCHAR,
+            cliente_id VARCHAR, tipo VARCHAR, p1_atencion INTEGER, p2_video INTEGER,
+            p3_general INTEGER, comentario VARCHAR, created_at TIMESTAMPTZ
+        )
+    ),
+    ins AS (
+        INSERT INTO encuesta_respuestas
+            (id, ticket_id, servicio_id, sede_id, cliente_id, tipo,
+             p1_atencion, p2_video, p3_general, comentario, created_at)
+        SELECT id, ticket_id, servicio_id, sede_id, cliente_id, tipo,
+               p1_atencion, p2_video, p3_general, comentario,
+               -- created_at llega con o sin offset; la columna y el día del
+               -- agregado usan la hora local del servidor, como NOW()
+               CAST(COALESCE(created_at, NOW()) AS TIMESTAMP)
+        FROM lote
+        ON CONFLICT (id) DO NOTHING
+        RETURNING id, sede_id, servicio_id, tipo, p1_atencion, p2_video, p3_general, created_at
+    ),
+    agg AS (
+        INSERT INTO encuesta_agregados_dia
+            (sede_id, servicio_id, tipo, dia, total,
+             n_p1, suma_p1, n_p2, suma_p2, n_p3, suma_p3)
+        SELECT COALESCE(sede_id, ''), COALESCE(servicio_id, ''), COALESCE(tipo, ''),
+               created_at::date, COUNT(*),
+               COUNT(p1_atencion), COALESCE(SUM(p1_atencion), 0),
+               COUNT(p2_video),    COALESCE(SUM(p2_video), 0),
+               COUNT(p3_general),  COALESCE(SUM(p3_general), 0)
+        FROM ins
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (sede_id, servicio_id, tipo, dia) DO UPDATE SET
+            total   = encuesta_agregados_dia.total   + EXCLUDED.total,
+            n_p1    = encuesta_agregados_dia.n_p1    + EXCLUDED.n_p1,
+            suma_p1 = encuesta_agregados_dia.suma_p1 + EXCLUDED.suma_p1,
+            n_p2    = encuesta_agregados_dia.n_p2    + EXCLUDED.n_p2,
+            suma_p2 = encuesta_agregados_dia.suma_p2 + EXCLUDED.suma_p2,
+            n_p3    = encuesta_agregados_dia.n_p3    + EXCLUDED.n_p3,
+            suma_p3 = encuesta_agregados_dia.suma_p3 + EXCLUDED.suma_p3
+    )
+    SELECT id FROM ins
+""")
+
+
+def _ids_existentes(db: Session, tabla: str, ids: set) -> set:
+    if not ids:
+        return set()
+    rows = db.execute(text(f"SELECT id FROM {tabla} WHERE id = ANY(:ids)"), {"ids": list(ids)}).fetchall()
+    return {r[0] for r in rows}
+
+
+def _clasificar_lote(respuestas: list, existentes: dict) -> tuple[list, list]:
+    """
+    Resultado por respuesta (estado None = a insertar) y filas a insertar.
+    Un id repetido es duplicado solo si una copia anterior fue aceptada: si
+    la primera falló por una referencia inválida, la siguiente se evalúa.
+    """
+    resultados = []
+    validas = []
+    aceptados = set()
+    for r in respuestas:
+        if r.id in aceptados:
+            resultados.append({"id": r.id, "estado": "duplicado"})
+            continue
+        invalidos = [c for c in existentes if getattr(r, c) and getattr(r, c) not in existentes[c]]
+        if invalidos:
+            resultados.append({"id": r.id, "estado": "error", "detalle": f"No existe: {', '.join(invalidos)}"})
+            continue
+        aceptados.add(r.id)
+        resultados.append({"id": r.id, "estado": None})
+        validas.append(r.model_dump(mode="json"))
+    return resultados, validas
+
+
+@router.post("/respuestas/lote")
+def crear_respuestas_lote(data: LoteIn, db: Session = Depends(get_db)):
+    if len(data.respuestas) > LOTE_MAX:
+        raise HTTPException(status_code=413, detail=f"Máximo {LOTE_MAX} respuestas por lote")
+
+    # Validar referencias en una pasada: un FK inválido no debe tumbar el lote
+    existentes = {
+        campo: _ids_existentes(db, tabla, {getattr(r, campo) for r in data.respuestas if getattr(r, campo)})
+        for campo, tabla in (("ticket_id", "tickets"), ("servicio_id", "servicios"), ("sede_id", "sedes"))
+    }
+
+    resultados, validas = _clasificar_lote(data.respuestas, existentes)
+
+    insertados = set()
+    if validas:
+        try:
+            insertados = {row[0] for row in db.execute(_INSERT_LOTE, {"lote": json.dumps(validas)}).fetchall()}
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise HTTPException(status_code=500, detail=f"Error al guardar lote: {str(e)}")
+
+    for res in resultados:
+        if res["estado"] is None:
+            res["estado"] = "creado" if res["id"] in insertados else "duplicado"
+
+    return {
+        "recibidas": len(data.respuestas),
+        "creadas": sum(1 for r in resultados if r["estado"] == "creado"),
+        "duplicadas": sum(1 for r in resultados if r["estado"] == "duplicado"),
+        "errores": sum(1 for r in resultados if r["estado"] == "error"),
+        "resultados": resultados,
+    }
+
+
+# ── GET: búsqueda de texto completo en comentarios ────────────
+# comentario_tsv es una columna generada (config 'spanish') con índice GIN.
+@router.get("/comentarios/buscar")
+def buscar_comentarios(
+    q:       str            = Query(..., min_length=2),
+    sede_id: Optional[str]  = Query(None),
+    desde:   Optional[date] = Query(None),   # YYYY-MM-DD
+    hasta:   Optional[date] = Query(None),   # YYYY-MM-DD
+    limite:  int            = Query(20, ge=1, le=100),
+    pagina:  int            = Query(1, ge=1),
+    db: Session = Depends(get_read_db),
+):
+    filters = ["er.comentario_tsv @@ websearch_to_tsquery('spanish', :q)"]
+    params: dict = {"q": q, "lim": limite + 1, "off": (pagina - 1) * limite}
+    if sede_id:
+        filters.append("er.sede_id = :sede_id")
+        params["sede_id"] = sede_id
+    if desde:
+        filters.append("er.created_at >= :desde")
+        params["desde"] = desde
+    if hasta:
+        filters.append("er.created_at < :hasta")
+        params["hasta"] = hasta + timedelta(days=1)
+
+    # ts_headline solo se calcula para la página ya recortada
+    rows = db.execute(text(f"""
+        SELECT
+            p.id, p.comentario, p.tipo, p.sede_id, p.created_at, p.rank,
+            s.nombre AS servicio_nombre,
+            ts_headline('spanish', p.comentario, websearch_to_tsquery('spanish', :q),
+                        'StartSel=<b>, StopSel=</b>, MaxFragments=2') AS fragmento
+        FROM (
+            SELECT er.id, er.comentario, er.tipo, er.sede_id, er.servicio_id, er.created_at,
+                   ts_rank(er.comentario_tsv, websearch_to_tsquery('spanish', :q)) AS rank
+            FROM encuesta_respuestas er
+            WHERE {" AND ".join(filters)}
+            ORDER BY rank DESC, er.created_at DESC
+            LIMIT :lim OFFSET :off
+        ) p
+        LEFT JOIN servicios s ON s.id = p.servicio_id
+        ORDER BY p.rank DESC, p.created_at DESC
+    """), params).mappings().fetchall()
+
+    return {
+        "q": q,
+        "pagina": pagina,
+        "limite": limite,
+        "hay_mas": len(rows) > limite,
+        "resultados": [dict(r) for r in rows[:limite]],
+    }
@@ -2,8 +2,10 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from ..database import SessionLocal
 from .. import models, schemas
+from ..services.version_sede import etag_condicional
+from ..services import perfilador
 
-router = APIRouter(prefix="/funciones", tags=["Funciones"])
+router = APIRouter(prefix="/funciones", tags=["Funciones"], route_class=perfilador.RutaPerfilada)
 
 def get_db():
     db = SessionLocal()
@@ -36,7 +38,11 @@ def get_funciones(db: Session = Depends(get_db)):
 # GET: FUNCIONES POR SEDE
 # ============================================================
 
-@router.get("/sede/{sede_id}", response_model=list[schemas.FuncionOut])
+@router.get(
+    "/sede/{sede_id}",
+    response_model=list[schemas.FuncionOut],
+    dependencies=[Depends(etag_condicional(get_db))],
+)
 def get_funciones_por_sede(sede_id: str, db: Session = Depends(get_db)):
     funciones = db.query(models.Funcion).filter(models.Funcion.sede_id == sede_id).all()
     return [
@@ -1,16 +1,52 @@
 import time
 import uuid
 import os
+import threading
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional
 
-router = APIRouter(prefix="/jaas", tags=["jaas"])
+import jwt as pyjwt
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+from app.services import perfilador
+
+router = APIRouter(prefix="/jaas", tags=["jaas"], route_class=perfilador.RutaPerfilada)
 
 JAAS_APP_ID  = os.getenv("JAAS_APP_ID",  "vpaas-magic-cookie-429e9a26ae1d432a9cd8c51b9081cf3e")
 JAAS_KEY_ID  = os.getenv("JAAS_KEY_ID",  "vpaas-magic-cookie-429e9a26ae1d432a9cd8c51b9081cf3e/6578ba")
 JAAS_PRIVATE_KEY = os.getenv("JAAS_PRIVATE_KEY", "")
 
+TOKEN_VIGENCIA = 7200   # 2 horas
+# Un token cacheado se reusa hasta este margen antes de su exp
+TOKEN_MARGEN = int(os.getenv("JAAS_TOKEN_MARGEN_SEGUNDOS", "600"))
+TOKEN_CACHE_MAX = 2000
+
+_lock = threading.Lock()
+_clave_privada = None
+_tokens: dict = {}   # (room, user_id, moderator, name, email) -> (exp, token)
+
+
+def obtener_clave():
+    """Objeto de clave RSA parseado una sola vez por proceso."""
+    global _clave_privada
+    if _clave_privada is None:
+        with _lock:
+            if _clave_privada is None:
+                pem = JAAS_PRIVATE_KEY.replace("\\n", "\n").encode("utf-8")
+                _clave_privada = load_pem_private_key(pem, password=None)
+    return _clave_privada
+
+
+def _purgar_tokens(now: int):
+    limite = now + TOKEN_MARGEN
+    for clave, (exp, _) in list(_tokens.items()):
+        if exp <= limite:
+            del _tokens[clave]
+    # Si siguen sobrando, descartar los más viejos (insertados primero)
+    while len(_tokens) >= TOKEN_CACHE_MAX:
+        del _tokens[next(iter(_tokens))]
+
 
 class TokenRequest(BaseModel):
     room: str
@@ -25,18 +61,24 @@ def get_jaas_token(req: TokenRequest):
     if not JAAS_PRIVATE_KEY:
         raise HTTPException(status_code=500, detail="JaaS private key not configured")
 
-    try:
-        import jwt as pyjwt
-    except ImportError:
-        raise HTTPException(status_code=500, detail="PyJWT not installed")
-
     now = int(time.time())
 
+    # Reusar el token del mismo participante mientras le quede vigencia.
+    # Sin user_id cada pedido recibe un id nuevo, así que no se cachea.
+    clave = (req.room, req.user_id, req.moderator, req.name, req.email or "")
+    if req.user_id:
+        with _lock:
+            cacheado = _tokens.get(clave)
+        if cacheado and cacheado[0] - TOKEN_MARGEN > now:
+            token = cacheado[1]
+            room_url = f"https://8x8.vc/{JAAS_APP_ID}/{req.room}?jwt={token}"
+            return {"token": token, "room_url": room_url}
+
     payload = {
         "aud": "jitsi",
         "iss": "chat",
         "iat": now,
-        "exp": now + 7200,   # 2 horas
+        "exp": now + TOKEN_VIGENCIA,
         "nbf": now - 10,
         "sub": JAAS_APP_ID,
         "context": {
@@ -62,14 +104,17 @@ def get_jaas_token(req: TokenRequest):
         "room": "*",
     }
 
-    private_key = JAAS_PRIVATE_KEY.replace("\\n", "\n")
-
     token = pyjwt.encode(
         payload,
-        private_key,
+        obtener_clave(),
         algorithm="RS256",
         headers={"kid": JAAS_KEY_ID},
     )
 
+    if req.user_id:
+        with _lock:
+            _purgar_tokens(now)
+            _tokens[clave] = (payload["exp"], token)
+
     room_url = f"https://8x8.vc/{JAAS_APP_ID}/{req.room}?jwt={token}"
     return {"token": token, "room_url": room_url}
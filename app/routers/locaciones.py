@@ -2,8 +2,9 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from ..database import SessionLocal
 from .. import models, schemas
+from ..services import perfilador
 
-router = APIRouter(prefix="/locaciones", tags=["Locaciones"])
+router = APIRouter(prefix="/locaciones", tags=["Locaciones"], route_class=perfilador.RutaPerfilada)
 
 def get_db():
     db = SessionLocal()
@@ -0,0 +1,31 @@
+"""
+Router: /metrics
+Métricas en formato de texto de Prometheus (app/services/metricas.py).
+Si METRICS_TOKEN está configurado, se exige `Authorization: Bearer <token>`.
+"""
+import hmac
+import os
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.orm import Session
+
+from app.database import get_read_db
+from app.services import metricas, perfilador
+
+router = APIRouter(tags=["metricas"], route_class=perfilador.RutaPerfilada)
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def exportar_metricas(
+    authorization: str = Header(default=""),
+    db: Session = Depends(get_read_db),
+):
+    if METRICS_TOKEN and not hmac.compare_digest(authorization, f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Token de métricas inválido")
+    return PlainTextResponse(
+        metricas.exportar(db),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
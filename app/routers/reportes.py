@@ -1,16 +1,23 @@
-from fastapi import APIRouter, Depends, Query, Response
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from concurrent.futures import ThreadPoolExecutor
+from pydantic import BaseModel
+import base64
 import io
+import json
+import os
+import time
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from datetime import datetime, timedelta, date
 from typing import Optional
 import uuid
 
-from ..database import SessionLocal
+from ..database import SessionLocal, get_read_db, sesion_lectura
 from .. import models
+from ..services import perfilador, reportes_jobs_service
 
-router = APIRouter(prefix="/reportes", tags=["Reportes"])
+router = APIRouter(prefix="/reportes", tags=["Reportes"], route_class=perfilador.RutaPerfilada)
 
 
 def get_db():
@@ -21,27 +28,36 @@ def get_db():
         db.close()
 
 
-@router.get("/nivel-servicio/{sede_id}/exportar-excel")
-def exportar_excel_nivel_servicio(
-    sede_id: str,
-    fecha_inicio: Optional[str] = Query(None),
-    fecha_fin: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
-):
-    try:
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        from openpyxl.utils import get_column_letter
-    except ImportError:
-        return Response(content="openpyxl no instalado", status_code=500)
-
-    # Reusar lógica del reporte
+def _rango_fechas(fecha_inicio: Optional[str], fecha_fin: Optional[str]):
+    """Rango [fi, ff) del reporte; por defecto los últimos 30 días."""
     if fecha_inicio and fecha_fin:
         fi = datetime.strptime(fecha_inicio, "%Y-%m-%d")
         ff = datetime.strptime(fecha_fin, "%Y-%m-%d") + timedelta(days=1)
     else:
         ff = datetime.now()
         fi = ff - timedelta(days=30)
+    return fi, ff
+
+
+def _ponderado(items: list, campo: str, peso: str = "volumen"):
+    """Promedio de `campo` ponderado por `peso`, ignorando valores None."""
+    datos = [(s[campo], s[peso]) for s in items if s[campo] is not None]
+    if not datos:
+        return None
+    total = sum(v for _, v in datos)
+    if total == 0:
+        return None
+    return round(sum(v * v_vol for v, v_vol in datos) / total, 1)
+
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _generar_excel_nivel_servicio(db: Session, sede_id: str, fi: datetime, ff: datetime):
+    """Construye el libro Excel del reporte. Devuelve (contenido, nombre_archivo)."""
+    import openpyxl
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+    from openpyxl.utils import get_column_letter
 
     tickets = (
         db.query(models.Ticket)
@@ -147,30 +163,42 @@ def exportar_excel_nivel_servicio(
 
     buf = io.BytesIO()
     wb.save(buf)
-    buf.seek(0)
 
     filename = f"reporte_nivel_servicio_{fi.strftime('%Y%m%d')}_{(ff-timedelta(days=1)).strftime('%Y%m%d')}.xlsx"
-    return StreamingResponse(
-        buf,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    return buf.getvalue(), filename
 
 
-@router.get("/nivel-servicio/{sede_id}")
-def reporte_nivel_servicio(
+@router.get("/nivel-servicio/{sede_id}/exportar-excel")
+def exportar_excel_nivel_servicio(
     sede_id: str,
     fecha_inicio: Optional[str] = Query(None),
     fecha_fin: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    if fecha_inicio and fecha_fin:
-        fi = datetime.strptime(fecha_inicio, "%Y-%m-%d")
-        ff = datetime.strptime(fecha_fin, "%Y-%m-%d") + timedelta(days=1)
-    else:
-        ff = datetime.now()
-        fi = ff - timedelta(days=30)
+    fi, ff = _rango_fechas(fecha_inicio, fecha_fin)
+    try:
+        contenido, filename = _generar_excel_nivel_servicio(db, sede_id, fi, ff)
+    except ImportError:
+        return Response(content="openpyxl no instalado", status_code=500)
+
+    return StreamingResponse(
+        io.BytesIO(contenido),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+def _ticket_detalle(t, cliente_nombre: str) -> dict:
+    return {
+        "codigo": t.codigo,
+        "cliente_nombre": cliente_nombre,
+        "espera": round((t.hora_llamado - t.hora_creacion).total_seconds() / 60, 1) if t.hora_llamado else None,
+        "atencion": round((t.hora_cierre - t.hora_llamado).total_seconds() / 60, 1) if t.hora_cierre and t.hora_llamado else None,
+        "estado": t.estado,
+    }
 
+
+def _calcular_nivel_servicio(db: Session, sede_id: str, fi: datetime, ff: datetime, detalle: bool = False) -> dict:
     tickets = (
         db.query(models.Ticket)
         .filter(
@@ -181,12 +209,18 @@ def reporte_nivel_servicio(
         .all()
     )
 
-    # Cargar nombres de clientes
-    cliente_ids = list(set(t.cliente_id for t in tickets if t.cliente_id))
+    # Nombres de clientes solo si se pide el detalle embebido;
+    # el dashboard usa /nivel-servicio/{sede_id}/tickets paginado.
     clientes_map = {}
-    if cliente_ids:
-        clientes = db.query(models.Cliente).filter(models.Cliente.id.in_(cliente_ids)).all()
-        clientes_map = {c.id: f"{c.nombre} {getattr(c, 'apellido', '') or ''}".strip() for c in clientes}
+    if detalle:
+        cliente_ids = list(set(t.cliente_id for t in tickets if t.cliente_id))
+        if cliente_ids:
+            clientes = db.query(models.Cliente).filter(models.Cliente.id.in_(cliente_ids)).all()
+            clientes_map = {c.id: f"{c.nombre} {getattr(c, 'apellido', '') or ''}".strip() for c in clientes}
+
+    tickets_por_servicio = {}
+    for t in tickets:
+        tickets_por_servicio.setdefault(t.servicio_id, []).append(t)
 
     servicios = (
         db.query(models.Servicio)
@@ -202,7 +236,7 @@ def reporte_nivel_servicio(
 
     servicios_data = []
     for svc in servicios:
-        ts = [t for t in tickets if t.servicio_id == svc.id]
+        ts = tickets_por_servicio.get(svc.id, [])
         atendidos = [t for t in ts if t.estado == "cerrado"]
 
         esperas = [
@@ -237,17 +271,6 @@ def reporte_nivel_servicio(
         elif cumpl_espera is not None:
             nivel = cumpl_espera
 
-        tickets_con_cliente = [
-            {
-                "codigo": t.codigo,
-                "cliente_nombre": clientes_map.get(t.cliente_id, "") if t.cliente_id else "",
-                "espera": round((t.hora_llamado - t.hora_creacion).total_seconds() / 60, 1) if t.hora_llamado else None,
-                "atencion": round((t.hora_cierre - t.hora_llamado).total_seconds() / 60, 1) if t.hora_cierre and t.hora_llamado else None,
-                "estado": t.estado,
-            }
-            for t in ts
-        ]
-
         servicios_data.append({
             "servicio_id": svc.id,
             "servicio_nombre": svc.nombre,
@@ -262,27 +285,22 @@ def reporte_nivel_servicio(
             "desviacion_atencion": round(prom_atencion - meta_atencion, 1) if prom_atencion else None,
             "cumplimiento_atencion": cumpl_atencion,
             "nivel_servicio": nivel,
-            "tickets": tickets_con_cliente,
         })
+        if detalle:
+            servicios_data[-1]["tickets"] = [
+                _ticket_detalle(t, clientes_map.get(t.cliente_id, "") if t.cliente_id else "")
+                for t in ts
+            ]
 
     total_volumen = sum(s["volumen"] for s in servicios_data)
 
-    def ponderado(campo):
-        datos = [(s[campo], s["volumen"]) for s in servicios_data if s[campo] is not None]
-        if not datos:
-            return None
-        total = sum(v for _, v in datos)
-        if total == 0:
-            return None
-        return round(sum(v * v_vol for v, v_vol in datos) / total, 1)
-
     kpis = {
         "volumen_total": total_volumen,
-        "espera_promedio_global": ponderado("espera_real"),
-        "atencion_promedio_global": ponderado("atencion_real"),
-        "cumplimiento_espera_global": ponderado("cumplimiento_espera"),
-        "cumplimiento_atencion_global": ponderado("cumplimiento_atencion"),
-        "nivel_servicio_global": ponderado("nivel_servicio"),
+        "espera_promedio_global": _ponderado(servicios_data, "espera_real"),
+        "atencion_promedio_global": _ponderado(servicios_data, "atencion_real"),
+        "cumplimiento_espera_global": _ponderado(servicios_data, "cumplimiento_espera"),
+        "cumplimiento_atencion_global": _ponderado(servicios_data, "cumplimiento_atencion"),
+        "nivel_servicio_global": _ponderado(servicios_data, "nivel_servicio"),
     }
 
     return {
@@ -293,6 +311,81 @@ def reporte_nivel_servicio(
     }
 
 
+@router.get("/nivel-servicio/{sede_id}")
+def reporte_nivel_servicio(
+    sede_id: str,
+    fecha_inicio: Optional[str] = Query(None),
+    fecha_fin: Optional[str] = Query(None),
+    detalle: bool = Query(False, description="Incluir la lista completa de tickets por servicio"),
+    db: Session = Depends(get_read_db),
+):
+    fi, ff = _rango_fechas(fecha_inicio, fecha_fin)
+    return _calcular_nivel_servicio(db, sede_id, fi, ff, detalle)
+
+
+def _codificar_cursor(hora_creacion: datetime, ticket_id: str) -> str:
+    crudo = f"{hora_creacion.isoformat()}|{ticket_id}"
+    return base64.urlsafe_b64encode(crudo.encode("utf-8")).decode("ascii")
+
+
+def _decodificar_cursor(cursor: str):
+    try:
+        hora, ticket_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(hora), ticket_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+@router.get("/nivel-servicio/{sede_id}/tickets")
+def reporte_nivel_servicio_tickets(
+    sede_id: str,
+    servicio_id: str = Query(...),
+    fecha_inicio: Optional[str] = Query(None),
+    fecha_fin: Optional[str] = Query(None),
+    limite: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Detalle de tickets de un servicio, paginado por (hora_creacion, id).
+    El nombre del cliente se resuelve en el JOIN solo para la página pedida.
+    """
+    fi, ff = _rango_fechas(fecha_inicio, fecha_fin)
+    params = {"sid": sede_id, "svc": servicio_id, "fi": fi, "ff": ff, "lim": limite + 1}
+    filtro_cursor = ""
+    if cursor:
+        params["c_hora"], params["c_id"] = _decodificar_cursor(cursor)
+        filtro_cursor = "AND (t.hora_creacion, t.id) > (:c_hora, :c_id)"
+
+    rows = db.execute(text(f"""
+        SELECT t.id, t.codigo, t.estado, t.cliente_id,
+               t.hora_creacion, t.hora_llamado, t.hora_cierre,
+               TRIM(cl.nombre || ' ' || COALESCE(cl.apellido, '')) AS cliente_nombre
+        FROM tickets t
+        LEFT JOIN clientes cl ON cl.id = t.cliente_id
+        WHERE t.sede_id = :sid AND t.servicio_id = :svc
+          AND t.hora_creacion >= :fi AND t.hora_creacion < :ff
+          {filtro_cursor}
+        ORDER BY t.hora_creacion, t.id
+        LIMIT :lim
+    """), params).fetchall()
+
+    pagina = rows[:limite]
+    siguiente = None
+    if len(rows) > limite:
+        ultimo = pagina[-1]
+        siguiente = _codificar_cursor(ultimo.hora_creacion, ultimo.id)
+
+    return {
+        "servicio_id": servicio_id,
+        "tickets": [
+            {"id": t.id, "hora_creacion": t.hora_creacion, **_ticket_detalle(t, t.cliente_nombre or "")}
+            for t in pagina
+        ],
+        "siguiente_cursor": siguiente,
+    }
+
+
 @router.put("/metas/{sede_id}/{servicio_id}")
 def guardar_meta(
     sede_id: str,
@@ -320,140 +413,131 @@ def guardar_meta(
     return {"status": "ok", "meta_espera": meta_espera, "meta_atencion": meta_atencion}
 
 
-@router.get("/citas-programadas/{sede_id}")
-def reporte_citas_programadas(
-    sede_id: str,
-    db: Session = Depends(get_db),
-):
+def _riesgo(ocupacion: float) -> str:
+    return "rojo" if ocupacion >= 85 else "amarillo" if ocupacion >= 70 else "verde"
+
+
+def _calcular_citas_programadas(db: Session, sede_id: str) -> dict:
     hoy = date.today()
     hasta = hoy + timedelta(days=7)
+    params = {"sid": sede_id, "hoy": str(hoy), "hasta": str(hasta)}
 
-    citas = (
-        db.query(models.Cita, models.Servicio.nombre.label("svc_nombre"))
-        .join(models.Servicio, models.Cita.servicio_id == models.Servicio.id)
-        .filter(
-            models.Cita.sede_id == sede_id,
-            models.Cita.fecha >= str(hoy),
-            models.Cita.fecha <= str(hasta),
-            models.Cita.estado.in_(["agendada", "check_in", "en_espera"]),
-        )
-        .all()
-    )
+    # Detalle de citas activas de la semana, con servicio y cliente resueltos en el JOIN
+    citas_rows = db.execute(text("""
+        SELECT c.id, c.fecha, c.hora, c.estado,
+               s.nombre AS servicio_nombre,
+               NULLIF(TRIM(cl.nombre || ' ' || COALESCE(cl.apellido, '')), '') AS cliente_nombre
+        FROM citas c
+        JOIN servicios s ON s.id = c.servicio_id
+        LEFT JOIN clientes cl ON cl.id = c.cliente_id
+        WHERE c.sede_id = :sid
+          AND c.fecha >= :hoy AND c.fecha <= :hasta
+          AND c.estado IN ('agendada', 'check_in', 'en_espera')
+        ORDER BY c.fecha, c.hora
+    """), params).mappings().fetchall()
+
+    citas_por_dia = {}
+    for r in citas_rows:
+        citas_por_dia.setdefault(r["fecha"], []).append({
+            "id": r["id"],
+            "hora": str(r["hora"])[:5],
+            "cliente_nombre": r["cliente_nombre"] or "Anónimo",
+            "servicio_nombre": r["servicio_nombre"],
+            "estado": r["estado"],
+        })
 
-    # Cargar nombres de clientes
-    cliente_ids_citas = list(set(c.cliente_id for c, _ in citas if c.cliente_id))
-    clientes_map_citas = {}
-    if cliente_ids_citas:
-        clientes_citas = db.query(models.Cliente).filter(models.Cliente.id.in_(cliente_ids_citas)).all()
-        clientes_map_citas = {c.id: f"{c.nombre} {getattr(c, 'apellido', '') or ''}".strip() for c in clientes_citas}
+    # Capacidad por día de todos los calendarios activos de la sede
+    cap_rows = db.execute(text("""
+        SELECT d.fecha, COUNT(*) AS capacidad
+        FROM calendario_disponibilidades d
+        JOIN calendarios cal ON cal.id = d.calendario_id
+        WHERE cal.sede_id = :sid AND cal.activo = true
+          AND d.fecha >= :hoy AND d.fecha <= :hasta
+        GROUP BY d.fecha
+    """), params).fetchall()
+    disponibilidades_por_dia = {str(r[0]): r[1] for r in cap_rows}
+    capacidad_total = sum(disponibilidades_por_dia.values())
 
-    cal_rows = db.execute(
-        text("SELECT id FROM calendarios WHERE sede_id = :sid AND activo = true"),
-        {"sid": sede_id}
-    ).fetchall()
-    cal_ids = [r[0] for r in cal_rows]
-
-    capacidad_total = 0
-    disponibilidades_por_dia = {}
-    if cal_ids:
-        ids_str = ",".join(f"'{c}'" for c in cal_ids)
-        disp_rows = db.execute(
-            text(f"SELECT fecha FROM calendario_disponibilidades WHERE calendario_id IN ({ids_str}) AND fecha >= :hoy AND fecha <= :hasta"),
-            {"hoy": str(hoy), "hasta": str(hasta)}
-        ).fetchall()
-        capacidad_total = len(disp_rows)
-        for r in disp_rows:
-            fecha_str = str(r[0])
-            disponibilidades_por_dia[fecha_str] = disponibilidades_por_dia.get(fecha_str, 0) + 1
-
-    citas_total = len(citas)
+    citas_total = len(citas_rows)
     ocupacion_global = round(citas_total / capacidad_total * 100, 1) if capacidad_total > 0 else 0
 
     dias = {}
     for i in range(8):
-        d = hoy + timedelta(days=i)
-        fecha_str = str(d)
-        citas_dia = [c for c, _ in citas if c.fecha == fecha_str]
+        fecha_str = str(hoy + timedelta(days=i))
+        detalle = citas_por_dia.get(fecha_str, [])
         cap_dia = disponibilidades_por_dia.get(fecha_str, 0)
-        ocup = round(len(citas_dia) / cap_dia * 100, 1) if cap_dia > 0 else 0
+        ocup = round(len(detalle) / cap_dia * 100, 1) if cap_dia > 0 else 0
         dias[fecha_str] = {
             "fecha": fecha_str,
-            "citas": len(citas_dia),
+            "citas": len(detalle),
             "capacidad": cap_dia,
             "ocupacion": ocup,
-            "riesgo": "rojo" if ocup >= 85 else "amarillo" if ocup >= 70 else "verde",
-            "detalle_citas": [
-                {
-                    "id": c.id,
-                    "hora": str(c.hora)[:5],
-                    "cliente_nombre": clientes_map_citas.get(c.cliente_id, "Anónimo"),
-                    "servicio_nombre": next((sn for cc, sn in citas if cc.id == c.id), ""),
-                    "estado": c.estado,
-                }
-                for c in citas_dia
-            ],
+            "riesgo": _riesgo(ocup),
+            "detalle_citas": detalle,
         }
 
-    servicios = (
-        db.query(models.Servicio)
-        .filter(models.Servicio.sede_id == sede_id, models.Servicio.activo == True)
-        .all()
-    )
+    # Carga por servicio activo (incluye servicios sin citas)
+    svc_rows = db.execute(text("""
+        SELECT s.id, s.nombre, COUNT(c.id) AS citas
+        FROM servicios s
+        LEFT JOIN citas c
+               ON c.servicio_id = s.id
+              AND c.sede_id = :sid
+              AND c.fecha >= :hoy AND c.fecha <= :hasta
+              AND c.estado IN ('agendada', 'check_in', 'en_espera')
+        WHERE s.sede_id = :sid AND s.activo = true
+        GROUP BY s.id, s.nombre
+    """), params).fetchall()
 
     servicios_data = []
-    for svc in servicios:
-        citas_svc = [c for c, sn in citas if c.servicio_id == svc.id]
-        ocupacion_svc = round(len(citas_svc) / capacidad_total * 100, 1) if capacidad_total > 0 else 0
-        carga_diaria = round(len(citas_svc) / 7, 1)
+    for svc_id, svc_nombre, n_citas in svc_rows:
+        ocupacion_svc = round(n_citas / capacidad_total * 100, 1) if capacidad_total > 0 else 0
         servicios_data.append({
-            "servicio_id": svc.id,
-            "servicio_nombre": svc.nombre,
-            "citas_programadas": len(citas_svc),
+            "servicio_id": svc_id,
+            "servicio_nombre": svc_nombre,
+            "citas_programadas": n_citas,
             "capacidad_disponible": capacidad_total,
             "ocupacion": ocupacion_svc,
-            "carga_diaria_promedio": carga_diaria,
-            "riesgo": "rojo" if ocupacion_svc >= 85 else "amarillo" if ocupacion_svc >= 70 else "verde",
+            "carga_diaria_promedio": round(n_citas / 7, 1),
+            "riesgo": _riesgo(ocupacion_svc),
         })
 
     dia_max = max(dias.values(), key=lambda d: d["ocupacion"]) if dias else None
     svc_max = max(servicios_data, key=lambda s: s["citas_programadas"]) if servicios_data else None
 
-    hace_30 = hoy - timedelta(days=30)
-    citas_hist = (
-        db.query(models.Cita)
-        .filter(
-            models.Cita.sede_id == sede_id,
-            models.Cita.fecha >= str(hace_30),
-            models.Cita.fecha < str(hoy),
+    # Histórico de los últimos 30 días en un solo agregado. fecha es texto:
+    # solo se castea si es una de las 30 fechas válidas del rango, así una
+    # fila mal cargada no tumba el reporte (queda fuera del promedio)
+    hist = db.execute(text("""
+        WITH dias AS (
+            SELECT to_char(d, 'YYYY-MM-DD') AS valida
+            FROM generate_series(CAST(:desde AS DATE), CAST(:hoy AS DATE) - 1, INTERVAL '1 day') d
         )
-        .all()
-    )
-    total_hist = len(citas_hist)
-    canceladas = len([c for c in citas_hist if c.estado == "cancelada"])
-    no_show = len([c for c in citas_hist if c.estado == "no_asistio"])
-    reprogramadas = len([c for c in citas_hist if c.cita_original_id is not None])
-
-    tiempos_agendamiento = []
-    for c in citas_hist:
-        if c.created_at:
-            try:
-                fecha_cita = datetime.strptime(c.fecha, "%Y-%m-%d")
-                diff = (fecha_cita - c.created_at.replace(tzinfo=None)).days
-                if diff >= 0:
-                    tiempos_agendamiento.append(diff)
-            except Exception:
-                pass
+        SELECT
+            COUNT(*)                                               AS total,
+            COUNT(*) FILTER (WHERE estado = 'cancelada')           AS canceladas,
+            COUNT(*) FILTER (WHERE estado = 'no_asistio')          AS no_show,
+            COUNT(*) FILTER (WHERE cita_original_id IS NOT NULL)   AS reprogramadas,
+            AVG(anticipacion) FILTER (WHERE anticipacion >= 0)     AS dias_agendamiento
+        FROM (
+            SELECT estado, cita_original_id,
+                   CASE WHEN fecha IN (SELECT valida FROM dias)
+                        THEN FLOOR(EXTRACT(EPOCH FROM (fecha::timestamp - created_at)) / 86400)
+                   END AS anticipacion
+            FROM citas
+            WHERE sede_id = :sid AND fecha >= :desde AND fecha < :hoy
+        ) h
+    """), {"sid": sede_id, "desde": str(hoy - timedelta(days=30)), "hoy": str(hoy)}).mappings().fetchone()
 
+    total_hist = hist["total"] or 0
     metricas_historicas = {
         "demanda_promedio_diaria": round(total_hist / 30, 1) if total_hist else 0,
-        "tasa_cancelacion": round(canceladas / total_hist * 100, 1) if total_hist else 0,
-        "tasa_no_show": round(no_show / total_hist * 100, 1) if total_hist else 0,
-        "tasa_reprogramacion": round(reprogramadas / total_hist * 100, 1) if total_hist else 0,
-        "dias_promedio_agendamiento": round(sum(tiempos_agendamiento) / len(tiempos_agendamiento), 1) if tiempos_agendamiento else 0,
+        "tasa_cancelacion": round(hist["canceladas"] / total_hist * 100, 1) if total_hist else 0,
+        "tasa_no_show": round(hist["no_show"] / total_hist * 100, 1) if total_hist else 0,
+        "tasa_reprogramacion": round(hist["reprogramadas"] / total_hist * 100, 1) if total_hist else 0,
+        "dias_promedio_agendamiento": round(float(hist["dias_agendamiento"]), 1) if hist["dias_agendamiento"] is not None else 0,
     }
 
-    riesgo_global = "rojo" if ocupacion_global >= 85 else "amarillo" if ocupacion_global >= 70 else "verde"
-
     return {
         "fecha_inicio": str(hoy),
         "fecha_fin": str(hasta),
@@ -463,9 +547,558 @@ def reporte_citas_programadas(
             "ocupacion_global": ocupacion_global,
             "dia_mas_saturado": dia_max,
             "servicio_mas_demandado": svc_max["servicio_nombre"] if svc_max else None,
-            "riesgo_global": riesgo_global,
+            "riesgo_global": _riesgo(ocupacion_global),
         },
         "por_dia": list(dias.values()),
         "por_servicio": servicios_data,
         "metricas_historicas": metricas_historicas,
-    }
\ No newline at end of file
+    }
+
+
+@router.get("/citas-programadas/{sede_id}")
+def reporte_citas_programadas(
+    sede_id: str,
+    db: Session = Depends(get_read_db),
+):
+    return _calcular_citas_programadas(db, sede_id)
+
+
+# ============================================================
+# REPORTES CONSOLIDADOS POR EMPRESA
+# Cada sede se calcula en un pool de hilos acotado, con su propia
+# sesión, para no agotar el pool de conexiones (pool_size=5).
+# ============================================================
+
+REPORTES_EMPRESA_WORKERS = int(os.getenv("REPORTES_EMPRESA_WORKERS", "3"))
+_pool_empresa = ThreadPoolExecutor(
+    max_workers=REPORTES_EMPRESA_WORKERS,
+    thread_name_prefix="reportes-empresa",
+)
+
+
+def _sedes_de_empresa(db: Session, empresa_id: str) -> list:
+    sedes = (
+        db.query(models.Sede.id, models.Sede.nombre)
+        .filter(models.Sede.empresa_id == empresa_id)
+        .order_by(models.Sede.nombre.asc())
+        .all()
+    )
+    if not sedes:
+        raise HTTPException(status_code=404, detail="Empresa sin sedes o no encontrada")
+    return sedes
+
+
+def _calcular_por_sede(sedes: list, calcular) -> list:
+    """
+    Ejecuta `calcular(db, sede_id)` para cada sede en el pool y devuelve
+    [(sede_id, sede_nombre, resultado | None, error | None, tiempo_ms)].
+    """
+    def tarea(sede_id):
+        inicio = time.perf_counter()
+        db = sesion_lectura()
+        try:
+            return calcular(db, sede_id), None, round((time.perf_counter() - inicio) * 1000, 1)
+        except HTTPException as e:
+            return None, e.detail, round((time.perf_counter() - inicio) * 1000, 1)
+        except Exception as e:
+            # El detalle queda en el log; al cliente solo un mensaje genérico
+            print(f"Reporte empresa: error en sede {sede_id}: {e!r}")
+            return None, "No se pudo calcular el reporte de esta sede", round((time.perf_counter() - inicio) * 1000, 1)
+        finally:
+            db.close()
+
+    futuros = [(s.id, s.nombre, _pool_empresa.submit(tarea, s.id)) for s in sedes]
+    return [(sid, nombre, *fut.result()) for sid, nombre, fut in futuros]
+
+
+@router.get("/empresa/{empresa_id}/nivel-servicio")
+def reporte_empresa_nivel_servicio(
+    empresa_id: str,
+    fecha_inicio: Optional[str] = Query(None),
+    fecha_fin: Optional[str] = Query(None),
+    db: Session = Depends(get_read_db),
+):
+    fi, ff = _rango_fechas(fecha_inicio, fecha_fin)
+    sedes = _sedes_de_empresa(db, empresa_id)
+    db.close()  # liberar la conexión antes de ocupar el pool
+
+    inicio = time.perf_counter()
+    resultados = _calcular_por_sede(sedes, lambda s_db, sid: _calcular_nivel_servicio(s_db, sid, fi, ff))
+
+    por_sede = []
+    for sede_id, sede_nombre, res, error, tiempo_ms in resultados:
+        item = {"sede_id": sede_id, "sede_nombre": sede_nombre, "tiempo_ms": tiempo_ms}
+        if error:
+            item["error"] = error
+        else:
+            item["kpis"] = res["kpis"]
+        por_sede.append(item)
+
+    kpis_sedes = [s["kpis"] for s in por_sede if "kpis" in s]
+    kpis = {
+        "volumen_total": sum(k["volumen_total"] for k in kpis_sedes),
+        "espera_promedio_global": _ponderado(kpis_sedes, "espera_promedio_global", "volumen_total"),
+        "atencion_promedio_global": _ponderado(kpis_sedes, "atencion_promedio_global", "volumen_total"),
+        "cumplimiento_espera_global": _ponderado(kpis_sedes, "cumplimiento_espera_global", "volumen_total"),
+        "cumplimiento_atencion_global": _ponderado(kpis_sedes, "cumplimiento_atencion_global", "volumen_total"),
+        "nivel_servicio_global": _ponderado(kpis_sedes, "nivel_servicio_global", "volumen_total"),
+    }
+
+    return {
+        "empresa_id": empresa_id,
+        "fecha_inicio": fi.strftime("%Y-%m-%d"),
+        "fecha_fin": (ff - timedelta(days=1)).strftime("%Y-%m-%d"),
+        "kpis": kpis,
+        "por_sede": por_sede,
+        "tiempo_total_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
+
+
+@router.get("/empresa/{empresa_id}/citas-programadas")
+def reporte_empresa_citas_programadas(
+    empresa_id: str,
+    db: Session = Depends(get_read_db),
+):
+    sedes = _sedes_de_empresa(db, empresa_id)
+    db.close()
+
+    inicio = time.perf_counter()
+    resultados = _calcular_por_sede(sedes, _calcular_citas_programadas)
+
+    por_sede = []
+    dias = {}
+    historicos = []
+    for sede_id, sede_nombre, res, error, tiempo_ms in resultados:
+        item = {"sede_id": sede_id, "sede_nombre": sede_nombre, "tiempo_ms": tiempo_ms}
+        if error:
+            item["error"] = error
+            por_sede.append(item)
+            continue
+        k = res["kpis"]
+        item.update({
+            "citas_total": k["citas_total"],
+            "capacidad_total": k["capacidad_total"],
+            "ocupacion_global": k["ocupacion_global"],
+            "riesgo_global": k["riesgo_global"],
+            "servicio_mas_demandado": k["servicio_mas_demandado"],
+        })
+        por_sede.append(item)
+        for d in res["por_dia"]:
+            acc = dias.setdefault(d["fecha"], {"fecha": d["fecha"], "citas": 0, "capacidad": 0})
+            acc["citas"] += d["citas"]
+            acc["capacidad"] += d["capacidad"]
+        historicos.append(res["metricas_historicas"])
+
+    for d in dias.values():
+        d["ocupacion"] = round(d["citas"] / d["capacidad"] * 100, 1) if d["capacidad"] > 0 else 0
+        d["riesgo"] = _riesgo(d["ocupacion"])
+
+    citas_total = sum(s.get("citas_total", 0) for s in por_sede)
+    capacidad_total = sum(s.get("capacidad_total", 0) for s in por_sede)
+    ocupacion_global = round(citas_total / capacidad_total * 100, 1) if capacidad_total > 0 else 0
+    sede_max = max((s for s in por_sede if "citas_total" in s), key=lambda s: s["ocupacion_global"], default=None)
+
+    # Tasas históricas ponderadas por la demanda de cada sede
+    metricas_historicas = {
+        "demanda_promedio_diaria": round(sum(h["demanda_promedio_diaria"] for h in historicos), 1),
+    }
+    for campo in ("tasa_cancelacion", "tasa_no_show", "tasa_reprogramacion", "dias_promedio_agendamiento"):
+        metricas_historicas[campo] = _ponderado(historicos, campo, "demanda_promedio_diaria") or 0
+
+    return {
+        "empresa_id": empresa_id,
+        "fecha_inicio": str(date.today()),
+        "fecha_fin": str(date.today() + timedelta(days=7)),
+        "kpis": {
+            "citas_total": citas_total,
+            "capacidad_total": capacidad_total,
+            "ocupacion_global": ocupacion_global,
+            "sede_mas_saturada": sede_max["sede_nombre"] if sede_max else None,
+            "riesgo_global": _riesgo(ocupacion_global),
+        },
+        "por_dia": sorted(dias.values(), key=lambda d: d["fecha"]),
+        "por_sede": por_sede,
+        "metricas_historicas": metricas_historicas,
+        "tiempo_total_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
+
+
+# ============================================================
+# JOBS DE REPORTES EN SEGUNDO PLANO
+# Para rangos largos que superan el timeout del proxy: se encola
+# el cálculo, el cliente hace polling y luego descarga el archivo.
+# ============================================================
+
+class ReporteJobIn(BaseModel):
+    tipo: str                       # nivel_servicio | nivel_servicio_excel | citas_programadas
+    sede_id: str
+    fecha_inicio: Optional[str] = None
+    fecha_fin: Optional[str] = None
+    detalle: bool = False           # solo nivel_servicio: incluir tickets por servicio
+
+
+def _job_out(meta: dict) -> dict:
+    out = {k: meta[k] for k in ("id", "tipo", "params", "estado", "creado", "terminado", "tamano", "error")}
+    out["descarga"] = f"/reportes/jobs/{meta['id']}/descarga" if meta["estado"] == "listo" else None
+    return out
+
+
+@router.post("/jobs", status_code=202)
+def crear_job_reporte(data: ReporteJobIn):
+    fi, ff = _rango_fechas(data.fecha_inicio, data.fecha_fin)
+    sede_id = data.sede_id
+    etiqueta = f"{fi.strftime('%Y%m%d')}_{(ff - timedelta(days=1)).strftime('%Y%m%d')}"
+
+    if data.tipo == "nivel_servicio":
+        def generar(db):
+            res = _calcular_nivel_servicio(db, sede_id, fi, ff, data.detalle)
+            return json.dumps(res, default=str).encode("utf-8"), "json", "application/json", f"nivel_servicio_{etiqueta}.json"
+    elif data.tipo == "nivel_servicio_excel":
+        def generar(db):
+            contenido, filename = _generar_excel_nivel_servicio(db, sede_id, fi, ff)
+            return contenido, "xlsx", XLSX_MEDIA_TYPE, filename
+    elif data.tipo == "citas_programadas":
+        def generar(db):
+            res = _calcular_citas_programadas(db, sede_id)
+            return json.dumps(res, default=str).encode("utf-8"), "json", "application/json", f"citas_programadas_{date.today()}.json"
+    else:
+        raise HTTPException(status_code=400, detail=f"Tipo de reporte no soportado: {data.tipo}")
+
+    params = {"sede_id": sede_id}
+    if data.tipo != "citas_programadas":
+        params.update({"fecha_inicio": fi.strftime("%Y-%m-%d"), "fecha_fin": (ff - timedelta(days=1)).strftime("%Y-%m-%d")})
+    if data.tipo == "nivel_servicio":
+        params["detalle"] = data.detalle
+
+    return _job_out(reportes_jobs_service.encolar(data.tipo, params, generar))
+
+
+@router.get("/jobs/{job_id}")
+def estado_job_reporte(job_id: str):
+    meta = reportes_jobs_service.obtener_job(job_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Job no encontrado o vencido")
+    return _job_out(meta)
+
+
+@router.get("/jobs/{job_id}/descarga")
+def descargar_job_reporte(job_id: str):
+    meta = reportes_jobs_service.obtener_job(job_id)
+    if not meta:
+        raise HTTPException(status_code=404, detail="Job no encontrado o vencido")
+    if meta["estado"] != "listo":
+        raise HTTPException(status_code=409, detail=f"El job está en estado '{meta['estado']}'")
+
+    # FileResponse atiende Range / If-Range y responde 206 con el tramo pedido
+    return FileResponse(
+        reportes_jobs_service.ruta_artefacto(meta),
+        media_type=meta["media_type"],
+        filename=meta["nombre_descarga"],
+    )
+
+
+# ============================================================
+# PERFIL DE DEMANDA: llegadas por día de semana × franja horaria
+# ============================================================
+
+DIAS_SEMANA = ["lunes", "martes", "miercoles", "jueves", "viernes", "sabado", "domingo"]
+
+
+def _ocurrencias_por_dia_semana(fi: datetime, ff: datetime) -> list:
+    """Cuántas veces aparece cada día de semana (lunes=0) en el rango [fi, ff)."""
+    ocurrencias = [0] * 7
+    d = fi.date()
+    while d < ff.date() or (d == ff.date() and ff.time() != datetime.min.time()):
+        ocurrencias[d.weekday()] += 1
+        d += timedelta(days=1)
+    return ocurrencias
+
+
+def _calcular_demanda(db: Session, sede_id: str, fi: datetime, ff: datetime, intervalo: int) -> dict:
+    n_franjas = 24 * 60 // intervalo
+    params = {"sid": sede_id, "fi": fi, "ff": ff, "intervalo": intervalo}
+
+    llegadas_rows = db.execute(text("""
+        SELECT servicio_id,
+               EXTRACT(ISODOW FROM hora_creacion)::int AS dow,
+               (EXTRACT(HOUR FROM hora_creacion)::int * 60
+                + EXTRACT(MINUTE FROM hora_creacion)::int) / :intervalo AS franja,
+               COUNT(*) AS llegadas,
+               AVG(EXTRACT(EPOCH FROM (hora_llamado - hora_creacion)) / 60) AS espera
+        FROM tickets
+        WHERE sede_id = :sid AND hora_creacion >= :fi AND hora_creacion < :ff
+        GROUP BY 1, 2, 3
+    """), params).fetchall()
+
+    # Puestos abiertos: pares (día, puesto) distintos que llamaron en la franja
+    puestos_rows = db.execute(text("""
+        SELECT servicio_id,
+               EXTRACT(ISODOW FROM hora_llamado)::int AS dow,
+               (EXTRACT(HOUR FROM hora_llamado)::int * 60
+                + EXTRACT(MINUTE FROM hora_llamado)::int) / :intervalo AS franja,
+               COUNT(DISTINCT CAST(hora_llamado::date AS VARCHAR) || '|' || puesto_nombre) AS puestos
+        FROM tickets
+        WHERE sede_id = :sid AND hora_llamado >= :fi AND hora_llamado < :ff
+          AND puesto_nombre IS NOT NULL AND puesto_nombre <> ''
+        GROUP BY 1, 2, 3
+    """), params).fetchall()
+
+    servicios = (
+        db.query(models.Servicio.id, models.Servicio.nombre)
+        .filter(models.Servicio.sede_id == sede_id, models.Servicio.activo == True)
+        .all()
+    )
+
+    ocurrencias = _ocurrencias_por_dia_semana(fi, ff)
+
+    def matriz():
+        return [[0] * n_franjas for _ in range(7)]
+
+    por_servicio = {
+        s.id: {
+            "servicio_id": s.id,
+            "servicio_nombre": s.nombre,
+            "llegadas": matriz(),
+            "llegadas_promedio": matriz(),
+            "espera_promedio": [[None] * n_franjas for _ in range(7)],
+            "puestos_promedio": matriz(),
+        }
+        for s in servicios
+    }
+    total = matriz()
+
+    for svc_id, dow, franja, llegadas, espera in llegadas_rows:
+        d = dow - 1
+        total[d][franja] += llegadas
+        svc = por_servicio.get(svc_id)
+        if not svc:
+            continue
+        svc["llegadas"][d][franja] = llegadas
+        svc["llegadas_promedio"][d][franja] = round(llegadas / ocurrencias[d], 2) if ocurrencias[d] else 0
+        svc["espera_promedio"][d][franja] = round(float(espera), 1) if espera is not None else None
+
+    for svc_id, dow, franja, puestos in puestos_rows:
+        svc = por_servicio.get(svc_id)
+        d = dow - 1
+        if svc and ocurrencias[d]:
+            svc["puestos_promedio"][d][franja] = round(puestos / ocurrencias[d], 2)
+
+    franjas = [f"{(i * intervalo) // 60:02d}:{(i * intervalo) % 60:02d}" for i in range(n_franjas)]
+
+    return {
+        "fecha_inicio": fi.strftime("%Y-%m-%d"),
+        "fecha_fin": (ff - timedelta(days=1)).strftime("%Y-%m-%d"),
+        "intervalo_minutos": intervalo,
+        "dias": DIAS_SEMANA,
+        "franjas": franjas,
+        "ocurrencias_dia": ocurrencias,
+        "total_llegadas": total,
+        "servicios": list(por_servicio.values()),
+    }
+
+
+@router.get("/demanda/{sede_id}")
+def reporte_demanda(
+    sede_id: str,
+    fecha_inicio: Optional[str] = Query(None),
+    fecha_fin: Optional[str] = Query(None),
+    intervalo: int = Query(60, description="Minutos por franja: 60 o 15"),
+    db: Session = Depends(get_read_db),
+):
+    if intervalo not in (15, 60):
+        raise HTTPException(status_code=400, detail="intervalo debe ser 15 o 60")
+    fi, ff = _rango_fechas(fecha_inicio, fecha_fin)
+    return _calcular_demanda(db, sede_id, fi, ff, intervalo)
+
+
+# ============================================================
+# DIMENSIONAMIENTO DE PUESTOS (Erlang-C)
+# Recomienda puestos por día × hora para cumplir meta_espera
+# a partir de las llegadas y tiempos de atención históricos.
+# ============================================================
+
+@router.get("/dimensionamiento/{sede_id}")
+def reporte_dimensionamiento(
+    sede_id: str,
+    fecha_inicio: Optional[str] = Query(None),
+    fecha_fin: Optional[str] = Query(None),
+    nivel_objetivo: float = Query(0.8, gt=0, lt=1, description="Fracción de clientes atendidos dentro de meta_espera"),
+    max_puestos: int = Query(30, ge=1, le=200),
+    db: Session = Depends(get_read_db),
+):
+    import numpy as np
+    from ..services.dimensionamiento_service import erlang_c_recomendacion
+
+    fi, ff = _rango_fechas(fecha_inicio, fecha_fin)
+    demanda = _calcular_demanda(db, sede_id, fi, ff, 60)
+    servicios = demanda["servicios"]
+    if not servicios:
+        return {**{k: demanda[k] for k in ("fecha_inicio", "fecha_fin", "dias", "franjas")}, "servicios": [], "total_puestos": []}
+
+    aht_rows = db.execute(text("""
+        SELECT servicio_id, AVG(EXTRACT(EPOCH FROM (hora_cierre - hora_llamado)) / 60) AS aht
+        FROM tickets
+        WHERE sede_id = :sid AND hora_creacion >= :fi AND hora_creacion < :ff
+          AND estado = 'cerrado' AND hora_llamado IS NOT NULL AND hora_cierre IS NOT NULL
+        GROUP BY servicio_id
+    """), {"sid": sede_id, "fi": fi, "ff": ff}).fetchall()
+    aht_map = {r[0]: float(r[1]) for r in aht_rows if r[1] and r[1] > 0}
+
+    metas_rows = db.execute(
+        text("SELECT servicio_id, meta_espera, meta_atencion FROM metas_servicio_sede WHERE sede_id = :sid"),
+        {"sid": sede_id}
+    ).fetchall()
+    metas_map = {r[0]: {"meta_espera": r[1], "meta_atencion": r[2]} for r in metas_rows}
+
+    # Mismos valores por defecto que el reporte de nivel de servicio;
+    # sin historial de atención se usa meta_atencion como tiempo medio.
+    metas_espera, ahts = [], []
+    for s in servicios:
+        meta = metas_map.get(s["servicio_id"], {})
+        metas_espera.append(meta.get("meta_espera") or 15)
+        ahts.append(aht_map.get(s["servicio_id"]) or meta.get("meta_atencion") or 20)
+
+    inicio = time.perf_counter()
+    llegadas = np.array([s["llegadas_promedio"] for s in servicios], dtype=float)
+    puestos, nivel, espera = erlang_c_recomendacion(
+        llegadas, np.array(ahts), np.array(metas_espera), nivel_objetivo, max_puestos,
+    )
+    tiempo_calculo_ms = round((time.perf_counter() - inicio) * 1000, 2)
+
+    def a_lista(m):
+        return [[None if np.isnan(v) else round(float(v), 3) for v in fila] for fila in m]
+
+    servicios_data = []
+    for i, s in enumerate(servicios):
+        servicios_data.append({
+            "servicio_id": s["servicio_id"],
+            "servicio_nombre": s["servicio_nombre"],
+            "meta_espera": metas_espera[i],
+            "atencion_promedio": round(ahts[i], 1),
+            "llegadas_hora": s["llegadas_promedio"],
+            "puestos_actuales": s["puestos_promedio"],
+            "puestos_recomendados": puestos[i].tolist(),
+            "nivel_servicio_esperado": a_lista(nivel[i]),
+            "espera_estimada": a_lista(espera[i]),
+        })
+
+    return {
+        "fecha_inicio": demanda["fecha_inicio"],
+        "fecha_fin": demanda["fecha_fin"],
+        "nivel_objetivo": nivel_objetivo,
+        "dias": demanda["dias"],
+        "franjas": demanda["franjas"],
+        "servicios": servicios_data,
+        # Puestos dedicados por servicio: el total es la suma (-1 = no alcanza max_puestos)
+        "total_puestos": np.where((puestos < 0).any(axis=0), -1, puestos.clip(min=0).sum(axis=0)).tolist(),
+        "tiempo_calculo_ms": tiempo_calculo_ms,
+    }
+
+
+# ============================================================
+# PRODUCTIVIDAD POR PUESTO
+# Un solo query con LAG() sobre los llamados de cada puesto/día:
+# atenciones, percentiles, tiempos ociosos entre llamados y utilización.
+# ============================================================
+
+def _num(v, decimales=1):
+    return round(float(v), decimales) if v is not None else None
+
+
+@router.get("/puestos/{sede_id}")
+def reporte_puestos(
+    sede_id: str,
+    fecha_inicio: Optional[str] = Query(None),
+    fecha_fin: Optional[str] = Query(None),
+    db: Session = Depends(get_read_db),
+):
+    fi, ff = _rango_fechas(fecha_inicio, fecha_fin)
+
+    rows = db.execute(text("""
+        WITH llamados AS (
+            SELECT
+                puesto_nombre,
+                hora_llamado::date AS dia,
+                hora_llamado,
+                hora_cierre,
+                estado,
+                EXTRACT(EPOCH FROM (hora_cierre - hora_llamado)) / 60 AS atencion,
+                EXTRACT(EPOCH FROM (hora_llamado - LAG(COALESCE(hora_cierre, hora_llamado)) OVER (
+                    PARTITION BY puesto_nombre, hora_llamado::date
+                    ORDER BY hora_llamado
+                ))) / 60 AS ocio
+            FROM tickets
+            WHERE sede_id = :sid
+              AND hora_llamado >= :fi AND hora_llamado < :ff
+              AND puesto_nombre IS NOT NULL AND puesto_nombre <> ''
+        )
+        SELECT
+            puesto_nombre,
+            dia,
+            COUNT(*)                                                 AS llamados,
+            COUNT(*) FILTER (WHERE estado = 'cerrado')               AS atendidos,
+            COUNT(atencion)                                          AS n_atencion,
+            AVG(atencion)                                            AS atencion_promedio,
+            PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY atencion)    AS atencion_p50,
+            PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY atencion)    AS atencion_p90,
+            COUNT(ocio)                                              AS n_ocio,
+            AVG(GREATEST(ocio, 0)) FILTER (WHERE ocio IS NOT NULL)   AS ocio_promedio,
+            MAX(ocio)                                                AS ocio_maximo,
+            COALESCE(SUM(atencion), 0)                               AS minutos_atencion,
+            EXTRACT(EPOCH FROM (
+                MAX(COALESCE(hora_cierre, hora_llamado)) - MIN(hora_llamado)
+            )) / 60                                                  AS minutos_turno
+        FROM llamados
+        GROUP BY puesto_nombre, dia
+        ORDER BY puesto_nombre, dia
+    """), {"sid": sede_id, "fi": fi, "ff": ff}).mappings().fetchall()
+
+    por_puesto = {}
+    for r in rows:
+        minutos_turno = float(r["minutos_turno"] or 0)
+        minutos_atencion = float(r["minutos_atencion"] or 0)
+        p = por_puesto.setdefault(r["puesto_nombre"], {
+            "puesto_nombre": r["puesto_nombre"],
+            "llamados": 0,
+            "atendidos": 0,
+            "_n_atencion": 0,
+            "_n_ocio": 0,
+            "_suma_ocio": 0.0,
+            "minutos_atencion": 0.0,
+            "minutos_turno": 0.0,
+            "dias": [],
+        })
+        p["llamados"] += r["llamados"]
+        p["atendidos"] += r["atendidos"]
+        p["_n_atencion"] += r["n_atencion"]
+        p["_n_ocio"] += r["n_ocio"]
+        p["_suma_ocio"] += float(r["ocio_promedio"] or 0) * r["n_ocio"]
+        p["minutos_atencion"] += minutos_atencion
+        p["minutos_turno"] += minutos_turno
+        p["dias"].append({
+            "fecha": str(r["dia"]),
+            "llamados": r["llamados"],
+            "atendidos": r["atendidos"],
+            "atencion_promedio": _num(r["atencion_promedio"]),
+            "atencion_p50": _num(r["atencion_p50"]),
+            "atencion_p90": _num(r["atencion_p90"]),
+            "ocio_promedio": _num(r["ocio_promedio"]),
+            "ocio_maximo": _num(r["ocio_maximo"]),
+            "utilizacion": round(minutos_atencion / minutos_turno * 100, 1) if minutos_turno > 0 else None,
+        })
+
+    puestos_data = []
+    for p in por_puesto.values():
+        n_atencion, n_ocio, suma_ocio = p.pop("_n_atencion"), p.pop("_n_ocio"), p.pop("_suma_ocio")
+        p["atencion_promedio"] = round(p["minutos_atencion"] / n_atencion, 1) if n_atencion else None
+        p["ocio_promedio"] = round(suma_ocio / n_ocio, 1) if n_ocio else None
+        p["utilizacion"] = round(p["minutos_atencion"] / p["minutos_turno"] * 100, 1) if p["minutos_turno"] > 0 else None
+        p["minutos_atencion"] = round(p["minutos_atencion"], 1)
+        p["minutos_turno"] = round(p["minutos_turno"], 1)
+        puestos_data.append(p)
+
+    return {
+        "fecha_inicio": fi.strftime("%Y-%m-%d"),
+        "fecha_fin": (ff - timedelta(days=1)).strftime("%Y-%m-%d"),
+        "puestos": puestos_data,
+    }
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from ..database import SessionLocal
 from .. import models, schemas
+from ..services import bootstrap_service, perfilador
+from ..services.version_sede import etag_condicional
 
-router = APIRouter(prefix="/sedes", tags=["Sedes"])
+router = APIRouter(prefix="/sedes", tags=["Sedes"], route_class=perfilador.RutaPerfilada)
 
 def get_db():
     db = SessionLocal()
@@ -43,6 +45,20 @@ def get_sedes_por_empresa(empresa_id: str, db: Session = Depends(get_db)):
     return db.query(models.Sede).filter(models.Sede.empresa_id == empresa_id).all()
 
 
+# ============================================================
+# GET: BOOTSTRAP DE SEDE (consolas y kioscos al arrancar)
+# ============================================================
+
+@router.get("/{sede_id}/bootstrap", response_model=schemas.SedeBootstrap)
+def get_bootstrap_sede(
+    sede_id: str,
+    db: Session = Depends(get_db),
+    cache: dict = Depends(etag_condicional(get_db)),
+):
+    contenido = bootstrap_service.obtener(db, sede_id, cache["ETag"])
+    return Response(content=contenido, media_type="application/json", headers=cache)
+
+
 # ============================================================
 # POST: CREAR SEDE
 # ============================================================
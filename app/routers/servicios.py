@@ -3,8 +3,10 @@ from sqlalchemy.orm import Session
 from datetime import datetime, date
 from ..database import SessionLocal
 from .. import models, schemas
+from ..services import perfilador
+from ..services.version_sede import etag_condicional
 
-router = APIRouter(prefix="/servicios", tags=["Servicios"])
+router = APIRouter(prefix="/servicios", tags=["Servicios"], route_class=perfilador.RutaPerfilada)
 
 def get_db():
     db = SessionLocal()
@@ -28,7 +30,11 @@ def get_servicios(sede_id: str | None = None, db: Session = Depends(get_db)):
 # GET: LISTAR SERVICIOS POR SEDE
 # ============================================================
 
-@router.get("/sede/{sede_id}", response_model=list[schemas.ServicioOut])
+@router.get(
+    "/sede/{sede_id}",
+    response_model=list[schemas.ServicioOut],
+    dependencies=[Depends(etag_condicional(get_db))],
+)
 def get_servicios_por_sede(sede_id: str, db: Session = Depends(get_db)):
     return db.query(models.Servicio).filter(models.Servicio.sede_id == sede_id).all()
 
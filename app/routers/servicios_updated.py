@@ -3,9 +3,10 @@ from sqlalchemy.orm import Session
 from datetime import datetime, date
 from ..database import SessionLocal
 from .. import models, schemas
+from ..services import perfilador
 from typing import Optional
 
-router = APIRouter(prefix="/servicios", tags=["Servicios"])
+router = APIRouter(prefix="/servicios", tags=["Servicios"], route_class=perfilador.RutaPerfilada)
 
 def get_db():
     db = SessionLocal()
@@ -1,12 +1,35 @@
 """
 Router: /stats
 Contadores de uso por sede y tipo de app (consola, kiosco, pantalla).
+Los incrementos se acumulan en memoria (app/services/stats_service.py)
+y se vuelcan a app_stats y app_stats_bucket periódicamente.
 """
-from fastapi import APIRouter
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import text
+from sqlalchemy.orm import Session
 from app.database import SessionLocal
+from app.services import perfilador, stats_service
+
+router = APIRouter(prefix="/stats", tags=["stats"], route_class=perfilador.RutaPerfilada)
 
-router = APIRouter(prefix="/stats", tags=["stats"])
+APP_TYPES = ("consola", "kiosco", "pantalla")
+
+# Ancho de cada punto y máximo de días consultables por granularidad
+GRANULARIDADES = {
+    "hora": (timedelta(hours=1), 31),
+    "dia":  (timedelta(days=1), 400),
+}
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
 
 
 @router.post("/{sede_id}/{app_type}")
@@ -14,49 +37,98 @@ def incrementar_contador(sede_id: str, app_type: str):
     """
     Incrementa el contador de uso para una sede y tipo de app.
     app_type: 'consola' | 'kiosco' | 'pantalla'
+    No toca la base: devuelve el valor acumulado en el buffer.
     """
-    db = SessionLocal()
-    try:
-        db.execute(text("""
-            INSERT INTO app_stats (sede_id, app_type, contador)
-            VALUES (:sede_id, :app_type, 1)
-            ON CONFLICT (sede_id, app_type)
-            DO UPDATE SET contador = app_stats.contador + 1,
-                          updated_at = NOW()
-        """), {"sede_id": sede_id, "app_type": app_type})
-        db.commit()
-
-        row = db.execute(text("""
-            SELECT contador FROM app_stats
-            WHERE sede_id = :sede_id AND app_type = :app_type
-        """), {"sede_id": sede_id, "app_type": app_type}).fetchone()
-
-        return {"sede_id": sede_id, "app_type": app_type, "contador": row[0] if row else 1}
-    except Exception as e:
-        db.rollback()
-        return {"error": str(e)}
-    finally:
-        db.close()
+    contador = stats_service.incrementar(sede_id, app_type)
+    return {"sede_id": sede_id, "app_type": app_type, "contador": contador}
 
 
 @router.get("/{sede_id}")
-def obtener_contadores(sede_id: str):
+def obtener_contadores(sede_id: str, db: Session = Depends(get_db)):
     """
-    Devuelve todos los contadores de una sede.
+    Devuelve todos los contadores de una sede (BD + incrementos pendientes).
     { "consola": 12, "kiosco": 4, "pantalla": 7 }
     """
-    db = SessionLocal()
+    en_bd = {}
     try:
         rows = db.execute(text("""
             SELECT app_type, contador FROM app_stats
             WHERE sede_id = :sede_id
         """), {"sede_id": sede_id}).fetchall()
+        en_bd = {row[0]: row[1] for row in rows}
+    except Exception:
+        pass
+    # Después de leer la BD: el lote en vuelo cuenta una sola vez (ver flush)
+    result = {app: 0 for app in APP_TYPES}
+    result.update(stats_service.contadores_de_sede(sede_id, en_bd))
+    return result
 
-        result = {"consola": 0, "kiosco": 0, "pantalla": 0}
-        for row in rows:
-            result[row[0]] = row[1]
-        return result
-    except Exception as e:
-        return {"consola": 0, "kiosco": 0, "pantalla": 0}
-    finally:
-        db.close()
+
+# ============================================================
+# SERIE TEMPORAL DE USO
+# ============================================================
+@router.get("/{sede_id}/serie")
+def serie_contadores(
+    sede_id: str,
+    desde: Optional[str] = Query(None),   # YYYY-MM-DD
+    hasta: Optional[str] = Query(None),   # YYYY-MM-DD (inclusive)
+    granularidad: str = Query("dia"),     # 'hora' | 'dia'
+    db: Session = Depends(get_db),
+):
+    """
+    Uso por bucket de tiempo, con ceros en los huecos (kiosco apagado).
+    Por defecto los últimos 7 días. 'hora' solo cubre el período aún no
+    compactado (STATS_RETENCION_HORAS_DIAS); 'dia' suma horas y días.
+    """
+    if granularidad not in GRANULARIDADES:
+        raise HTTPException(status_code=400, detail="granularidad debe ser 'hora' o 'dia'")
+    paso, max_dias = GRANULARIDADES[granularidad]
+
+    try:
+        fin = (datetime.strptime(hasta, "%Y-%m-%d") if hasta
+               else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0))
+        ini = datetime.strptime(desde, "%Y-%m-%d") if desde else fin - timedelta(days=6)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Fechas con formato YYYY-MM-DD")
+    fin += timedelta(days=1)
+    if ini >= fin:
+        raise HTTPException(status_code=400, detail="'desde' debe ser anterior o igual a 'hasta'")
+    if (fin - ini).days > max_dias:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Rango máximo para granularidad '{granularidad}': {max_dias} días",
+        )
+
+    granos = ["hora"] if granularidad == "hora" else ["hora", "dia"]
+    rows = db.execute(text("""
+        SELECT date_trunc(:trunc, inicio) AS bucket, app_type, SUM(contador)
+        FROM app_stats_bucket
+        WHERE sede_id = :sede_id
+          AND granularidad = ANY(:granos)
+          AND inicio >= :ini AND inicio < :fin
+        GROUP BY 1, 2
+    """), {
+        "trunc": "hour" if granularidad == "hora" else "day",
+        "sede_id": sede_id, "granos": granos, "ini": ini, "fin": fin,
+    }).fetchall()
+
+    valores = {}
+    for bucket, app_type, n in rows:
+        valores.setdefault(bucket, {})[app_type] = int(n)
+
+    serie = []
+    t = ini
+    while t < fin:
+        punto = {"inicio": t.isoformat()}
+        punto.update({app: 0 for app in APP_TYPES})
+        punto.update(valores.get(t, {}))
+        serie.append(punto)
+        t += paso
+
+    return {
+        "sede_id": sede_id,
+        "granularidad": granularidad,
+        "desde": ini.date().isoformat(),
+        "hasta": (fin - timedelta(days=1)).date().isoformat(),
+        "serie": serie,
+    }
@@ -1,13 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, Body
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
-from ..database import SessionLocal
+from ..database import AsyncSessionLocal, SessionLocal, get_async_db, get_read_db
 from .. import models, schemas
-from sqlalchemy import func
+from ..respuestas import RespuestaORJSON
+from ..services import metricas, perfilador
+from ..services.version_sede import etag_condicional
+from sqlalchemy import func, select, text
 import uuid
 import asyncio
 
-router = APIRouter(prefix="/tickets", tags=["Tickets"])
+router = APIRouter(prefix="/tickets", tags=["Tickets"], route_class=perfilador.RutaPerfilada)
 
 
 def get_db():
@@ -21,26 +25,37 @@ def get_db():
 # ============================================================
 # CREAR TICKET
 # ============================================================
-@router.post("/crear", response_model=schemas.TicketOut)
-def crear_ticket(data: schemas.TicketCreate, db: Session = Depends(get_db)):
-    servicio = db.query(models.Servicio).filter(models.Servicio.id == data.servicio_id).first()
-    if not servicio:
-        raise HTTPException(status_code=404, detail="Servicio no encontrado")
-
-    hoy = datetime.now().date()
-    ultima_fecha = None
-    if servicio.ultima_generacion is not None:
-        if isinstance(servicio.ultima_generacion, datetime):
-            ultima_fecha = servicio.ultima_generacion.date()
-        elif isinstance(servicio.ultima_generacion, str):
-            ultima_fecha = datetime.fromisoformat(servicio.ultima_generacion).date()
-
-    if ultima_fecha is None or ultima_fecha != hoy:
-        servicio.contador_actual = servicio.rango_inicio
-        servicio.ultima_generacion = hoy.isoformat()
+# Numeración e inserción en una sola sentencia: el lock de la fila del
+# servicio dura solo lo que dura esta sentencia, no varios round-trips.
+# `n` es el número que le toca a este ticket (reiniciado si cambió el día);
+# el contador queda en n + 1, o vuelve a rango_inicio al pasar rango_fin.
+_CREAR_TICKET = text("""
+    WITH actual AS (
+        SELECT id, nombre, identificador_letra, rango_inicio, rango_fin,
+               CASE WHEN ultima_generacion IS NULL OR ultima_generacion::date <> :hoy
+                    THEN rango_inicio ELSE contador_actual END AS n,
+               (ultima_generacion IS NULL OR ultima_generacion::date <> :hoy) AS reinicio
+        FROM servicios
+        WHERE id = :servicio_id
+        FOR UPDATE
+    ), servicio AS (
+        UPDATE servicios s
+        SET contador_actual   = CASE WHEN a.n + 1 > a.rango_fin THEN a.rango_inicio ELSE a.n + 1 END,
+            ultima_generacion = CASE WHEN a.reinicio THEN CAST(:hoy AS TIMESTAMP) ELSE s.ultima_generacion END
+        FROM actual a
+        WHERE s.id = a.id
+        RETURNING a.nombre, a.identificador_letra, a.n
+    )
+    INSERT INTO tickets (id, codigo, servicio_id, notas, estado, sede_id, cliente_id, tipo, sala_video_url)
+    SELECT :id, servicio.identificador_letra || '-' || servicio.n, :servicio_id, :notas,
+           'pendiente', :sede_id, :cliente_id, :tipo, :sala_video_url
+    FROM servicio
+    RETURNING *, (SELECT nombre FROM servicio) AS servicio_nombre
+""")
 
-    codigo = f"{servicio.identificador_letra}-{servicio.contador_actual}"
 
+@router.post("/crear", response_model=schemas.TicketOut)
+async def crear_ticket(data: schemas.TicketCreate, db: AsyncSession = Depends(get_async_db)):
     # Generar sala de video si el ticket es virtual
     ticket_id = str(uuid.uuid4())
     tipo = getattr(data, 'tipo', None) or "presencial"
@@ -48,83 +63,108 @@ def crear_ticket(data: schemas.TicketCreate, db: Session = Depends(get_db)):
     if tipo == "virtual":
         sala_video_url = f"https://meet.jit.si/nexto-{ticket_id[:10]}"
 
-    ticket = models.Ticket(
-        id=ticket_id,
-        codigo=codigo,
-        servicio_id=data.servicio_id,
-        notas=data.notas,
-        estado="pendiente",
-        sede_id=data.sede_id,
-        cliente_id=getattr(data, 'cliente_id', None),
-        tipo=tipo,
-        sala_video_url=sala_video_url,
-    )
+    row = (await db.execute(_CREAR_TICKET, {
+        "id": ticket_id,
+        "hoy": datetime.now().date(),
+        "servicio_id": data.servicio_id,
+        "notas": data.notas,
+        "sede_id": data.sede_id,
+        "cliente_id": getattr(data, 'cliente_id', None),
+        "tipo": tipo,
+        "sala_video_url": sala_video_url,
+    })).mappings().first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Servicio no encontrado")
+    await db.commit()
 
-    servicio.contador_actual += 1
-    if servicio.contador_actual > servicio.rango_fin:
-        servicio.contador_actual = servicio.rango_inicio
+    data_out = dict(row)
+    data_out["puesto_nombre"] = row["puesto_nombre"] or ""
+    return data_out
 
-    db.add(ticket)
-    db.commit()
-    db.refresh(ticket)
 
-    data_out = ticket.__dict__.copy()
-    data_out["servicio_nombre"] = servicio.nombre
-    data_out["puesto_nombre"] = ticket.puesto_nombre or ""
-    return data_out
+# ============================================================
+# LISTADOS: proyección explícita de las columnas de TicketOut.
+# Filas planas en vez de instancias ORM (sin identity map ni
+# _sa_instance_state) y JSON con orjson sin re-validar cada fila.
+# ============================================================
+_TICKET_COLUMNAS = (
+    models.Ticket.id,
+    models.Ticket.codigo,
+    models.Ticket.servicio_id,
+    models.Ticket.sede_id,
+    models.Ticket.notas,
+    models.Ticket.estado,
+    models.Ticket.hora_creacion,
+    models.Ticket.hora_llamado,
+    models.Ticket.hora_cierre,
+    models.Ticket.cliente_id,
+    models.Ticket.cita_id,
+    models.Ticket.puesto_nombre,
+    models.Ticket.tipo,
+    models.Ticket.sala_video_url,
+    models.Servicio.nombre.label("servicio_nombre"),
+)
+
+
+def _ticket_fila(row) -> dict:
+    """Claves y orden de schemas.TicketOut."""
+    return {
+        "servicio_id": row.servicio_id,
+        "notas": row.notas,
+        "sede_id": row.sede_id,
+        "tipo": row.tipo,
+        "sala_video_url": row.sala_video_url,
+        "id": row.id,
+        "codigo": row.codigo,
+        "estado": row.estado,
+        "hora_creacion": row.hora_creacion,
+        "hora_llamado": row.hora_llamado,
+        "hora_cierre": row.hora_cierre,
+        "servicio_nombre": row.servicio_nombre,
+        "cliente_id": row.cliente_id,
+        "cita_id": row.cita_id,
+        "puesto_nombre": row.puesto_nombre or "",
+    }
 
 
 # ============================================================
 # OBTENER TICKETS POR SEDE
 # ============================================================
 @router.get("/sede/{sede_id}", response_model=list[schemas.TicketOut])
-def get_tickets_sede(sede_id: str, db: Session = Depends(get_db)):
-    rows = (
-        db.query(models.Ticket, models.Servicio.nombre.label("servicio_nombre"))
+def get_tickets_sede(
+    sede_id: str,
+    db: Session = Depends(get_read_db),
+    cache: dict = Depends(etag_condicional(get_read_db)),
+):
+    rows = db.execute(
+        select(*_TICKET_COLUMNAS)
         .join(models.Servicio, models.Ticket.servicio_id == models.Servicio.id)
-        .filter(models.Ticket.sede_id == sede_id)
+        .where(models.Ticket.sede_id == sede_id)
         .order_by(models.Ticket.hora_creacion.asc())
-        .all()
-    )
-    # Cargar nombres de clientes
-    cliente_ids = list(set(t.cliente_id for t, _ in rows if t.cliente_id))
-    clientes_map = {}
-    if cliente_ids:
-        clientes = db.query(models.Cliente).filter(models.Cliente.id.in_(cliente_ids)).all()
-        clientes_map = {c.id: f"{c.nombre} {getattr(c, 'apellido', '') or ''}".strip() for c in clientes}
-
-    resultado = []
-    for ticket, servicio_nombre in rows:
-        data = ticket.__dict__.copy()
-        data["servicio_nombre"] = servicio_nombre
-        data["puesto_nombre"] = ticket.puesto_nombre or ""
-        data["cliente_nombre"] = clientes_map.get(ticket.cliente_id, "") if ticket.cliente_id else ""
-        resultado.append(data)
-    return resultado
+    ).all()
+    return RespuestaORJSON([_ticket_fila(row) for row in rows], headers=cache)
 
 
 # ============================================================
 # OBTENER TICKETS POR ESTADO
 # ============================================================
 @router.get("/sede/{sede_id}/estado/{estado}", response_model=list[schemas.TicketOut])
-def get_tickets_estado(sede_id: str, estado: str, db: Session = Depends(get_db)):
-    rows = (
-        db.query(models.Ticket, models.Servicio.nombre.label("servicio_nombre"))
+def get_tickets_estado(
+    sede_id: str,
+    estado: str,
+    db: Session = Depends(get_db),
+    cache: dict = Depends(etag_condicional(get_db)),
+):
+    rows = db.execute(
+        select(*_TICKET_COLUMNAS)
         .join(models.Servicio, models.Ticket.servicio_id == models.Servicio.id)
-        .filter(
+        .where(
             models.Ticket.sede_id == sede_id,
             models.Ticket.estado == estado,
         )
         .order_by(models.Ticket.hora_creacion.asc())
-        .all()
-    )
-    resultado = []
-    for ticket, servicio_nombre in rows:
-        data = ticket.__dict__.copy()
-        data["servicio_nombre"] = servicio_nombre
-        data["puesto_nombre"] = ticket.puesto_nombre or ""
-        resultado.append(data)
-    return resultado
+    ).all()
+    return RespuestaORJSON([_ticket_fila(row) for row in rows], headers=cache)
 
 
 # ============================================================
@@ -157,12 +197,12 @@ def get_ticket(ticket_id: str, db: Session = Depends(get_db)):
 # LLAMAR TICKET
 # ============================================================
 @router.put("/llamar/{ticket_id}", response_model=schemas.TicketOut)
-def llamar_ticket(
+async def llamar_ticket(
     ticket_id: str,
     puesto_nombre: str = Body(..., embed=True),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
+    ticket = await db.get(models.Ticket, ticket_id)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
     if not puesto_nombre:
@@ -172,10 +212,10 @@ def llamar_ticket(
     ticket.hora_llamado = datetime.now()
     ticket.puesto_nombre = puesto_nombre
 
-    db.commit()
-    db.refresh(ticket)
+    await db.commit()
+    await db.refresh(ticket)
 
-    servicio = db.query(models.Servicio).filter(models.Servicio.id == ticket.servicio_id).first()
+    servicio = await db.get(models.Servicio, ticket.servicio_id)
     data = ticket.__dict__.copy()
     data["servicio_nombre"] = servicio.nombre
     data["puesto_nombre"] = ticket.puesto_nombre or ""
@@ -186,18 +226,18 @@ def llamar_ticket(
 # CERRAR TICKET
 # ============================================================
 @router.put("/cerrar/{ticket_id}", response_model=schemas.TicketOut)
-def cerrar_ticket(ticket_id: str, db: Session = Depends(get_db)):
-    ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
+async def cerrar_ticket(ticket_id: str, db: AsyncSession = Depends(get_async_db)):
+    ticket = await db.get(models.Ticket, ticket_id)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket no encontrado")
 
     ticket.estado = "cerrado"
     ticket.hora_cierre = datetime.now()
 
-    db.commit()
-    db.refresh(ticket)
+    await db.commit()
+    await db.refresh(ticket)
 
-    servicio = db.query(models.Servicio).filter(models.Servicio.id == ticket.servicio_id).first()
+    servicio = await db.get(models.Servicio, ticket.servicio_id)
     data = ticket.__dict__.copy()
     data["servicio_nombre"] = servicio.nombre
     data["puesto_nombre"] = ticket.puesto_nombre or ""
@@ -311,40 +351,54 @@ def transferir_ticket(
 
 # ============================================================
 # WEBSOCKET: SEGUIR TICKET EN TIEMPO REAL
+# Cada sondeo usa una sesión async corta: no bloquea el event loop
+# ni retiene una conexión del pool entre sondeos.
 # ============================================================
+_TICKET_WS_QUERY = (
+    select(
+        models.Ticket.estado,
+        models.Ticket.codigo,
+        models.Ticket.puesto_nombre,
+        models.Ticket.sede_id,
+        models.Servicio.nombre.label("servicio_nombre"),
+    )
+    .join(models.Servicio, models.Ticket.servicio_id == models.Servicio.id)
+)
+
+
 @router.websocket("/ws/ticket/{ticket_id}")
 async def ticket_ws(websocket: WebSocket, ticket_id: str):
     await websocket.accept()
-    db = SessionLocal()
+    sede_metricas = None   # sede contada en /metrics mientras el socket siga abierto
     try:
         last_estado = None
         while True:
-            ticket = (
-                db.query(models.Ticket, models.Servicio.nombre.label("servicio_nombre"))
-                .join(models.Servicio, models.Ticket.servicio_id == models.Servicio.id)
-                .filter(models.Ticket.id == ticket_id)
-                .first()
-            )
+            async with AsyncSessionLocal() as db:
+                ticket = (await db.execute(
+                    _TICKET_WS_QUERY.where(models.Ticket.id == ticket_id)
+                )).first()
 
             if not ticket:
                 await websocket.send_json({"error": "Ticket no encontrado"})
                 await asyncio.sleep(2)
                 continue
 
-            ticket_obj, servicio_nombre = ticket
+            if sede_metricas is None:
+                sede_metricas = ticket.sede_id
+                metricas.ws_abierto(sede_metricas)
 
             payload = {
-                "estado": ticket_obj.estado,
-                "codigo": ticket_obj.codigo,
-                "puesto_nombre": ticket_obj.puesto_nombre or "",
-                "servicio_nombre": servicio_nombre,
+                "estado": ticket.estado,
+                "codigo": ticket.codigo,
+                "puesto_nombre": ticket.puesto_nombre or "",
+                "servicio_nombre": ticket.servicio_nombre,
             }
 
             if payload["estado"] != last_estado:
                 await websocket.send_json(payload)
                 last_estado = payload["estado"]
 
-            if ticket_obj.estado == "cerrado":
+            if ticket.estado == "cerrado":
                 await asyncio.sleep(2)
                 break
 
@@ -353,4 +407,5 @@ async def ticket_ws(websocket: WebSocket, ticket_id: str):
     except WebSocketDisconnect:
         pass
     finally:
-        db.close()
\ No newline at end of file
+        if sede_metricas is not None:
+            metricas.ws_cerrado(sede_metricas)
@@ -173,6 +173,18 @@ class UsuarioOut(UsuarioBase):
     ultima_actualizacion: Optional[datetime] = None
     model_config = ConfigDict(from_attributes=True)
 
+# ============================================================
+# BOOTSTRAP DE SEDE (configuración completa para consolas y kioscos)
+# ============================================================
+
+class SedeBootstrap(BaseModel):
+    sede: SedeOut
+    servicios: List[ServicioOut]
+    funciones: List[FuncionOut]
+    locaciones: List[LocacionOut]
+    calendarios: List[Calendario]
+    usuarios: List[UsuarioOut]
+
 # ============================================================
 # AUTH
 # ============================================================
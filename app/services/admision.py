@@ -0,0 +1,158 @@
+"""
+Control de admisión por clase de ruta.
+
+Con pool_size=5 y max_overflow=0 una ráfaga de reportes dejaba al kiosco
+esperando 30 s por una conexión hasta fallar con un timeout del pool. Aquí
+cada request HTTP entra por una clase con su propio límite de concurrencia y
+una cola acotada; si la cola está llena o la espera supera el máximo de la
+clase, se responde 503 con Retry-After en lugar de esperar al pool.
+
+  critico  crear ticket y check-in de citas (kiosco): cupos propios que el
+           resto del tráfico no puede ocupar
+  login    login de operadores y clientes, registro de clientes (bcrypt)
+  pesado   reportes, búsquedas, generación y resincronización de
+           disponibilidades
+  stats    contadores de uso de apps
+  general  el resto de las rutas que usan el pool síncrono
+
+pesado y general se reparten los cupos del pool síncrono (POOL_SIZE +
+POOL_MAX_OVERFLOW de app.database), así entre las dos nunca piden más
+conexiones de las que hay y el exceso espera en la cola de su clase. Si se
+cambian los límites por variables de entorno y la suma supera el pool, las
+requests de más esperan al pool como antes.
+
+login se dimensiona con PASSWORD_MAX_COLA: casi todo su tiempo es bcrypt en
+el pool de procesos de password_service, con la conexión ya devuelta, y no
+debe ocupar los cupos de general. critico usa el pool async y stats solo suma
+en memoria. Las demás rutas del pool async y las que no usan la base (sesión,
+logout, token de JaaS, estado de jobs) no pasan por admisión: esperan su
+conexión en el pool async o no la necesitan.
+
+Cada clase se ajusta con ADMISION_<CLASE>_LIMITE, _COLA, _ESPERA_SEGUNDOS y
+_RETRY_SEGUNDOS. ADMISION_ACTIVA=0 desactiva el middleware.
+"""
+import asyncio
+import os
+import re
+
+from fastapi.responses import JSONResponse
+
+from app import database
+from app.services import password_service
+
+ACTIVA = os.getenv("ADMISION_ACTIVA", "1").lower() not in ("0", "false", "no")
+
+
+class _Clase:
+    def __init__(self, nombre: str, limite: int, cola: int, espera: float, retry: int):
+        prefijo = f"ADMISION_{nombre.upper()}_"
+        self.nombre = nombre
+        self.limite = int(os.getenv(prefijo + "LIMITE", limite))
+        self.cola = int(os.getenv(prefijo + "COLA", cola))
+        self.espera = float(os.getenv(prefijo + "ESPERA_SEGUNDOS", espera))
+        self.retry = int(os.getenv(prefijo + "RETRY_SEGUNDOS", retry))
+        self.en_curso = 0
+        self.esperando = 0
+        self.rechazados = 0
+        self._semaforo = asyncio.Semaphore(self.limite)
+
+    async def entrar(self) -> bool:
+        if not self._semaforo.locked():
+            await self._semaforo.acquire()   # hay cupo: no espera
+        else:
+            if self.esperando >= self.cola:
+                self.rechazados += 1
+                return False
+            self.esperando += 1
+            try:
+                await asyncio.wait_for(self._semaforo.acquire(), self.espera)
+            except asyncio.TimeoutError:
+                self.rechazados += 1
+                return False
+            finally:
+                self.esperando -= 1
+        self.en_curso += 1
+        return True
+
+    def salir(self):
+        self.en_curso -= 1
+        self._semaforo.release()
+
+
+_CUPOS_POOL = database.POOL_SIZE + database.POOL_MAX_OVERFLOW
+_CUPOS_PESADO = max(1, _CUPOS_POOL * 2 // 5)
+
+CLASES = {
+    c.nombre: c for c in (
+        _Clase("critico", limite=32, cola=200, espera=10, retry=1),
+        _Clase("login", limite=password_service.PASSWORD_MAX_COLA,
+               cola=password_service.PASSWORD_MAX_COLA,
+               espera=password_service.PASSWORD_TIMEOUT_SEGUNDOS, retry=1),
+        _Clase("pesado", limite=_CUPOS_PESADO, cola=8, espera=15, retry=10),
+        _Clase("stats", limite=8, cola=100, espera=5, retry=5),
+        _Clase("general", limite=max(1, _CUPOS_POOL - _CUPOS_PESADO), cola=100, espera=10, retry=2),
+    )
+}
+
+# (método o None, patrón del path, clase o None = sin control). Gana la primera.
+_REGLAS = [
+    ("POST", r"/tickets/crear", "critico"),
+    ("PUT",  r"/citas/checkin/(qr|app)/[^/]+", "critico"),
+    ("POST", r"/auth/login|/login|/clientes/", "login"),
+    ("GET",  r"/metrics|/admin/profiles(/[^/]+)?", None),
+    ("POST", r"/admin/sync-disponibilidades", "pesado"),
+    # pool async
+    ("PUT",  r"/tickets/(llamar|cerrar)/[^/]+", None),
+    ("POST", r"/citas/agendar", None),
+    ("GET",  r"/citas/hoy/[^/]+/[^/]+", None),
+    # sin base de datos
+    ("GET",  r"/|/auth/sesion", None),
+    ("POST", r"/auth/logout|/jaas/token", None),
+    ("GET",  r"/reportes/jobs/.*", None),   # polling y descarga: solo leen disco
+    (None,   r"/reportes/.*", "pesado"),
+    ("GET",  r"/encuesta/(reporte|comentarios/buscar)", "pesado"),
+    ("POST", r"/calendarios/[^/]+/configurar-semana", "pesado"),
+    ("GET",  r"/stats/[^/]+/serie", "pesado"),
+    ("POST", r"/stats/[^/]+/[^/]+", "stats"),
+]
+_REGLAS = [(metodo, re.compile(patron), clase) for metodo, patron, clase in _REGLAS]
+
+
+def clasificar(metodo: str, path: str) -> _Clase | None:
+    for metodo_regla, patron, clase in _REGLAS:
+        if (metodo_regla is None or metodo_regla == metodo) and patron.fullmatch(path):
+            return CLASES[clase] if clase else None
+    return CLASES["general"]
+
+
+def estado() -> list:
+    """Ocupación por clase (para /metrics)."""
+    return [
+        {"clase": c.nombre, "limite": c.limite, "en_curso": c.en_curso,
+         "esperando": c.esperando, "rechazados": c.rechazados}
+        for c in CLASES.values()
+    ]
+
+
+class AdmisionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        clase = clasificar(scope["method"], scope["path"])
+        if clase is None:
+            return await self.app(scope, receive, send)
+
+        if not await clase.entrar():
+            respuesta = JSONResponse(
+                {"detail": f"Servidor ocupado, reintente en {clase.retry} s"},
+                status_code=503,
+                headers={"Retry-After": str(clase.retry)},
+            )
+            return await respuesta(scope, receive, send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            clase.salir()
@@ -0,0 +1,76 @@
+"""
+Bootstrap de sede: toda la configuración que una consola o kiosco carga al
+arrancar (sede, servicios, funciones con sus servicios, locaciones,
+calendarios y usuarios) en una sola respuesta.
+
+Se arma con carga ansiosa en un número fijo de consultas y se guarda ya
+serializado por sede junto con el ETag de su versión (ver version_sede): el
+arranque de toda la flota a las 7am arma cada sede una vez por worker y el
+resto de los pedidos solo lee la versión. Si varios pedidos de la misma sede
+llegan sin caché, uno arma y los demás esperan su resultado.
+"""
+import threading
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session, selectinload
+
+from app import models, schemas
+
+_lock = threading.Lock()
+_cache: dict = {}      # sede_id -> (etag, json bytes)
+_armando: dict = {}    # sede_id -> threading.Lock
+
+
+def _armar(db: Session, sede_id: str) -> bytes:
+    sede = (
+        db.query(models.Sede)
+        .options(
+            selectinload(models.Sede.servicios),
+            selectinload(models.Sede.funciones).selectinload(models.Funcion.servicios),
+            selectinload(models.Sede.locaciones),
+            selectinload(models.Sede.usuarios),
+        )
+        .filter(models.Sede.id == sede_id)
+        .first()
+    )
+    if not sede:
+        raise HTTPException(status_code=404, detail="Sede no encontrada")
+    calendarios = (
+        db.query(models.Calendario)
+        .filter(models.Calendario.sede_id == sede_id)
+        .order_by(models.Calendario.created_at.desc())
+        .all()
+    )
+    return schemas.SedeBootstrap(
+        sede=schemas.SedeOut.model_validate(sede),
+        servicios=[schemas.ServicioOut.model_validate(s) for s in sede.servicios],
+        funciones=[
+            schemas.FuncionOut(
+                id=f.id,
+                nombre=f.nombre,
+                descripcion=f.descripcion,
+                sede_id=f.sede_id,
+                servicios=[s.id for s in f.servicios],
+            )
+            for f in sede.funciones
+        ],
+        locaciones=[schemas.LocacionOut.model_validate(l) for l in sede.locaciones],
+        calendarios=[schemas.Calendario.model_validate(c) for c in calendarios],
+        usuarios=[schemas.UsuarioOut.model_validate(u) for u in sede.usuarios],
+    ).model_dump_json().encode()
+
+
+def obtener(db: Session, sede_id: str, etag: str) -> bytes:
+    """JSON del bootstrap para la versión `etag`, armándolo si no está en caché."""
+    entrada = _cache.get(sede_id)
+    if entrada and entrada[0] == etag:
+        return entrada[1]
+    with _lock:
+        lock_sede = _armando.setdefault(sede_id, threading.Lock())
+    with lock_sede:
+        entrada = _cache.get(sede_id)
+        if entrada and entrada[0] == etag:
+            return entrada[1]
+        contenido = _armar(db, sede_id)
+        _cache[sede_id] = (etag, contenido)
+    return contenido
@@ -0,0 +1,100 @@
+"""
+Caché en proceso del contrato activo por empresa.
+
+login, /auth/refresh, /auth/contrato y tiene_modulo consultan el contrato
+activo en cada pedido; aquí se cachea por empresa durante
+CONTRATOS_CACHE_SEGUNDOS. contrato_activo devuelve una copia: quien la
+modifique no altera la entrada compartida.
+
+La caché es por proceso: crear_contrato invalida la entrada solo en el worker
+que atendió el pedido. En los demás, y para cambios hechos directo en la base,
+desactivar o reemplazar un contrato se ve cuando vence el TTL (60 s por
+defecto).
+
+requiere_modulo no consulta la caché: lee los módulos del token de sesión,
+que se copian del contrato en login y en cada refresh. Un cambio de módulos
+llega a un usuario ya logueado con su próximo refresh, a lo sumo
+SESION_MINUTOS + CONTRATOS_CACHE_SEGUNDOS después.
+"""
+import copy
+import os
+import threading
+import time
+
+from fastapi import Depends, HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.services import sesion_service
+
+CACHE_SEGUNDOS = float(os.getenv("CONTRATOS_CACHE_SEGUNDOS", "60"))
+
+_lock = threading.Lock()
+_cache: dict = {}   # empresa_id -> (vence_ts, contrato | None)
+
+
+def _cacheado(db: Session, empresa_id: str) -> dict | None:
+    ahora = time.monotonic()
+    with _lock:
+        entrada = _cache.get(empresa_id)
+    if entrada and entrada[0] > ahora:
+        return entrada[1]
+
+    row = db.execute(text("""
+        SELECT fecha_inicio, fecha_fin, max_sedes, modulos FROM contratos
+        WHERE empresa_id = :eid AND activo = true
+        ORDER BY fecha_fin DESC LIMIT 1
+    """), {"eid": empresa_id}).mappings().fetchone()
+    contrato = None
+    if row:
+        contrato = {
+            "fecha_inicio": row["fecha_inicio"],
+            "fecha_fin": row["fecha_fin"],
+            "max_sedes": row["max_sedes"],
+            "modulos": row["modulos"] or {},
+        }
+    with _lock:
+        _cache[empresa_id] = (ahora + CACHE_SEGUNDOS, contrato)
+    return contrato
+
+
+def contrato_activo(db: Session, empresa_id: str) -> dict | None:
+    """{fecha_inicio, fecha_fin, max_sedes, modulos} del contrato activo, o None."""
+    return copy.deepcopy(_cacheado(db, empresa_id))
+
+
+def invalidar(empresa_id: str):
+    with _lock:
+        _cache.pop(empresa_id, None)
+
+
+def tiene_modulo(db: Session, empresa_id: str, modulo: str) -> bool:
+    contrato = _cacheado(db, empresa_id)
+    return bool(contrato and contrato["modulos"].get(modulo))
+
+
+def modulos_habilitados(contrato: dict | None) -> list:
+    """Nombres de los módulos con valor verdadero en `modulos` (para el token)."""
+    if not contrato:
+        return []
+    return sorted(nombre for nombre, valor in contrato["modulos"].items() if valor)
+
+
+def requiere_modulo(modulo: str):
+    """
+    Dependencia para routers: exige sesión con contrato vigente y `modulo`
+    entre los módulos del token. master_admin pasa siempre.
+
+        @router.get(..., dependencies=[Depends(requiere_modulo("encuestas"))])
+    """
+    def _verificar(claims: dict = Depends(sesion_service.usuario_actual)) -> dict:
+        if claims["rol"] == "master_admin":
+            return claims
+        if modulo not in claims.get("modulos", []):
+            raise HTTPException(
+                status_code=403,
+                detail=f"El módulo '{modulo}' no está habilitado en el contrato",
+            )
+        return claims
+
+    return _verificar
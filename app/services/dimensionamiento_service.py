@@ -0,0 +1,70 @@
+"""
+Dimensionamiento de puestos con Erlang-C.
+
+Toda la grilla (servicio × día × franja) se evalúa de una vez contra todos los
+tamaños de dotación candidatos con operaciones NumPy, sin bucles en Python.
+"""
+import numpy as np
+
+
+def erlang_c_recomendacion(
+    llegadas_hora: np.ndarray,
+    aht_min: np.ndarray,
+    meta_espera_min: np.ndarray,
+    nivel_objetivo: float = 0.8,
+    max_puestos: int = 30,
+):
+    """
+    llegadas_hora:   (S, D, H) llegadas promedio por hora en cada franja
+    aht_min:         (S,) tiempo medio de atención por servicio, en minutos
+    meta_espera_min: (S,) espera objetivo por servicio, en minutos
+    nivel_objetivo:  fracción de clientes que deben esperar <= meta (0-1)
+
+    Devuelve (puestos, nivel_servicio, espera_estimada), cada uno (S, D, H):
+      - puestos: mínimo N en 1..max_puestos que cumple el objetivo; 0 si no hay
+        llegadas; -1 si ni max_puestos alcanza.
+      - nivel_servicio: fracción esperada con espera <= meta usando `puestos`.
+      - espera_estimada: espera media (min) usando `puestos` (ASA de Erlang-C).
+    """
+    lam = np.asarray(llegadas_hora, dtype=float)
+    aht = np.asarray(aht_min, dtype=float)[:, None, None]
+    meta = np.asarray(meta_espera_min, dtype=float)[:, None, None]
+
+    # Carga ofrecida en Erlangs por celda: A = λ · AHT
+    A = lam * aht / 60.0                                      # (S, D, H)
+    A_ = np.maximum(A, 1e-12)[..., None]                      # (S, D, H, 1)
+
+    k = np.arange(max_puestos + 1, dtype=float)               # 0..K
+    log_fact = np.concatenate(([0.0], np.cumsum(np.log(k[1:]))))
+    # log(A^k / k!) para k = 0..K, normalizado por el máximo para evitar overflow
+    log_terms = k * np.log(A_) - log_fact                     # (S, D, H, K+1)
+    terms = np.exp(log_terms - log_terms.max(axis=-1, keepdims=True))
+    suma_previa = np.cumsum(terms, axis=-1) - terms           # Σ_{j<N} A^j/j!
+
+    N = k[1:]                                                 # candidatos 1..K
+    holgura = N - A_                                          # N - A
+    estable = holgura > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = terms[..., 1:] * np.where(estable, N / holgura, 0.0)
+        p_espera = np.where(estable, x / (suma_previa[..., 1:] + x), 1.0)
+        sl = np.where(
+            estable,
+            1.0 - p_espera * np.exp(-holgura * meta[..., None] / aht[..., None]),
+            0.0,
+        )
+        asa = np.where(estable, p_espera * aht[..., None] / holgura, np.inf)
+
+    cumple = sl >= nivel_objetivo                             # (S, D, H, K)
+    hay = cumple.any(axis=-1)
+    idx = cumple.argmax(axis=-1)                              # primer N que cumple
+
+    sin_demanda = lam <= 0
+    puestos = np.where(hay, idx + 1, -1)
+    puestos = np.where(sin_demanda, 0, puestos)
+
+    nivel = np.take_along_axis(sl, idx[..., None], axis=-1)[..., 0]
+    espera = np.take_along_axis(asa, idx[..., None], axis=-1)[..., 0]
+    nivel = np.where(sin_demanda, 1.0, np.where(hay, nivel, np.nan))
+    espera = np.where(sin_demanda, 0.0, np.where(hay, espera, np.nan))
+
+    return puestos, nivel, espera
@@ -0,0 +1,87 @@
+"""
+Instrumentación de SQL por request (activar con SQL_INSTRUMENTACION=1).
+
+Cuenta sentencias y tiempo de base de cada request HTTP y los devuelve en los
+headers `X-DB-Queries` y `Server-Timing` (visible en la pestaña Network del
+navegador). Si una misma sentencia se repite SQL_N1_UMBRAL veces o más dentro
+del mismo request, la loguea como posible N+1.
+
+Desactivada no se registra ni el middleware ni los listeners: costo cero.
+"""
+import os
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ACTIVO = os.getenv("SQL_INSTRUMENTACION", "").lower() in ("1", "true", "si", "sí")
+N1_UMBRAL = int(os.getenv("SQL_N1_UMBRAL", "3"))
+
+# Estadísticas del request en curso; los endpoints sync corren en el
+# threadpool con una copia del contexto, así que comparten este dict.
+_request_actual: ContextVar[dict | None] = ContextVar("sql_request_actual", default=None)
+
+
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    if _request_actual.get() is not None:
+        conn.info.setdefault("sql_inicio", []).append(time.perf_counter())
+
+
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_actual.get()
+    if stats is None:
+        return
+    inicios = conn.info.get("sql_inicio")
+    if not inicios:
+        return
+    stats["tiempo"] += time.perf_counter() - inicios.pop()
+    stats["n"] += 1
+    stats["formas"][statement] += 1
+
+
+def _reportar_n1(scope, stats: dict):
+    for sql, veces in stats["formas"].items():
+        if veces >= N1_UMBRAL:
+            forma = " ".join(sql.split())[:200]
+            print(f"[SQL N+1] {scope['method']} {scope['path']}: {veces}x {forma}")
+
+
+class InstrumentacionSQLMiddleware:
+    """Middleware ASGI puro: solo toca requests HTTP, no WebSockets."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = {"n": 0, "tiempo": 0.0, "formas": Counter()}
+        token = _request_actual.set(stats)
+
+        async def send_con_headers(message):
+            if message["type"] == "http.response.start":
+                ms = stats["tiempo"] * 1000
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(stats["n"]).encode()))
+                headers.append((
+                    b"server-timing",
+                    f'db;dur={ms:.1f};desc="{stats["n"]} queries"'.encode(),
+                ))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_con_headers)
+        finally:
+            _request_actual.reset(token)
+            _reportar_n1(scope, stats)
+
+
+def instalar(app):
+    """Registra listeners (todos los engines, sync y async) y el middleware."""
+    event.listen(Engine, "before_cursor_execute", _antes)
+    event.listen(Engine, "after_cursor_execute", _despues)
+    app.add_middleware(InstrumentacionSQLMiddleware)
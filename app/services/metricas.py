@@ -0,0 +1,273 @@
+"""
+Métricas en formato de texto de Prometheus (GET /metrics).
+
+Sin agentes ni dependencias externas: un middleware ASGI mide latencia por
+ruta y requests en curso, cada pool de SQLAlchemy mide su espera de checkout,
+y el resto (sockets de tickets, cola de tickets, jobs de fondo) se lee al
+momento del scrape.
+"""
+import bisect
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app import database
+from app.services import admision, reportes_jobs_service, stats_service
+
+BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_POOL = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5, 10, 30)
+
+
+class _Histograma:
+    def __init__(self, nombre: str, ayuda: str, labels: tuple, buckets: tuple):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series: dict = {}   # valores de labels -> [conteo por bucket..., +Inf, suma]
+
+    def observar(self, valores: tuple, segundos: float):
+        i = bisect.bisect_left(self.buckets, segundos)
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [0] * (len(self.buckets) + 1) + [0.0]
+            serie[i] += 1
+            serie[-1] += segundos
+
+    def lineas(self) -> list:
+        out = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for valores, serie in sorted(series.items()):
+            base = _labels(self.labels, valores)
+            acumulado = 0
+            for le, n in zip(self.buckets + ("+Inf",), serie[:-1]):
+                acumulado += n
+                out.append(f"{self.nombre}_bucket{_labels(self.labels + ('le',), valores + (str(le),))} {acumulado}")
+            out.append(f"{self.nombre}_sum{base} {serie[-1]:.6f}")
+            out.append(f"{self.nombre}_count{base} {acumulado}")
+        return out
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(nombres: tuple, valores: tuple) -> str:
+    if not nombres:
+        return ""
+    return "{" + ",".join(f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)) + "}"
+
+
+def _gauge(nombre: str, ayuda: str, muestras, labels: tuple = ()) -> list:
+    """muestras: iterable de (valores_labels, valor)."""
+    out = [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge"]
+    for valores, valor in muestras:
+        out.append(f"{nombre}{_labels(labels, valores)} {valor}")
+    return out
+
+
+# ============================================================
+# HTTP: LATENCIA POR RUTA Y REQUESTS EN CURSO
+# ============================================================
+_latencia_http = _Histograma(
+    "http_request_duration_seconds", "Latencia de requests HTTP por ruta",
+    ("method", "route", "status"), BUCKETS_HTTP,
+)
+_en_curso = 0
+
+
+class MetricasMiddleware:
+    """Middleware ASGI puro. La ruta se etiqueta con su plantilla, no con el path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        global _en_curso
+        estado = [500]
+
+        async def send_con_estado(message):
+            if message["type"] == "http.response.start":
+                estado[0] = message["status"]
+            await send(message)
+
+        _en_curso += 1
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_con_estado)
+        finally:
+            _en_curso -= 1
+            ruta = scope.get("route")
+            _latencia_http.observar(
+                (scope["method"], ruta.path if ruta else "sin_ruta", str(estado[0])),
+                time.perf_counter() - t0,
+            )
+
+
+# ============================================================
+# POOLS DE CONEXIONES
+# ============================================================
+_espera_pool = _Histograma(
+    "db_pool_checkout_seconds", "Espera para obtener una conexión del pool",
+    ("pool",), BUCKETS_POOL,
+)
+_timeouts_pool: dict = defaultdict(int)
+_engines: dict = {}   # nombre -> engine
+_nombres: dict = {}   # engine -> nombre (el sync_engine en el caso async)
+
+
+def instrumentar_pool(engine, nombre: str):
+    _engines[nombre] = engine
+    _nombres[engine] = nombre
+
+
+# La espera de checkout se mide con eventos públicos de Session: la sesión
+# crea su transacción raíz y recién después pide conexión al pool (en la
+# práctica, en la primera consulta); after_begin llega con la conexión ya
+# obtenida. Si la transacción termina sin conexión tras esperar al menos el
+# timeout del pool, el checkout venció.
+def _transaccion_creada(session, transaccion):
+    if transaccion.parent is None:
+        session.info["checkout_t0"] = time.perf_counter()
+
+
+def _conexion_obtenida(session, transaccion, conexion):
+    t0 = session.info.pop("checkout_t0", None)
+    nombre = _nombres.get(conexion.engine)
+    if t0 is not None and nombre:
+        _espera_pool.observar((nombre,), time.perf_counter() - t0)
+
+
+def _transaccion_terminada(session, transaccion):
+    if transaccion.parent is not None:
+        return
+    t0 = session.info.pop("checkout_t0", None)
+    if t0 is None:
+        return
+    engine = session.get_bind()
+    nombre = _nombres.get(engine)
+    timeout = getattr(engine.pool, "timeout", None)
+    espera = time.perf_counter() - t0
+    if nombre and callable(timeout) and espera >= timeout():
+        _timeouts_pool[nombre] += 1
+        _espera_pool.observar((nombre,), espera)
+
+
+def _lineas_pools() -> list:
+    pools = [(nombre, engine.pool) for nombre, engine in _engines.items()]
+    return (
+        _gauge("db_pool_size", "Tamaño configurado del pool",
+               (((n,), p.size()) for n, p in pools), ("pool",))
+        + _gauge("db_pool_checked_out", "Conexiones prestadas",
+                 (((n,), p.checkedout()) for n, p in pools), ("pool",))
+        + _gauge("db_pool_overflow", "Conexiones por encima de pool_size",
+                 (((n,), max(0, p.overflow())) for n, p in pools), ("pool",))
+        + [
+            "# HELP db_pool_checkout_timeouts_total Checkouts que vencieron esperando conexión",
+            "# TYPE db_pool_checkout_timeouts_total counter",
+        ]
+        + [f'db_pool_checkout_timeouts_total{{pool="{n}"}} {_timeouts_pool[n]}' for n, _ in pools]
+        + _espera_pool.lineas()
+    )
+
+
+# ============================================================
+# WEBSOCKETS DE TICKETS
+# ============================================================
+_ws_por_sede: dict = defaultdict(int)
+
+
+def ws_abierto(sede_id: str):
+    _ws_por_sede[sede_id] += 1
+
+
+def ws_cerrado(sede_id: str):
+    _ws_por_sede[sede_id] -= 1
+    if _ws_por_sede[sede_id] <= 0:
+        del _ws_por_sede[sede_id]
+
+
+# ============================================================
+# COLA DE TICKETS Y JOBS DE FONDO (se consultan en el scrape)
+# ============================================================
+# Usa el índice parcial ix_tickets_pendientes_creacion (sin él, cada scrape
+# recorre tickets completa)
+_PENDIENTES_SQL = text("""
+    SELECT sede_id, servicio_id, COUNT(*) FROM tickets
+    WHERE estado = 'pendiente' AND hora_creacion >= CURRENT_DATE
+    GROUP BY sede_id, servicio_id
+""")
+
+
+def _lineas_tickets_pendientes(db) -> list:
+    rows = db.execute(_PENDIENTES_SQL).fetchall()
+    return _gauge("tickets_pendientes", "Tickets del día en estado pendiente",
+                  (((s, sv), n) for s, sv, n in rows), ("sede_id", "servicio_id"))
+
+
+def _lineas_jobs() -> list:
+    cola = reportes_jobs_service.estado_cola()
+    ultimo = stats_service.ultimo_flush_ok
+    return (
+        _gauge("reportes_jobs_pendientes", "Jobs de reportes esperando worker", [((), cola["pendientes"])])
+        + _gauge("reportes_jobs_procesando", "Jobs de reportes en ejecución", [((), cola["procesando"])])
+        + _gauge("reportes_jobs_espera_max_seconds", "Antigüedad del job pendiente más viejo",
+                 [((), f"{cola['espera_max']:.3f}")])
+        + _gauge("stats_flush_lag_seconds", "Segundos desde el último volcado de stats exitoso",
+                 [((), f"{time.time() - ultimo:.3f}")] if ultimo else [])
+        + _gauge("stats_buffer_pendientes", "Incrementos de stats aún no volcados",
+                 [((), stats_service.total_pendiente())])
+    )
+
+
+def _lineas_admision() -> list:
+    clases = admision.estado()
+    return (
+        _gauge("admision_en_curso", "Requests admitidos en ejecución por clase",
+               (((c["clase"],), c["en_curso"]) for c in clases), ("clase",))
+        + _gauge("admision_esperando", "Requests en cola de admisión por clase",
+                 (((c["clase"],), c["esperando"]) for c in clases), ("clase",))
+        + [
+            "# HELP admision_rechazados_total Requests rechazados con 503 por clase",
+            "# TYPE admision_rechazados_total counter",
+        ]
+        + [f'admision_rechazados_total{{clase="{c["clase"]}"}} {c["rechazados"]}' for c in clases]
+    )
+
+
+def exportar(db) -> str:
+    lineas = (
+        _latencia_http.lineas()
+        + _gauge("http_requests_in_flight", "Requests HTTP en curso", [((), _en_curso)])
+        + _lineas_pools()
+        + _lineas_admision()
+        + _gauge("tickets_ws_activos", "WebSockets de seguimiento de ticket abiertos",
+                 (((s,), n) for s, n in list(_ws_por_sede.items())), ("sede_id",))
+        + _lineas_jobs()
+    )
+    try:
+        lineas += _lineas_tickets_pendientes(db)
+    except Exception as e:
+        print(f"Métricas: error consultando tickets pendientes: {e}")
+    return "\n".join(lineas) + "\n"
+
+
+def instalar(app):
+    """Registra el middleware HTTP e instrumenta los pools de todos los engines."""
+    instrumentar_pool(database.engine, "principal")
+    if database.read_engine is not None:
+        instrumentar_pool(database.read_engine, "lectura")
+    instrumentar_pool(database.async_engine.sync_engine, "async")
+    event.listen(Session, "after_transaction_create", _transaccion_creada)
+    event.listen(Session, "after_begin", _conexion_obtenida)
+    event.listen(Session, "after_transaction_end", _transaccion_terminada)
+    app.add_middleware(MetricasMiddleware)
@@ -0,0 +1,126 @@
+"""
+Hash y verificación de contraseñas (bcrypt) en un pool de procesos acotado.
+
+bcrypt es CPU puro: corrido en el threadpool compartido de FastAPI, una ráfaga
+de logins al abrir la sede deja sin hilos al resto de endpoints (crear ticket,
+check-in). Aquí el trabajo va a PASSWORD_WORKERS procesos y como mucho
+PASSWORD_MAX_COLA operaciones pueden estar en curso o en cola a la vez; el
+resto recibe 503 de inmediato. Ese límite también acota cuántos hilos del
+threadpool quedan bloqueados esperando un resultado, por eso debe ser menor
+que el tamaño del threadpool (40 por defecto).
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+from fastapi import HTTPException
+
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PASSWORD_MAX_COLA = int(os.getenv("PASSWORD_MAX_COLA", "16"))
+PASSWORD_TIMEOUT_SEGUNDOS = float(os.getenv("PASSWORD_TIMEOUT_SEGUNDOS", "10"))
+
+_lock = threading.Lock()
+_pool: ProcessPoolExecutor | None = None
+_cupos = threading.BoundedSemaphore(PASSWORD_MAX_COLA)
+
+
+# ── Trabajo en el proceso hijo ─────────────────────────────
+def _hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+
+def _verificar(plain: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(plain.encode("utf-8"), hashed.encode("utf-8"))
+    except Exception:
+        return False
+
+
+# ── Pool ───────────────────────────────────────────────────
+def _obtener_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn: el proceso padre tiene hilos (uvicorn, stats, jobs)
+            _pool = ProcessPoolExecutor(
+                max_workers=PASSWORD_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _descartar(pool: ProcessPoolExecutor):
+    """Un worker murió: descartar el pool roto, el próximo submit crea uno nuevo."""
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _enviar(fn, *args):
+    # Si el pool se rompió mientras estaba ocioso, submit falla de inmediato:
+    # se reintenta una vez con un pool nuevo
+    for _ in range(2):
+        pool = _obtener_pool()
+        try:
+            return pool, pool.submit(fn, *args)
+        except BrokenProcessPool:
+            _descartar(pool)
+    raise HTTPException(status_code=503, detail="Servicio de autenticación no disponible")
+
+
+def _ejecutar(fn, *args):
+    if not _cupos.acquire(blocking=False):
+        raise HTTPException(
+            status_code=503,
+            detail="Servicio de autenticación saturado, intente nuevamente",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        pool, futuro = _enviar(fn, *args)
+    except BaseException:
+        _cupos.release()
+        raise
+    # El cupo se libera cuando el trabajo termina de verdad, aunque el
+    # pedido ya haya respondido por timeout
+    futuro.add_done_callback(lambda _: _cupos.release())
+    try:
+        return futuro.result(timeout=PASSWORD_TIMEOUT_SEGUNDOS)
+    except FuturesTimeout:
+        raise HTTPException(
+            status_code=503,
+            detail="Tiempo de espera de autenticación agotado",
+            headers={"Retry-After": "1"},
+        )
+    except BrokenProcessPool:
+        _descartar(pool)
+        raise HTTPException(status_code=503, detail="Servicio de autenticación no disponible")
+
+
+def detener():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+# ── API ────────────────────────────────────────────────────
+def hash_password(password: str) -> str:
+    return _ejecutar(_hash, password)
+
+
+def verify_password(plain: str, hashed: str | None, permitir_plano: bool = False) -> bool:
+    """
+    Verifica `plain` contra un hash bcrypt. Con `permitir_plano`, un valor que
+    no es hash bcrypt (usuarios legacy) se compara en texto plano sin usar el pool.
+    """
+    if not hashed:
+        return False
+    if not hashed.startswith("$2"):
+        return permitir_plano and plain == hashed
+    return _ejecutar(_verificar, plain, hashed)
@@ -0,0 +1,310 @@
+"""
+Perfilador por muestreo, bajo demanda.
+
+Un request HTTP se perfila si:
+  - trae `X-Profile: 1` o `?_profile=1` con un token de master_admin, o
+  - PROFILER_UMBRAL_MS > 0 y sigue corriendo pasado ese umbral (se muestrea
+    desde ese momento hasta que termina).
+
+Mientras tanto un hilo toma cada PROFILER_INTERVALO_MS el stack de los hilos
+que están ejecutando ese request: los workers del threadpool que corren su
+endpoint sync (RutaPerfilada los registra en `_hilos` al entrar y salir del
+endpoint; los routers y la app la usan como route_class) o el event loop si está corriendo su task; si ninguno lo ejecuta, toma la cadena
+de awaits de la task, así la espera de I/O también aparece. En endpoints sync
+solo se atribuye el cuerpo del endpoint, no las dependencias sync que FastAPI
+corre en otras llamadas al threadpool. El resultado se guarda en
+formato "collapsed stacks" (flamegraph.pl, inferno, speedscope) en
+PROFILER_DIR, conservando los últimos PROFILER_MAX_ARCHIVOS.
+
+Sin disparador el costo es buscar un header y un parámetro.
+"""
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+
+from app.services import sesion_service
+
+DIR = os.getenv("PROFILER_DIR", "/tmp/perfiles")
+UMBRAL_MS = float(os.getenv("PROFILER_UMBRAL_MS", "0"))
+INTERVALO = float(os.getenv("PROFILER_INTERVALO_MS", "5")) / 1000
+MAX_ARCHIVOS = int(os.getenv("PROFILER_MAX_ARCHIVOS", "50"))
+MAX_SEGUNDOS = float(os.getenv("PROFILER_MAX_SEGUNDOS", "60"))
+
+_perfil_actual: contextvars.ContextVar = contextvars.ContextVar("perfil_actual", default=None)
+
+_lock = threading.Lock()
+_activos: set = set()
+_hilo: threading.Thread | None = None
+_hilos: dict = {}        # ident del hilo -> _Perfil cuyo endpoint sync está corriendo
+
+
+class _Perfil:
+    def __init__(self, scope, tarea):
+        self.id = f"{datetime.now():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:6]}"
+        self.metodo = scope["method"]
+        self.path = scope["path"]
+        self.tarea = tarea
+        self.bucle = asyncio.get_running_loop()
+        self.hilo_bucle = threading.get_ident()
+        self.inicio = time.perf_counter()
+        self.motivo = None
+        self.desde = None       # perf_counter al empezar a muestrear
+        self.truncado = False
+        self.muestras = Counter()
+
+
+# ============================================================
+# MUESTREO
+# ============================================================
+@lru_cache(maxsize=4096)
+def _archivo_corto(ruta: str) -> str:
+    return "/".join(ruta.replace("\\", "/").split("/")[-2:])
+
+
+def _etiqueta(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({_archivo_corto(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _pila_hilo(frame) -> str:
+    partes = []
+    while frame is not None:
+        partes.append(_etiqueta(frame))
+        frame = frame.f_back
+    return ";".join(reversed(partes))
+
+
+def _pila_tarea(tarea) -> str | None:
+    """Cadena de awaits de una task suspendida, de afuera hacia adentro."""
+    partes = []
+    coro = tarea.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        partes.append(_etiqueta(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    if not partes:
+        return None
+    return ";".join(partes) + ";(esperando)"
+
+
+def _muestrear(perfil: _Perfil, frames: dict):
+    encontrado = False
+    for tid, dueño in list(_hilos.items()):
+        if dueño is perfil and tid in frames:
+            perfil.muestras[_pila_hilo(frames[tid])] += 1
+            encontrado = True
+    if encontrado or perfil.tarea is None or perfil.tarea.done():
+        return
+    if asyncio.current_task(perfil.bucle) is perfil.tarea:
+        pila = _pila_hilo(frames.get(perfil.hilo_bucle))   # el loop corre la task
+    else:
+        pila = _pila_tarea(perfil.tarea)
+    if pila:
+        perfil.muestras[pila] += 1
+
+
+def _bucle():
+    global _hilo
+    while True:
+        with _lock:
+            if not _activos:
+                _hilo = None
+                return
+            activos = list(_activos)
+        frames = sys._current_frames()
+        ahora = time.perf_counter()
+        for perfil in activos:
+            if ahora - perfil.desde > MAX_SEGUNDOS:
+                perfil.truncado = True
+                with _lock:
+                    _activos.discard(perfil)
+                continue
+            _muestrear(perfil, frames)
+        del frames
+        time.sleep(INTERVALO)
+
+
+def _activar(perfil: _Perfil, motivo: str):
+    global _hilo
+    perfil.motivo = motivo
+    perfil.desde = time.perf_counter()
+    with _lock:
+        _activos.add(perfil)
+        if _hilo is None:
+            _hilo = threading.Thread(target=_bucle, name="perfilador", daemon=True)
+            _hilo.start()
+
+
+# ============================================================
+# REGISTRO DE HILOS
+# ============================================================
+def _en_hilo(endpoint):
+    """
+    Envuelve un endpoint sync: corre en el worker del threadpool con el
+    contexto del request, así que puede leer su perfil y registrar el hilo.
+    """
+    @functools.wraps(endpoint)
+    def envuelto(*args, **kwargs):
+        perfil = _perfil_actual.get()
+        if perfil is None:
+            return endpoint(*args, **kwargs)
+        tid = threading.get_ident()
+        _hilos[tid] = perfil
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            _hilos.pop(tid, None)
+    return envuelto
+
+
+class RutaPerfilada(APIRoute):
+    """
+    route_class de los routers: envuelve los endpoints sync con _en_hilo al
+    definir la ruta. FastAPI arma las rutas incluidas con include_router a
+    partir de `endpoint`, así que también quedan envueltas.
+    """
+    def __init__(self, path: str, endpoint, **kwargs):
+        if not asyncio.iscoroutinefunction(endpoint):
+            endpoint = _en_hilo(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+# ============================================================
+# ALMACENAMIENTO
+# ============================================================
+def _ruta(perfil_id: str, extension: str) -> str:
+    return os.path.join(DIR, f"{perfil_id}.{extension}")
+
+
+def _guardar(perfil: _Perfil, duracion_ms: float, estado: int):
+    os.makedirs(DIR, exist_ok=True)
+    with open(_ruta(perfil.id, "folded"), "w") as f:
+        for pila, n in perfil.muestras.most_common():
+            f.write(f"{pila} {n}\n")
+    meta = {
+        "id": perfil.id,
+        "metodo": perfil.metodo,
+        "path": perfil.path,
+        "motivo": perfil.motivo,
+        "estado": estado,
+        "duracion_ms": round(duracion_ms, 1),
+        "muestreado_ms": round((time.perf_counter() - perfil.desde) * 1000, 1),
+        "muestras": sum(perfil.muestras.values()),
+        "intervalo_ms": INTERVALO * 1000,
+        "truncado": perfil.truncado,
+        "creado": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(_ruta(perfil.id, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    _podar()
+
+
+def _podar():
+    """Deja solo los MAX_ARCHIVOS perfiles más nuevos (el id empieza con la fecha)."""
+    ids = sorted(n[:-len(".meta.json")] for n in os.listdir(DIR) if n.endswith(".meta.json"))
+    for perfil_id in ids[:max(0, len(ids) - MAX_ARCHIVOS)]:
+        for extension in ("folded", "meta.json"):
+            try:
+                os.remove(_ruta(perfil_id, extension))
+            except FileNotFoundError:
+                pass
+
+
+def listar() -> list:
+    if not os.path.isdir(DIR):
+        return []
+    perfiles = []
+    for nombre in sorted(os.listdir(DIR), reverse=True):
+        if nombre.endswith(".meta.json"):
+            try:
+                with open(os.path.join(DIR, nombre)) as f:
+                    perfiles.append(json.load(f))
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+    return perfiles
+
+
+def ruta_archivo(perfil_id: str) -> str | None:
+    # perfil_id viene de la URL: evitar rutas fuera de DIR
+    if os.path.basename(perfil_id) != perfil_id:
+        return None
+    ruta = _ruta(perfil_id, "folded")
+    return ruta if os.path.isfile(ruta) else None
+
+
+# ============================================================
+# MIDDLEWARE
+# ============================================================
+def _pedido_por_admin(scope) -> bool:
+    """True si el request pide perfil y trae un token válido de master_admin."""
+    headers = dict(scope["headers"])
+    pedido = headers.get(b"x-profile") in (b"1", b"true") or b"_profile=1" in scope["query_string"]
+    if not pedido:
+        return False
+    auth = headers.get(b"authorization", b"").decode("latin-1")
+    if not auth.lower().startswith("bearer "):
+        return False
+    try:
+        claims = sesion_service.verificar(auth[7:].strip())
+    except HTTPException:
+        return False
+    return claims["rol"] == "master_admin"
+
+
+class PerfiladorMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        por_admin = _pedido_por_admin(scope)
+        if not por_admin and UMBRAL_MS <= 0:
+            return await self.app(scope, receive, send)
+
+        perfil = _Perfil(scope, asyncio.current_task())
+        token = _perfil_actual.set(perfil)
+        timer = None
+        if por_admin:
+            _activar(perfil, "pedido")
+        else:
+            timer = asyncio.get_running_loop().call_later(UMBRAL_MS / 1000, _activar, perfil, "umbral")
+        estado = [500]
+
+        async def send_con_id(message):
+            if message["type"] == "http.response.start":
+                estado[0] = message["status"]
+                if perfil.motivo:
+                    message = {**message, "headers": [
+                        *message.get("headers", []), (b"x-profile-id", perfil.id.encode()),
+                    ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_con_id)
+        finally:
+            if timer:
+                timer.cancel()
+            _perfil_actual.reset(token)
+            if perfil.motivo:
+                with _lock:
+                    _activos.discard(perfil)
+                duracion_ms = (time.perf_counter() - perfil.inicio) * 1000
+                try:
+                    await asyncio.to_thread(_guardar, perfil, duracion_ms, estado[0])
+                except OSError as e:
+                    print(f"Perfilador: no se pudo guardar {perfil.id}: {e}")
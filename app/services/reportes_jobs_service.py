@@ -0,0 +1,197 @@
+"""
+Jobs de reportes en segundo plano.
+
+Los reportes pesados (rangos largos, exportaciones Excel) se ejecutan en un
+pool de hilos acotado y el resultado se guarda en disco. El estado de cada job
+se persiste como <job_id>.meta.json junto al artefacto, así cualquier worker del
+mismo host puede responder el polling y la descarga.
+
+Un job que sigue pendiente o procesando pasadas REPORTES_JOBS_MAX_HORAS quedó
+huérfano (el worker que lo tenía murió o se reinició) y se marca como error.
+
+La deduplicación de pedidos idénticos es por proceso (`_en_curso` vive en
+memoria): con varios workers, el mismo reporte pedido a dos de ellos se
+genera dos veces.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from app.database import sesion_lectura
+
+JOBS_DIR = os.getenv("REPORTES_JOBS_DIR", "/tmp/reportes_jobs")
+JOBS_WORKERS = int(os.getenv("REPORTES_JOBS_WORKERS", "2"))
+JOBS_RETENCION_HORAS = float(os.getenv("REPORTES_JOBS_RETENCION_HORAS", "24"))
+JOBS_MAX_HORAS = float(os.getenv("REPORTES_JOBS_MAX_HORAS", "1"))
+
+_pool = ThreadPoolExecutor(max_workers=JOBS_WORKERS, thread_name_prefix="reportes-jobs")
+_lock = threading.Lock()
+_en_curso: dict = {}   # clave de deduplicación -> job_id
+_encolados: dict = {}  # job_id -> time.time() al encolar, hasta que un worker lo toma
+_procesando = 0
+
+
+def _ruta_meta(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.meta.json")
+
+
+def _guardar_meta(meta: dict):
+    tmp = _ruta_meta(meta["id"]) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, _ruta_meta(meta["id"]))
+
+
+def obtener_job(job_id: str) -> dict | None:
+    # job_id viene de la URL: evitar rutas fuera de JOBS_DIR
+    if os.path.basename(job_id) != job_id:
+        return None
+    try:
+        with open(_ruta_meta(job_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def ruta_artefacto(meta: dict) -> str:
+    return os.path.join(JOBS_DIR, meta["archivo"])
+
+
+def clave_job(tipo: str, params: dict) -> str:
+    canon = json.dumps({"tipo": tipo, "params": params}, sort_keys=True)
+    return hashlib.sha1(canon.encode("utf-8")).hexdigest()
+
+
+def _expirar_huerfano(meta: dict, ahora: float) -> bool:
+    """Marca como error un job pendiente/procesando demasiado viejo."""
+    with _lock:
+        propio = meta["id"] in _en_curso.values()
+    creado_ts = meta.get("creado_ts") or os.path.getmtime(_ruta_meta(meta["id"]))
+    if propio or creado_ts >= ahora - JOBS_MAX_HORAS * 3600:
+        return False
+    meta.update({
+        "estado": "error",
+        "error": "El job no terminó: el proceso que lo ejecutaba se detuvo",
+        "terminado": datetime.now().isoformat(timespec="seconds"),
+        "terminado_ts": ahora,
+    })
+    _guardar_meta(meta)
+    return True
+
+
+def purgar_vencidos():
+    """
+    Expira jobs huérfanos y elimina los terminados (meta + artefacto) más
+    viejos que la retención.
+    """
+    if not os.path.isdir(JOBS_DIR):
+        return
+    ahora = time.time()
+    limite = ahora - JOBS_RETENCION_HORAS * 3600
+    for nombre in os.listdir(JOBS_DIR):
+        if not nombre.endswith(".meta.json"):
+            continue
+        meta = obtener_job(nombre[:-len(".meta.json")])
+        if not meta:
+            continue
+        if meta["estado"] in ("pendiente", "procesando"):
+            try:
+                _expirar_huerfano(meta, ahora)
+            except FileNotFoundError:
+                pass   # otro worker lo purgó mientras tanto
+            continue
+        if meta.get("terminado_ts", 0) < limite:
+            for ruta in (_ruta_meta(meta["id"]), ruta_artefacto(meta) if meta.get("archivo") else None):
+                if ruta:
+                    try:
+                        os.remove(ruta)
+                    except FileNotFoundError:
+                        pass
+
+
+def estado_cola() -> dict:
+    """Pendientes, en ejecución y espera del pendiente más viejo (para /metrics)."""
+    with _lock:
+        ahora = time.time()
+        return {
+            "pendientes": len(_encolados),
+            "procesando": _procesando,
+            "espera_max": max((ahora - ts for ts in _encolados.values()), default=0.0),
+        }
+
+
+def encolar(tipo: str, params: dict, generar) -> dict:
+    """
+    Encola `generar(db) -> (contenido: bytes, extension, media_type, nombre_descarga)`.
+    Si ya hay un job idéntico pendiente o en proceso, devuelve ese mismo job.
+    """
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    purgar_vencidos()
+
+    clave = clave_job(tipo, params)
+    with _lock:
+        existente = _en_curso.get(clave)
+        if existente:
+            meta = obtener_job(existente)
+            if meta and meta["estado"] in ("pendiente", "procesando"):
+                return meta
+
+        meta = {
+            "id": str(uuid.uuid4()),
+            "tipo": tipo,
+            "params": params,
+            "estado": "pendiente",
+            "creado": datetime.now().isoformat(timespec="seconds"),
+            "creado_ts": time.time(),
+            "terminado": None,
+            "terminado_ts": None,
+            "archivo": None,
+            "media_type": None,
+            "nombre_descarga": None,
+            "tamano": None,
+            "error": None,
+        }
+        _guardar_meta(meta)
+        _en_curso[clave] = meta["id"]
+        _encolados[meta["id"]] = time.time()
+
+    _pool.submit(_ejecutar, clave, meta, generar)
+    return dict(meta)
+
+
+def _ejecutar(clave: str, meta: dict, generar):
+    global _procesando
+    with _lock:
+        _encolados.pop(meta["id"], None)
+        _procesando += 1
+    meta["estado"] = "procesando"
+    _guardar_meta(meta)
+    db = sesion_lectura()
+    try:
+        contenido, extension, media_type, nombre_descarga = generar(db)
+        archivo = f"{meta['id']}.{extension}"
+        with open(os.path.join(JOBS_DIR, archivo), "wb") as f:
+            f.write(contenido)
+        meta.update({
+            "estado": "listo",
+            "archivo": archivo,
+            "media_type": media_type,
+            "nombre_descarga": nombre_descarga,
+            "tamano": len(contenido),
+        })
+    except Exception as e:
+        meta.update({"estado": "error", "error": str(e)})
+    finally:
+        db.close()
+        meta["terminado"] = datetime.now().isoformat(timespec="seconds")
+        meta["terminado_ts"] = time.time()
+        _guardar_meta(meta)
+        with _lock:
+            _procesando -= 1
+            if _en_curso.get(clave) == meta["id"]:
+                del _en_curso[clave]
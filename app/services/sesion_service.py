@@ -0,0 +1,144 @@
+"""
+Tokens de sesión firmados (JWT HS256) para operadores.
+
+/auth/login emite un token corto con rol, permisos, empresa/sede, vencimiento
+y módulos habilitados del contrato. `usuario_actual` lo valida en memoria (firma, exp, revocación y
+contrato) sin consultar usuarios ni contratos. /auth/refresh lo renueva hasta
+SESION_MAX_HORAS desde el login original.
+
+Los tokens duran SESION_MINUTOS (15 por defecto). La lista de revocación es
+local al proceso y solo guarda entradas hasta que los tokens afectados
+vencerían solos, así que se mantiene chica. Con varios workers un logout o un
+cambio de permisos solo se aplica en el worker que lo atendió: en los demás
+el token sigue siendo válido hasta su exp, como mucho SESION_MINUTOS.
+
+SESION_SECRET es obligatorio: todos los workers deben firmar con la misma
+clave o un token emitido por uno falla en los demás. Sin él la app arranca
+(health, kioscos y rutas públicas siguen funcionando) pero emitir o verificar
+un token responde 503.
+"""
+import os
+import threading
+import time
+import uuid
+from datetime import date
+
+import jwt
+from fastapi import Header, HTTPException
+
+SESION_SECRET = os.getenv("SESION_SECRET", "")
+SESION_MINUTOS = int(os.getenv("SESION_MINUTOS", "15"))
+SESION_MAX_HORAS = int(os.getenv("SESION_MAX_HORAS", "12"))
+ALGORITMO = "HS256"
+
+if not SESION_SECRET:
+    print("SESION_SECRET no configurado: login y rutas con sesión responderán 503")
+
+
+def _secreto() -> str:
+    if not SESION_SECRET:
+        raise HTTPException(status_code=503, detail="Sesiones no configuradas en el servidor")
+    return SESION_SECRET
+
+
+_lock = threading.Lock()
+_revocados_jti: dict = {}       # jti -> exp
+_revocados_usuario: dict = {}   # usuario_id -> instante de revocación (tokens con iat < se rechazan)
+
+
+def emitir_token(
+    usuario: dict,
+    contrato_fin: date | None = None,
+    orig_iat: int | None = None,
+    modulos: list | None = None,
+) -> tuple[str, int]:
+    """Devuelve (token, exp). `usuario` trae las claves de UsuarioLoginOut."""
+    # iat con fracción de segundo (RFC 7519 lo permite): un token emitido justo
+    # después de revocar_usuario, en el mismo segundo, sigue siendo válido
+    now = time.time()
+    exp = int(now) + SESION_MINUTOS * 60
+    payload = {
+        "sub": usuario["id"],
+        "username": usuario["username"],
+        "rol": usuario["rol"],
+        "perfil": usuario["perfil"],
+        "puede_crear": bool(usuario["puede_crear"]),
+        "puede_editar": bool(usuario["puede_editar"]),
+        "puede_borrar": bool(usuario["puede_borrar"]),
+        "empresa_id": usuario.get("empresa_id"),
+        "sede_id": usuario.get("sede_id"),
+        "contrato_fin": contrato_fin.isoformat() if contrato_fin else None,
+        "modulos": list(modulos or []),
+        "jti": uuid.uuid4().hex,
+        "iat": now,
+        "exp": exp,
+        "orig_iat": orig_iat or now,
+    }
+    return jwt.encode(payload, _secreto(), algorithm=ALGORITMO), exp
+
+
+def _purgar(now: float):
+    for jti, exp in list(_revocados_jti.items()):
+        if exp < now:
+            del _revocados_jti[jti]
+    for uid, ts in list(_revocados_usuario.items()):
+        if ts + SESION_MINUTOS * 60 < now:
+            del _revocados_usuario[uid]
+
+
+def revocar(claims: dict):
+    with _lock:
+        _purgar(time.time())
+        _revocados_jti[claims["jti"]] = claims["exp"]
+
+
+def revocar_usuario(usuario_id: str):
+    """Invalida todos los tokens ya emitidos para el usuario (p. ej. cambio de permisos)."""
+    with _lock:
+        _purgar(time.time())
+        _revocados_usuario[usuario_id] = time.time()
+
+
+def verificar(token: str) -> dict:
+    try:
+        claims = jwt.decode(token, _secreto(), algorithms=[ALGORITMO])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Sesión expirada")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Token inválido")
+
+    with _lock:
+        revocado = (
+            claims["jti"] in _revocados_jti
+            or claims["iat"] < _revocados_usuario.get(claims["sub"], -1)
+        )
+    if revocado:
+        raise HTTPException(status_code=401, detail="Sesión revocada")
+    return claims
+
+
+def _token_de_header(authorization: str | None) -> str:
+    if not authorization or not authorization.lower().startswith("bearer "):
+        raise HTTPException(
+            status_code=401,
+            detail="Falta token de sesión",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return authorization[7:].strip()
+
+
+def sesion_actual(authorization: str | None = Header(None)) -> dict:
+    """Dependencia: claims del token, aunque el contrato esté vencido."""
+    return verificar(_token_de_header(authorization))
+
+
+def usuario_actual(authorization: str | None = Header(None)) -> dict:
+    """Dependencia: claims del token con contrato vigente (o master_admin)."""
+    claims = verificar(_token_de_header(authorization))
+    fin = claims.get("contrato_fin")
+    if claims["rol"] != "master_admin" and fin and date.fromisoformat(fin) < date.today():
+        raise HTTPException(
+            status_code=403,
+            detail="Contrato vencido. Por favor contacte al administrador de NEXTO."
+        )
+    return claims
@@ -0,0 +1,226 @@
+"""
+Buffer en memoria para los contadores de uso de apps (/stats).
+
+Cada POST /stats/{sede_id}/{app_type} solo suma en un dict; un hilo de fondo
+vuelca los incrementos acumulados cada STATS_FLUSH_SEGUNDOS con un único
+INSERT ... ON CONFLICT multi-fila. Al apagar el servidor se hace un último
+volcado.
+
+Además del total en app_stats, cada volcado alimenta app_stats_bucket con
+buckets por hora. El mantenimiento compacta las horas más viejas que
+STATS_RETENCION_HORAS_DIAS en un bucket diario y borra los días más viejos
+que STATS_RETENCION_DIAS, así la tabla no crece sin límite.
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app.database import SessionLocal
+
+FLUSH_SEGUNDOS = float(os.getenv("STATS_FLUSH_SEGUNDOS", "10"))
+RETENCION_HORAS_DIAS = int(os.getenv("STATS_RETENCION_HORAS_DIAS", "14"))
+RETENCION_DIAS = int(os.getenv("STATS_RETENCION_DIAS", "400"))
+MANTENIMIENTO_SEGUNDOS = 3600
+
+_lock = threading.Lock()
+_pendientes: dict = {}   # (sede_id, app_type, hora) -> incrementos aún no volcados
+_pendiente_total: dict = {}  # (sede_id, app_type) -> suma de _pendientes por clave
+_en_vuelo: dict = {}     # (sede_id, app_type) -> incrementos del volcado en curso
+_base: dict = {}         # (sede_id, app_type) -> último contador conocido en BD
+_ultimo_mantenimiento = 0.0
+ultimo_flush_ok = 0.0    # time.time() del último volcado sin error (para /metrics)
+_detener = threading.Event()
+_hilo: threading.Thread | None = None
+
+_UPSERT = text("""
+    INSERT INTO app_stats (sede_id, app_type, contador, updated_at)
+    SELECT sede_id, app_type, incremento, NOW()
+    FROM jsonb_to_recordset(CAST(:filas AS JSONB))
+         AS r(sede_id VARCHAR, app_type VARCHAR, incremento INTEGER)
+    ON CONFLICT (sede_id, app_type)
+    DO UPDATE SET contador = app_stats.contador + EXCLUDED.contador,
+                  updated_at = NOW()
+    RETURNING sede_id, app_type, contador
+""")
+
+_UPSERT_BUCKETS = text("""
+    INSERT INTO app_stats_bucket (sede_id, granularidad, inicio, app_type, contador)
+    SELECT sede_id, 'hora', hora, app_type, incremento
+    FROM jsonb_to_recordset(CAST(:filas AS JSONB))
+         AS r(sede_id VARCHAR, app_type VARCHAR, hora TIMESTAMP, incremento INTEGER)
+    ON CONFLICT (sede_id, granularidad, inicio, app_type)
+    DO UPDATE SET contador = app_stats_bucket.contador + EXCLUDED.contador
+""")
+
+# Mueve las horas vencidas a su bucket diario en una sola sentencia
+_COMPACTAR_HORAS = text("""
+    WITH movidas AS (
+        DELETE FROM app_stats_bucket
+        WHERE granularidad = 'hora'
+          AND inicio < date_trunc('day', NOW()) - make_interval(days => :dias)
+        RETURNING sede_id, inicio, app_type, contador
+    )
+    INSERT INTO app_stats_bucket (sede_id, granularidad, inicio, app_type, contador)
+    SELECT sede_id, 'dia', date_trunc('day', inicio), app_type, SUM(contador)
+    FROM movidas
+    GROUP BY sede_id, date_trunc('day', inicio), app_type
+    ON CONFLICT (sede_id, granularidad, inicio, app_type)
+    DO UPDATE SET contador = app_stats_bucket.contador + EXCLUDED.contador
+""")
+
+_PURGAR_DIAS = text("""
+    DELETE FROM app_stats_bucket
+    WHERE granularidad = 'dia'
+      AND inicio < date_trunc('day', NOW()) - make_interval(days => :dias)
+""")
+
+
+def incrementar(sede_id: str, app_type: str) -> int:
+    """Suma 1 en memoria y devuelve el valor acumulado (BD + pendiente)."""
+    clave = (sede_id, app_type)
+    hora = datetime.now().replace(minute=0, second=0, microsecond=0)
+    with _lock:
+        _pendientes[clave + (hora,)] = _pendientes.get(clave + (hora,), 0) + 1
+        _pendiente_total[clave] = _pendiente_total.get(clave, 0) + 1
+        return _base.get(clave, 0) + _en_vuelo.get(clave, 0) + _pendiente_total[clave]
+
+
+def contadores_de_sede(sede_id: str, en_bd: dict) -> dict:
+    """
+    Contadores de la sede por app_type con la misma base que incrementar():
+    el mayor entre `en_bd` (leído de app_stats antes de llamar) y el último
+    valor volcado por este proceso, más el lote en vuelo y lo pendiente.
+    """
+    with _lock:
+        apps = set(en_bd)
+        for claves in (_base, _en_vuelo, _pendiente_total):
+            apps.update(app for sid, app in claves if sid == sede_id)
+        return {
+            app: max(en_bd.get(app, 0), _base.get((sede_id, app), 0))
+            + _en_vuelo.get((sede_id, app), 0)
+            + _pendiente_total.get((sede_id, app), 0)
+            for app in apps
+        }
+
+
+def total_pendiente() -> int:
+    with _lock:
+        return sum(_pendiente_total.values()) + sum(_en_vuelo.values())
+
+
+def flush():
+    """Vuelca los incrementos pendientes en una sola sentencia."""
+    global ultimo_flush_ok
+    with _lock:
+        lote = dict(_pendientes)
+        totales = dict(_pendiente_total)
+        _pendientes.clear()
+        _pendiente_total.clear()
+        # Hasta actualizar _base, incrementar() sigue sumando el lote en vuelo
+        for clave, n in totales.items():
+            _en_vuelo[clave] = _en_vuelo.get(clave, 0) + n
+    if not lote:
+        ultimo_flush_ok = time.time()
+        return 0
+
+    filas = [{"sede_id": s, "app_type": a, "incremento": n} for (s, a), n in totales.items()]
+    filas_hora = [
+        {"sede_id": s, "app_type": a, "hora": h.isoformat(), "incremento": n}
+        for (s, a, h), n in lote.items()
+    ]
+    db = SessionLocal()
+    try:
+        rows = db.execute(_UPSERT, {"filas": json.dumps(filas)}).fetchall()
+        db.execute(_UPSERT_BUCKETS, {"filas": json.dumps(filas_hora)})
+        # Commit y paso del lote de _en_vuelo a _base con _lock tomado: quien
+        # lea app_stats y después contadores_de_sede ve el lote en uno de los
+        # dos lados, nunca en ninguno ni en ambos
+        with _lock:
+            db.commit()
+            for sede_id, app_type, contador in rows:
+                _base[(sede_id, app_type)] = contador
+            _sacar_en_vuelo(totales)
+    except Exception as e:
+        db.rollback()
+        # Devolver los incrementos al buffer para el próximo intento
+        with _lock:
+            for clave, n in lote.items():
+                _pendientes[clave] = _pendientes.get(clave, 0) + n
+            for clave, n in totales.items():
+                _pendiente_total[clave] = _pendiente_total.get(clave, 0) + n
+            _sacar_en_vuelo(totales)
+        print(f"Stats flush error: {e}")
+        return 0
+    finally:
+        db.close()
+
+    ultimo_flush_ok = time.time()
+    return len(filas)
+
+
+def _sacar_en_vuelo(totales: dict):
+    """Con _lock tomado: descuenta de _en_vuelo un lote ya resuelto."""
+    for clave, n in totales.items():
+        resto = _en_vuelo.get(clave, 0) - n
+        if resto > 0:
+            _en_vuelo[clave] = resto
+        else:
+            _en_vuelo.pop(clave, None)
+
+
+def _cargar_base():
+    db = SessionLocal()
+    try:
+        rows = db.execute(text("SELECT sede_id, app_type, contador FROM app_stats")).fetchall()
+        with _lock:
+            for sede_id, app_type, contador in rows:
+                _base[(sede_id, app_type)] = contador
+    except Exception as e:
+        print(f"Stats carga inicial error: {e}")
+    finally:
+        db.close()
+
+
+def mantenimiento():
+    """Compacta horas vencidas a días y purga días fuera de retención."""
+    db = SessionLocal()
+    try:
+        db.execute(_COMPACTAR_HORAS, {"dias": RETENCION_HORAS_DIAS})
+        db.execute(_PURGAR_DIAS, {"dias": RETENCION_DIAS})
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Stats mantenimiento error: {e}")
+    finally:
+        db.close()
+
+
+def _bucle():
+    global _ultimo_mantenimiento
+    while not _detener.wait(FLUSH_SEGUNDOS):
+        flush()
+        if time.time() - _ultimo_mantenimiento >= MANTENIMIENTO_SEGUNDOS:
+            _ultimo_mantenimiento = time.time()
+            mantenimiento()
+
+
+def iniciar():
+    global _hilo, ultimo_flush_ok
+    if _hilo and _hilo.is_alive():
+        return
+    _cargar_base()
+    ultimo_flush_ok = time.time()
+    _detener.clear()
+    _hilo = threading.Thread(target=_bucle, name="stats-flush", daemon=True)
+    _hilo.start()
+
+
+def detener():
+    _detener.set()
+    if _hilo:
+        _hilo.join(timeout=FLUSH_SEGUNDOS)
+    flush()
@@ -0,0 +1,193 @@
+"""
+Versión de datos por sede y GET condicional (ETag / If-None-Match).
+
+Kioscos y pantallas consultan cada pocos segundos listas que casi nunca
+cambian. Cada sede tiene una versión en la tabla sede_version que sube con
+cualquier escritura en la sede, sus tickets, servicios, citas, funciones,
+locaciones, usuarios o en la configuración de sus calendarios. La suben
+triggers de Postgres, así que cubre todos los caminos de escritura (ORM, SQL
+crudo, asyncpg) y todos los workers ven el mismo valor.
+
+Los triggers son por sentencia y leen las filas afectadas de las transition
+tables (REFERENCING NEW/OLD TABLE): una sentencia sube una vez cada sede
+distinta que tocó, así generar o sincronizar miles de disponibilidades no
+dispara un evento por fila. Además cada sede sube una sola vez por
+transacción (la versión se hace visible recién con el commit, junto con los
+datos).
+
+La versión de una sede está repartida en PARTICIONES filas y cada
+transacción sube una al azar. El lock de esa fila dura hasta el commit: con
+una sola fila por sede todas las escrituras concurrentes de la sede (crear,
+llamar y cerrar tickets, citas) se serializaban detrás de ella
+(bench/contencion_sede.py: 16 hilos rendían lo mismo que uno). La versión es
+la suma de las particiones; como cada transacción solo suma, cualquier commit
+la cambia aunque termine después de otro que empezó más tarde. Cada
+partición nueva vale max(valor + 1, epoch en µs), así la suma no vuelve a un
+valor viejo aunque la tabla se pierda o se restaure.
+
+El endpoint lee la versión (una fila por PK) antes que sus datos y con la
+misma sesión; si coincide con If-None-Match responde 304 sin ejecutar la
+consulta principal. Leer la versión primero garantiza que los datos nunca son
+más viejos que el ETag que se entrega con ellos.
+"""
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# (tabla, columna de las filas que identifica la sede): calendario_id y
+# funcion_id se resuelven a la sede del calendario / función.
+TABLAS = [
+    ("sedes", "id"),
+    ("locaciones", "sede_id"),
+    ("usuarios", "sede_id"),
+    ("tickets", "sede_id"),
+    ("servicios", "sede_id"),
+    ("citas", "sede_id"),
+    ("funciones", "sede_id"),
+    ("funcion_servicio", "funcion_id"),
+    ("calendarios", "sede_id"),
+    ("calendario_horarios", "calendario_id"),
+    ("calendario_festivos", "calendario_id"),
+    ("calendario_bloqueos", "calendario_id"),
+    ("calendario_disponibilidades", "calendario_id"),
+    ("calendario_dias_especiales", "calendario_id"),
+]
+
+# evento -> (sufijo del trigger, transition tables que recibe)
+_EVENTOS = {
+    "INSERT": ("ins", "NEW TABLE AS nuevas"),
+    "UPDATE": ("upd", "NEW TABLE AS nuevas OLD TABLE AS viejas"),
+    "DELETE": ("del", "OLD TABLE AS viejas"),
+}
+
+
+def _existe(nombre: str, tabla: str) -> str:
+    return (f"EXISTS (SELECT 1 FROM pg_trigger "
+            f"WHERE tgname = '{nombre}' AND tgrelid = '{tabla}'::regclass)")
+
+
+def _triggers(tabla: str, columna: str) -> list:
+    # Versión anterior: un trigger de constraint diferido por fila
+    sentencias = [f"""DO $$ BEGIN
+        IF {_existe(f"sede_version_{tabla}", tabla)} THEN
+            DROP TRIGGER sede_version_{tabla} ON {tabla};
+        END IF;
+    END $$"""]
+    for evento, (sufijo, referencias) in _EVENTOS.items():
+        nombre = f"sede_version_{tabla}_{sufijo}"
+        sentencias.append(f"""DO $$ BEGIN
+            IF NOT {_existe(nombre, tabla)} THEN
+                CREATE TRIGGER {nombre} AFTER {evento} ON {tabla}
+                REFERENCING {referencias}
+                FOR EACH STATEMENT EXECUTE FUNCTION sede_version_tocar('{columna}');
+            END IF;
+        END $$""")
+    return sentencias
+
+
+PARTICIONES = 32
+
+MIGRACIONES = [
+    """CREATE TABLE IF NOT EXISTS sede_version (
+        sede_id   VARCHAR  NOT NULL,
+        particion SMALLINT NOT NULL DEFAULT 0,
+        version   BIGINT   NOT NULL,
+        PRIMARY KEY (sede_id, particion)
+    )""",
+    # Versión anterior: una fila por sede con PK (sede_id)
+    "ALTER TABLE sede_version ADD COLUMN IF NOT EXISTS particion SMALLINT NOT NULL DEFAULT 0",
+    """DO $$ BEGIN
+        IF (SELECT array_length(conkey, 1) FROM pg_constraint
+            WHERE conrelid = 'sede_version'::regclass AND contype = 'p') = 1 THEN
+            ALTER TABLE sede_version DROP CONSTRAINT sede_version_pkey,
+                ADD PRIMARY KEY (sede_id, particion);
+        END IF;
+    END $$""",
+    # SQL estático (sin EXECUTE): PL/pgSQL compila la función por tabla y
+    # cachea los planes, que importa en inserts de una fila como crear ticket
+    f"""CREATE OR REPLACE FUNCTION sede_version_tocar() RETURNS trigger AS $$
+    DECLARE
+        columna      text := TG_ARGV[0];
+        claves       varchar[] := '{{}}';
+        sedes        varchar[];
+        tocadas      text := coalesce(current_setting('sede_version.tocadas', true), '');
+        mi_particion smallint := floor(random() * {PARTICIONES});
+    BEGIN
+        IF TG_OP <> 'DELETE' THEN
+            SELECT claves || array_agg(DISTINCT to_jsonb(n)->>columna) INTO claves FROM nuevas n;
+        END IF;
+        IF TG_OP <> 'INSERT' THEN
+            SELECT claves || array_agg(DISTINCT to_jsonb(v)->>columna) INTO claves FROM viejas v;
+        END IF;
+        IF columna = 'calendario_id' THEN
+            SELECT array_agg(DISTINCT c.sede_id) INTO claves FROM calendarios c WHERE c.id = ANY(claves);
+        ELSIF columna = 'funcion_id' THEN
+            SELECT array_agg(DISTINCT f.sede_id) INTO claves FROM funciones f WHERE f.id = ANY(claves);
+        END IF;
+
+        SELECT array_agg(DISTINCT s ORDER BY s) INTO sedes
+        FROM unnest(claves) s
+        WHERE s IS NOT NULL AND position(',' || s || ',' IN tocadas) = 0;
+        IF sedes IS NULL THEN
+            RETURN NULL;
+        END IF;
+
+        INSERT INTO sede_version (sede_id, particion, version)
+        SELECT s, mi_particion, (extract(epoch FROM clock_timestamp()) * 1000000)::bigint
+        FROM unnest(sedes) s
+        ON CONFLICT (sede_id, particion) DO UPDATE
+            SET version = GREATEST(sede_version.version + 1, EXCLUDED.version);
+        PERFORM set_config('sede_version.tocadas',
+                           tocadas || ',' || array_to_string(sedes, ',,') || ',', true);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    *[sentencia for tabla, columna in TABLAS for sentencia in _triggers(tabla, columna)],
+]
+
+_VERSION_SEDE = text(
+    "SELECT COALESCE((SELECT SUM(version)::bigint FROM sede_version WHERE sede_id = :id), 0)"
+)
+_VERSION_CALENDARIO = text("""
+    SELECT COALESCE((SELECT SUM(v.version)::bigint FROM sede_version v WHERE v.sede_id = c.sede_id), 0)
+    FROM calendarios c
+    WHERE c.id = :id
+""")
+
+
+def _coincide(etag: str, if_none_match: str | None) -> bool:
+    """Comparación débil (RFC 9110 §13.1.2): se ignora el prefijo W/."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidato.strip().removeprefix("W/") == etag.removeprefix("W/")
+        for candidato in if_none_match.split(",")
+    )
+
+
+def etag_condicional(get_db, parametro: str = "sede_id"):
+    """
+    Dependencia para GETs de una sede. `parametro` es el path param con el
+    id de sede, o "calendario_id" para rutas de un calendario. `get_db` debe
+    ser el mismo que usa el endpoint: FastAPI reutiliza la sesión y la
+    versión se lee de la misma base (primaria o réplica) que los datos.
+
+    Responde 304 si If-None-Match coincide; si no, devuelve los headers de
+    caché (ya puestos en la respuesta para endpoints que devuelven datos;
+    los que devuelven un Response propio deben pasarlos).
+    """
+    consulta = _VERSION_CALENDARIO if parametro == "calendario_id" else _VERSION_SEDE
+
+    def verificar(request: Request, response: Response, db: Session = Depends(get_db)) -> dict:
+        version = db.execute(consulta, {"id": request.path_params[parametro]}).scalar()
+        if version is None:
+            return {}   # calendario inexistente: que el endpoint responda 404
+        headers = {"ETag": f'W/"{version}"', "Cache-Control": "no-cache"}
+        if _coincide(headers["ETag"], request.headers.get("if-none-match")):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return headers
+
+    return verificar
@@ -0,0 +1,78 @@
+"""
+Benchmark de carga: POST /tickets/crear y GET /citas/hoy con muchos clientes
+concurrentes. Reporta requests/s, p50/p99 y errores.
+
+Correrlo contra el servidor antes y después del cambio a endpoints async
+(mismo host, misma base). Requiere httpx (pip install httpx).
+
+    python bench/carga_tickets.py --url http://localhost:8000 \
+        --sede SEDE_ID --servicio SERVICIO_ID --cliente CLIENTE_ID \
+        --clientes 500 --pedidos 5000 --duracion 60
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+async def _cliente(http: httpx.AsyncClient, args, cola: asyncio.Queue, lat: list, errores: dict):
+    crear = {"sede_id": args.sede, "servicio_id": args.servicio}
+    hoy = f"/citas/hoy/{args.cliente}/{args.sede}"
+    while time.perf_counter() < args.fin:
+        try:
+            i = cola.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        t0 = time.perf_counter()
+        try:
+            if i % 4 == 3:
+                r = await http.get(hoy)
+            else:
+                r = await http.post("/tickets/crear", json=crear)
+            ok = r.status_code == 200
+            clave = r.status_code
+        except httpx.HTTPError as e:
+            ok, clave = False, type(e).__name__
+        lat.append((time.perf_counter() - t0) * 1000)
+        if not ok:
+            errores[clave] = errores.get(clave, 0) + 1
+
+
+def _pct(ordenadas: list, p: float) -> float:
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))]
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://localhost:8000")
+    ap.add_argument("--sede", required=True)
+    ap.add_argument("--servicio", required=True)
+    ap.add_argument("--cliente", required=True)
+    ap.add_argument("--clientes", type=int, default=500)
+    ap.add_argument("--pedidos", type=int, default=5000)
+    ap.add_argument("--duracion", type=float, default=120, help="corta a los N segundos")
+    ap.add_argument("--timeout", type=float, default=60)
+    args = ap.parse_args()
+    args.fin = time.perf_counter() + args.duracion
+
+    cola: asyncio.Queue = asyncio.Queue()
+    for i in range(args.pedidos):
+        cola.put_nowait(i)
+    lat: list = []
+    errores: dict = {}
+    limites = httpx.Limits(max_connections=args.clientes, max_keepalive_connections=args.clientes)
+    async with httpx.AsyncClient(base_url=args.url, limits=limites, timeout=args.timeout) as http:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_cliente(http, args, cola, lat, errores) for _ in range(args.clientes)))
+        dt = time.perf_counter() - t0
+
+    lat.sort()
+    print(f"clientes={args.clientes} pedidos={len(lat)} duración={dt:.1f}s")
+    print(f"req/s={len(lat) / dt:.0f}  p50={_pct(lat, 0.50):.0f}ms  "
+          f"p99={_pct(lat, 0.99):.0f}ms  max={lat[-1]:.0f}ms")
+    print("errores:", errores or "ninguno")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""
+Contención de escrituras concurrentes en una misma sede.
+
+Cada hilo abre su conexión y repite transacciones cortas sobre un ticket
+propio de la sede: UPDATE (dispara los triggers de version_sede), una pausa
+opcional que simula el resto del trabajo del endpoint antes del commit, y
+commit. Reporta transacciones por segundo y latencia p50/p99; comparar con
+--hilos 1 da el costo de serializar los commits de la sede.
+
+    DATABASE_URL=postgresql://... python bench/contencion_sede.py \
+        --sede SEDE_ID --hilos 16 --transacciones 200 --trabajo-ms 2
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from sqlalchemy import create_engine, text  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sede", required=True)
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--transacciones", type=int, default=200)
+    parser.add_argument("--trabajo-ms", type=float, default=2)
+    args = parser.parse_args()
+
+    engine = create_engine(os.environ["DATABASE_URL"], pool_size=args.hilos, max_overflow=0)
+    with engine.connect() as conn:
+        tickets = [r[0] for r in conn.execute(
+            text("SELECT id FROM tickets WHERE sede_id = :s ORDER BY id LIMIT :n"),
+            {"s": args.sede, "n": args.hilos},
+        )]
+    if len(tickets) < args.hilos:
+        sys.exit(f"La sede necesita al menos {args.hilos} tickets (uno por hilo)")
+
+    latencias = []
+    lock = threading.Lock()
+    barrera = threading.Barrier(args.hilos)
+
+    def trabajar(ticket_id):
+        propias = []
+        with engine.connect() as conn:
+            barrera.wait()
+            for _ in range(args.transacciones):
+                t0 = time.perf_counter()
+                conn.execute(text("UPDATE tickets SET notas = notas WHERE id = :id"), {"id": ticket_id})
+                if args.trabajo_ms:
+                    conn.execute(text("SELECT pg_sleep(:s)"), {"s": args.trabajo_ms / 1000})
+                conn.commit()
+                propias.append(time.perf_counter() - t0)
+        with lock:
+            latencias.extend(propias)
+
+    hilos = [threading.Thread(target=trabajar, args=(t,)) for t in tickets]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    total = time.perf_counter() - inicio
+
+    latencias.sort()
+    print(f"hilos={args.hilos} transacciones={len(latencias)} "
+          f"tps={len(latencias) / total:.0f} "
+          f"p50={statistics.median(latencias) * 1000:.1f}ms "
+          f"p99={latencias[int(len(latencias) * 0.99)] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark: tokens/s de POST /jaas/token.
+
+Compara la emisión anterior (re-normalizar el PEM y que PyJWT lo parsee y
+firme en cada llamada) contra la actual (clave parseada una vez y token
+cacheado por participante). Usa una clave RSA generada al vuelo; no hace
+falta servidor ni base.
+
+    python bench/jaas_token.py --llamadas 500 --participantes 20
+"""
+import argparse
+import os
+import sys
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+_clave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+_pem = _clave.private_bytes(
+    serialization.Encoding.PEM,
+    serialization.PrivateFormat.PKCS8,
+    serialization.NoEncryption(),
+).decode("utf-8")
+# Igual que en Render: saltos de línea escapados en la variable de entorno
+os.environ["JAAS_PRIVATE_KEY"] = _pem.replace("\n", "\\n")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import jwt as pyjwt  # noqa: E402
+from app.routers import jaas  # noqa: E402
+
+
+def emitir_anterior(req: jaas.TokenRequest):
+    now = int(time.time())
+    payload = {"aud": "jitsi", "iss": "chat", "iat": now, "exp": now + 7200,
+               "nbf": now - 10, "sub": jaas.JAAS_APP_ID, "room": "*",
+               "context": {"user": {"moderator": req.moderator, "name": req.name,
+                                    "id": req.user_id, "email": req.email}}}
+    private_key = jaas.JAAS_PRIVATE_KEY.replace("\\n", "\n")
+    return pyjwt.encode(payload, private_key, algorithm="RS256",
+                        headers={"kid": jaas.JAAS_KEY_ID})
+
+
+def medir(nombre: str, fn, pedidos: list):
+    t0 = time.perf_counter()
+    for req in pedidos:
+        fn(req)
+    dt = time.perf_counter() - t0
+    print(f"{nombre:<28} {len(pedidos) / dt:9.0f} tokens/s  ({dt * 1000 / len(pedidos):.3f} ms/token)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--llamadas", type=int, default=500)
+    ap.add_argument("--participantes", type=int, default=20)
+    args = ap.parse_args()
+
+    pedidos = [
+        jaas.TokenRequest(room=f"ticket-{i % args.participantes}", name=f"P{i % args.participantes}",
+                          user_id=f"u{i % args.participantes}", moderator=(i % 2 == 0))
+        for i in range(args.llamadas)
+    ]
+    medir("anterior (parse + firma)", emitir_anterior, pedidos)
+    jaas._tokens.clear()
+    medir("actual (clave + caché)", jaas.get_jaas_token, pedidos)
+    # Sin user_id no hay caché: solo se ahorra el parseo del PEM
+    anonimos = [r.model_copy(update={"user_id": ""}) for r in pedidos]
+    medir("actual, sin user_id", jaas.get_jaas_token, anonimos)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Micro-benchmark de los endpoints de listas de tickets y citas.
+
+Llama a la app en proceso (TestClient, sin red) para que pese solo el trabajo
+del servidor: consulta, armado de filas y serialización. Reporta mediana y p90
+por endpoint, filas y bytes de la respuesta.
+
+Con --sembrar N inserta N tickets (de hoy) y N citas (de --fecha) sintéticos
+con id "bench-..." en la sede indicada y los borra al terminar.
+
+    DATABASE_URL=postgresql://... SESION_SECRET=... python bench/listas.py \
+        --sede SEDE_ID --cliente CLIENTE_ID --fecha 2026-03-15 --sembrar 2000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+from app.database import SessionLocal  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+def sembrar(sede: str, cliente: str, fecha: str, n: int):
+    db = SessionLocal()
+    try:
+        servicios = [r[0] for r in db.execute(
+            text("SELECT id FROM servicios WHERE sede_id = :s ORDER BY id"), {"s": sede})]
+        calendario = db.execute(
+            text("SELECT id FROM calendarios WHERE sede_id = :s LIMIT 1"), {"s": sede}).scalar()
+        clientes = [r[0] for r in db.execute(text("SELECT id FROM clientes ORDER BY id LIMIT 30"))]
+        if not servicios or not calendario or not clientes:
+            sys.exit("La sede necesita servicios, un calendario y clientes para sembrar")
+
+        ahora = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+        estados = ("pendiente", "llamado", "cerrado")
+        db.execute(text("""
+            INSERT INTO tickets (id, codigo, servicio_id, sede_id, estado, hora_creacion,
+                                 hora_llamado, puesto_nombre, cliente_id, tipo)
+            VALUES (:id, :codigo, :servicio_id, :sede_id, :estado, :hora_creacion,
+                    :hora_llamado, :puesto_nombre, :cliente_id, 'presencial')
+        """), [
+            {
+                "id": f"bench-{uuid.uuid4()}", "codigo": f"B-{i}",
+                "servicio_id": servicios[i % len(servicios)], "sede_id": sede,
+                "estado": estados[i % 3],
+                "hora_creacion": ahora + timedelta(seconds=i * 10),
+                "hora_llamado": ahora + timedelta(seconds=i * 10 + 60) if i % 3 else None,
+                "puesto_nombre": f"P{i % 5}" if i % 3 else None,
+                "cliente_id": clientes[i % len(clientes)] if i % 4 else None,
+            }
+            for i in range(n)
+        ])
+        db.execute(text("""
+            INSERT INTO citas (id, cliente_id, servicio_id, sede_id, calendario_id, fecha, hora,
+                               estado, qr_token, created_at)
+            VALUES (:id, :cliente_id, :servicio_id, :sede_id, :calendario_id, :fecha, :hora,
+                    'agendada', :id, NOW())
+        """), [
+            {
+                "id": f"bench-{uuid.uuid4()}",
+                "cliente_id": cliente if i % 3 == 0 else clientes[i % len(clientes)],
+                "servicio_id": servicios[i % len(servicios)], "sede_id": sede,
+                "calendario_id": calendario, "fecha": fecha,
+                "hora": f"{8 + (i // 60) % 10:02d}:{i % 60:02d}",
+            }
+            for i in range(n)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def limpiar():
+    db = SessionLocal()
+    try:
+        db.execute(text("DELETE FROM citas WHERE id LIKE 'bench-%'"))
+        db.execute(text("DELETE FROM tickets WHERE id LIKE 'bench-%'"))
+        db.commit()
+    finally:
+        db.close()
+
+
+def medir(cliente_http: TestClient, url: str, iteraciones: int):
+    r = cliente_http.get(url)   # calentamiento
+    r.raise_for_status()
+    tiempos = []
+    for _ in range(iteraciones):
+        t0 = time.perf_counter()
+        cliente_http.get(url)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    tiempos.sort()
+    p90 = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.9))]
+    print(f"{url:<48} {len(r.json()):6d} filas {len(r.content) / 1024:8.1f} KB "
+          f"  p50={statistics.median(tiempos):7.2f} ms  p90={p90:7.2f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sede", required=True)
+    ap.add_argument("--cliente", required=True)
+    ap.add_argument("--fecha", default=date.today().isoformat())
+    ap.add_argument("--iteraciones", type=int, default=30)
+    ap.add_argument("--sembrar", type=int, default=0, help="filas sintéticas a insertar")
+    args = ap.parse_args()
+
+    if args.sembrar:
+        sembrar(args.sede, args.cliente, args.fecha, args.sembrar)
+    try:
+        with TestClient(app) as http:
+            for url in (
+                f"/tickets/sede/{args.sede}",
+                f"/tickets/sede/{args.sede}/estado/pendiente",
+                f"/citas/sede/{args.sede}/fecha/{args.fecha}",
+                f"/citas/cliente/{args.cliente}",
+                f"/citas/hoy/{args.cliente}/{args.sede}",
+            ):
+                medir(http, url, args.iteraciones)
+    finally:
+        if args.sembrar:
+            limpiar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark: latencia de POST /tickets/crear durante una ráfaga de logins.
+
+Mide la latencia de creación de tickets sola (línea base) y luego con
+--concurrencia hilos haciendo POST /login (bcrypt) sin pausa. Con el hash en
+el pool de procesos (app/services/password_service.py) la latencia de tickets
+debería mantenerse cerca de la línea base; los logins sobrantes reciben 503.
+
+Uso (servidor levantado):
+    python bench/login_storm.py --url http://localhost:8000 \
+        --sede SEDE_ID --servicio SERVICIO_ID \
+        --email cliente@ejemplo.com --password secreto
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def _post(url: str, cuerpo: dict) -> tuple[int, float]:
+    req = urllib.request.Request(
+        url, data=json.dumps(cuerpo).encode("utf-8"),
+        headers={"Content-Type": "application/json"}, method="POST",
+    )
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=30) as r:
+            r.read()
+            status = r.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 0   # timeout / conexión rechazada
+    return status, (time.perf_counter() - t0) * 1000
+
+
+def _medir_tickets(args, n: int) -> list[float]:
+    cuerpo = {"sede_id": args.sede, "servicio_id": args.servicio}
+    return [_post(f"{args.url}/tickets/crear", cuerpo)[1] for _ in range(n)]
+
+
+def _resumen(nombre: str, ms: list[float]):
+    ms = sorted(ms)
+    p95 = ms[int(len(ms) * 0.95) - 1] if len(ms) >= 20 else ms[-1]
+    print(f"{nombre:<22} n={len(ms):<5} p50={statistics.median(ms):7.1f}ms "
+          f"p95={p95:7.1f}ms max={ms[-1]:7.1f}ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://localhost:8000")
+    ap.add_argument("--sede", required=True)
+    ap.add_argument("--servicio", required=True)
+    ap.add_argument("--email", required=True)
+    ap.add_argument("--password", required=True)
+    ap.add_argument("--concurrencia", type=int, default=50)
+    ap.add_argument("--tickets", type=int, default=40)
+    args = ap.parse_args()
+
+    _resumen("tickets (base)", _medir_tickets(args, args.tickets))
+
+    detener = threading.Event()
+    estados: dict = {}
+    lock = threading.Lock()
+
+    def tormenta():
+        cuerpo = {"email": args.email, "password": args.password}
+        while not detener.is_set():
+            status, _ = _post(f"{args.url}/login", cuerpo)
+            with lock:
+                estados[status] = estados.get(status, 0) + 1
+
+    hilos = [threading.Thread(target=tormenta, daemon=True) for _ in range(args.concurrencia)]
+    for h in hilos:
+        h.start()
+    time.sleep(1)
+    try:
+        _resumen("tickets (con logins)", _medir_tickets(args, args.tickets))
+    finally:
+        detener.set()
+        for h in hilos:
+            h.join(timeout=30)
+    print("logins por status:", dict(sorted(estados.items())))
+
+
+if __name__ == "__main__":
+    main()
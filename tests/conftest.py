@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Los módulos de app leen la configuración al importarse
+os.environ.setdefault("DATABASE_URL", "postgresql://postgres:@localhost/app")
+os.environ.setdefault("SESION_SECRET", "pruebas")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,31 @@
+from app.routers.encuesta import RespuestaLoteItem, _clasificar_lote
+
+
+def _existentes():
+    return {"ticket_id": set(), "servicio_id": set(), "sede_id": {"sede-ok"}}
+
+
+def test_id_repetido_primero_invalido_despues_valido():
+    respuestas = [
+        RespuestaLoteItem(id="r1", sede_id="sede-borrada", p1_atencion=5),
+        RespuestaLoteItem(id="r1", sede_id="sede-ok", p1_atencion=5),
+    ]
+
+    resultados, validas = _clasificar_lote(respuestas, _existentes())
+
+    assert resultados[0] == {"id": "r1", "estado": "error", "detalle": "No existe: sede_id"}
+    assert resultados[1] == {"id": "r1", "estado": None}
+    assert [v["sede_id"] for v in validas] == ["sede-ok"]
+
+
+def test_id_repetido_despues_de_aceptado_es_duplicado():
+    respuestas = [
+        RespuestaLoteItem(id="r1", sede_id="sede-ok"),
+        RespuestaLoteItem(id="r1", sede_id="sede-borrada"),
+        RespuestaLoteItem(id="r1", sede_id="sede-ok"),
+    ]
+
+    resultados, validas = _clasificar_lote(respuestas, _existentes())
+
+    assert [r["estado"] for r in resultados] == [None, "duplicado", "duplicado"]
+    assert len(validas) == 1
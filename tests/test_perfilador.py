@@ -0,0 +1,37 @@
+import os
+import time
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.services import perfilador
+
+
+def _endpoint_ocupado():
+    fin = time.perf_counter() + 0.3
+    n = 0
+    while time.perf_counter() < fin:
+        n += 1
+    return {"n": n}
+
+
+def test_perfila_endpoint_sync_de_router_incluido(tmp_path, monkeypatch):
+    monkeypatch.setattr(perfilador, "DIR", str(tmp_path))
+    monkeypatch.setattr(perfilador, "UMBRAL_MS", 1.0)
+    monkeypatch.setattr(perfilador, "INTERVALO", 0.002)
+
+    router = APIRouter(prefix="/pruebas", route_class=perfilador.RutaPerfilada)
+    router.get("/ocupado")(_endpoint_ocupado)
+    app = FastAPI()
+    app.include_router(router)
+    app.add_middleware(perfilador.PerfiladorMiddleware)
+
+    with TestClient(app) as cliente:
+        respuesta = cliente.get("/pruebas/ocupado")
+
+    assert respuesta.status_code == 200
+    perfil_id = respuesta.headers["x-profile-id"]
+    with open(os.path.join(tmp_path, f"{perfil_id}.folded")) as f:
+        pilas = f.read()
+    assert "_endpoint_ocupado (tests/test_perfilador.py" in pilas
+    assert not perfilador._hilos